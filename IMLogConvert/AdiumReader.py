@@ -24,30 +24,45 @@ This module contains two classes: one to describe a IM Conversations and on
 to describe an individual Instant Message.
 """
 from IMLogConvert.Conversation import Conversation, Message, StatusMessage
-from xml.sax import make_parser, ContentHandler
+from IMLogConvert.Conversation import intern_name, expat_parse, sax_parse
 import IMLogConvert.Time
+import IMLogConvert.Stats
+import IMLogConvert.Compression
+import threading
+import re
+import os
 import sys
 
 class AdiumReader:
     """ Reader for Adium Logs  """
+    parser_version = 1
+
     def __init__(self):
         """ Initialize Reader """
         self.alias_replacements = {}
         self.service_replacements = {}
+        self.exit_on_error = True
+        self.use_expat = True
+        # if set to an IMLogConvert.Cache.ConversationCache, files are only
+        # parsed if they are not in the cache
+        self.cache = None
 
     def read(self, filename_or_stream):
         """ Fill the conversation with data from the XML in the
-            filename_or_stream
+            filename_or_stream. If the XML cannot be parsed, the program is
+            terminated, unless self.exit_on_error is False, in which case the
+            exception is raised to the caller. If self.use_expat is True (the
+            default), the XML is parsed with expat directly instead of with
+            xml.sax, for filenames and streams. Compressed files and streams
+            (gzip, bzip2, xz) are decompressed on the fly. If self.cache is
+            set, files are read from the cache if possible; the alias and
+            service replacements are applied afterwards.
         """
-        conversation = Conversation()
-        parser = make_parser()
-        parser.setContentHandler(AdiumContentHandler(conversation))
-        try:
-            parser.parse(filename_or_stream)
-        except Exception, data:
-            print >> sys.stderr, \
-            "There was a fatal error in parsing the xml file:\n%s" % data
-            sys.exit()
+        if self.cache is not None \
+        and isinstance(filename_or_stream, basestring):
+            conversation = self.cache.read(self, filename_or_stream)
+        else:
+            conversation = self.parse(filename_or_stream)
         for (account, alias) in conversation.participants.items():
             if self.alias_replacements.has_key(alias):
                 conversation.participants[account] \
@@ -57,8 +72,114 @@ class AdiumReader:
             = self.service_replacements[conversation.service]
         return conversation
 
+    def parse(self, filename_or_stream):
+        """ Parse the XML in filename_or_stream like read, but without the
+            cache, and without applying the alias and service replacements
+        """
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('adium.parse')
+        conversation = Conversation()
+        handler = AdiumContentHandler(conversation)
+        source = IMLogConvert.Compression.open_input(filename_or_stream)
+        try:
+            if self.use_expat and (isinstance(source, basestring)
+            or hasattr(source, 'read')):
+                expat_parse(handler, source)
+            else:
+                sax_parse(handler, source)
+        except Exception, data:
+            if not self.exit_on_error:
+                raise
+            print >> sys.stderr, \
+            "There was a fatal error in parsing the xml file:\n%s" % data
+            sys.exit()
+        finally:
+            if source is not filename_or_stream:
+                source.close()
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_read(conversation, filename_or_stream)
+        return conversation
+
+    def cache_key(self):
+        """ Return a string that identifies the parser, for the keys of
+            IMLogConvert.Cache.ConversationCache
+        """
+        return "AdiumReader/%i" % self.parser_version
+
+    def find_logs(self, basedir, start=None, end=None, accounts=None,
+                  contacts=None, threads=8):
+        """ Return a list of AdiumLogFile objects for the logs in the Adium
+            log directory basedir (e.g. ~/Library/Application Support/Adium
+            2.0/Users/Default/Logs), which has the layout
+            <Service>.<account>/<contact>/<contact> (<date>).chatlog/
+            <contact> (<date>).xml (or <contact> (<date>).xml directly in the
+            contact directory, for older versions of Adium). Everything is
+            taken from the names of the files and directories, without
+            opening the logs: the only file system operations are the
+            listings of the account and contact directories. The XML file in
+            a .chatlog bundle is assumed to have the name of the bundle (as
+            Adium names it), and non-directories are skipped when listing
+            them fails, so no file is stat'ed.
+            Only logs that started at start <= time < end (epoch seconds,
+            either of which may be None) are returned. If 'accounts' or
+            'contacts' is given as a list of names, only the logs of these
+            accounts or with these contacts are returned (names are compared
+            case-insensitively); the directories of other accounts and
+            contacts are not even listed. The account directories are
+            scanned by 'threads' threads in parallel, which helps when
+            listing directories is slow (e.g. on a network file system).
+            The result is sorted by service, account, contact, and time. The
+            filenames can be handed to read (or a BatchConverter).
+        """
+        if accounts is not None:
+            accounts = set([account.lower() for account in accounts])
+        if contacts is not None:
+            contacts = set([contact.lower() for contact in contacts])
+        account_dirs = []
+        for name in sorted(os.listdir(basedir)):
+            if '.' not in name:
+                continue
+            account = _decode_name(name.split('.', 1)[1])
+            if accounts is not None and account.lower() not in accounts:
+                continue
+            account_dirs.append((name, os.path.join(basedir, name)))
+        result = []
+        pending = iter(account_dirs)
+        lock = threading.Lock()
+        def scan():
+            """ Scan account directories until there are no more """
+            while True:
+                lock.acquire()
+                try:
+                    (name, path) = pending.next()
+                except StopIteration:
+                    return
+                finally:
+                    lock.release()
+                logs = _scan_account_dir(name, path, start, end, contacts)
+                lock.acquire()
+                try:
+                    result.extend(logs)
+                finally:
+                    lock.release()
+        workers = [threading.Thread(target=scan)
+                   for i in xrange(min(threads, len(account_dirs)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        result.sort(key=lambda log: (log.service, log.account, log.contact,
+                                     log.time, log.filename))
+        return result
+
 
-class AdiumContentHandler(ContentHandler):
+# elements of Adium logs that contain a message
+_message_elements = frozenset(["message", "status", "event"])
+
+class AdiumContentHandler:
     """ ContentHandler for XML Parser. Construct a Conversation from Adium Log
         XML 
     """
@@ -67,46 +188,46 @@ class AdiumContentHandler(ContentHandler):
         self.conversation = conversation
         self.open_element = ""
         self.buffer = {}
+        # text chunks of the open message, joined when the message closes
+        self.chunks = None
+        self.codec = IMLogConvert.Time.ADIUM_CODEC
     def startElement(self, name, attrs):
         """Hook for opening XML tags """
-        if name == "chat":
-            self.conversation.service = attrs.get("service", None)
-            self.conversation.account = attrs.get("account", None)
-            self.conversation.start_time = None
-            self.conversation.timezone = None
-            self.conversation.participants = {}
-            self.conversation.messages = []
-        if name in ["message", "status", "event"]:
+        if name in _message_elements:
             self.open_element = name
             time_str = attrs.get("time", None)
             self.buffer['time'] =  time_str[:-6]
             self.buffer['timezone'] = time_str[-6:-3] + time_str[-2:]
-            self.buffer['sender'] = attrs.get("sender", None)
-            self.buffer['alias'] = attrs.get("alias", None)
+            self.buffer['sender'] = intern_name(attrs.get("sender", None))
+            self.buffer['alias'] = intern_name(attrs.get("alias", None))
             self.buffer['type'] = attrs.get("type", None)
             if self.conversation.timezone is None:
                 self.conversation.timezone = self.buffer['timezone']
             if self.conversation.start_time is None:
-                self.conversation.start_time = IMLogConvert.Time.tz_strpmktime(
-                        self.buffer['time'], '%Y-%m-%dT%H:%M:%S', 
-                        self.conversation.timezone)
-        if name in ["message", "status", "event"]:
-            self.buffer['text'] = ''
-        if name == 'br':
-            self.buffer['text'] += "\n"
+                self.conversation.start_time = self.codec.parse(
+                        self.buffer['time'], self.conversation.timezone)
+            self.chunks = []
+        elif name == 'br':
+            if self.chunks is not None:
+                self.chunks.append(u"\n")
+        elif name == "chat":
+            self.conversation.service = attrs.get("service", None)
+            self.conversation.account = attrs.get("account", None)
+            self.conversation.start_time = None
+            self.conversation.timezone = None
+            self.conversation.participants = {}
+            self.conversation.messages = []
     def characters(self, content):
         """Hook for XML text data """
-        if self.open_element in ["message", "status", "event"]:
-            self.buffer['text'] += content
+        if self.chunks is not None:
+            self.chunks.append(content)
     def endElement(self, name):
         """Hook for closing XML tags """
-        if name in ["message", "status", "event"]:
-            text = self.buffer['text']
-            if text is None:
-                text = ''
-            time = IMLogConvert.Time.tz_strpmktime(
-                    self.buffer['time'], '%Y-%m-%dT%H:%M:%S', 
-                    self.buffer['timezone'])
+        if name in _message_elements:
+            text = u''.join(self.chunks)
+            self.chunks = None
+            time = self.codec.parse(self.buffer['time'],
+                                    self.buffer['timezone'])
             sender = self.buffer['sender']
             if sender is not None:
                 if self.buffer['alias'] is None:
@@ -131,3 +252,107 @@ class AdiumContentHandler(ContentHandler):
                 self.conversation.messages.append(message)
             self.open_element = ""
 
+
+class AdiumLogFile:
+    """ Log file found by AdiumReader.find_logs. The attributes are the
+        'filename', and the 'service', 'account', 'contact', 'time' (epoch
+        seconds of the start of the conversation) and 'timezone' (e.g.
+        '-0500', or '' if the name does not contain one), as given by the
+        path of the file
+    """
+    def __init__(self, filename, service, account, contact, time, timezone):
+        """ Initialize the log file description """
+        self.filename = filename
+        self.service = service
+        self.account = account
+        self.contact = contact
+        self.time = time
+        self.timezone = timezone
+
+    def __repr__(self):
+        """ Return a representation for debugging """
+        return "<AdiumLogFile %r>" % (self.filename,)
+
+
+# Name of an Adium log, without extension, like
+# 'contact (2008-01-31T16.32.45-0500)'. Logs of old versions of Adium only
+# have a date.
+_log_name_pattern = re.compile(
+    r'''^(?P<contact>.+)[ ]\(
+        (?P<date>\d{4}-\d{2}-\d{2})
+        (T(?P<time>\d{2}\.\d{2}\.\d{2}))?
+        (?P<timezone>[+-]\d{4}|Z)?
+        \)$''', re.X)
+_log_date_codec = IMLogConvert.Time.get_codec('%Y-%m-%d')
+_log_time_codec = IMLogConvert.Time.get_codec('%Y-%m-%dT%H.%M.%S')
+
+def parse_log_name(name):
+    """ Parse the name of an Adium log file or chatlog directory, like
+        'contact (2008-01-31T16.32.45-0500).xml'. Return a tuple
+        (contact, time, timezone), or None if the name is not in this format.
+    """
+    (stem, extension) = os.path.splitext(name)
+    match = _log_name_pattern.match(stem)
+    if match is None:
+        return None
+    timezone = match.group('timezone') or ''
+    if timezone == 'Z':
+        timezone = '+0000'
+    try:
+        if match.group('time') is None:
+            time = _log_date_codec.parse(match.group('date'), timezone)
+        else:
+            time = _log_time_codec.parse("%sT%s" % (match.group('date'),
+                                         match.group('time')), timezone)
+    except ValueError:
+        return None
+    return (match.group('contact'), time, timezone)
+
+def _scan_account_dir(name, path, start, end, contacts):
+    """ Return the AdiumLogFile objects for the account directory 'path'
+        named 'name' (see AdiumReader.find_logs)
+    """
+    (service, account) = name.split('.', 1)
+    service = _decode_name(service)
+    account = _decode_name(account)
+    result = []
+    for contact_name in _listdir(path):
+        if contacts is not None \
+        and _decode_name(contact_name).lower() not in contacts:
+            continue
+        contact_path = os.path.join(path, contact_name)
+        for log_name in _listdir(contact_path):
+            if log_name.endswith('.chatlog'):
+                is_bundle = True
+            elif log_name.endswith('.xml'):
+                is_bundle = False
+            else:
+                continue
+            parsed = parse_log_name(log_name)
+            if parsed is None:
+                continue
+            (contact, time, timezone) = parsed
+            if (start is not None and time < start) \
+            or (end is not None and time >= end):
+                continue
+            filename = os.path.join(contact_path, log_name)
+            if is_bundle:
+                filename = os.path.join(filename, log_name[:-8] + '.xml')
+            result.append(AdiumLogFile(filename, service, account,
+                          _decode_name(contact), time, timezone))
+    return result
+
+def _listdir(path):
+    """ Return the names in the directory 'path', or an empty list if it is
+        not a directory
+    """
+    try:
+        return os.listdir(path)
+    except OSError:
+        return []
+
+def _decode_name(name):
+    """ Return a file name as unicode """
+    if isinstance(name, unicode):
+        return name
+    return unicode(name, sys.getfilesystemencoding() or 'utf-8', 'replace')
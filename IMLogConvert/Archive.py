@@ -0,0 +1,225 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a writer and a reader for archives, single files that
+hold many conversations as compressed blocks of native XML
+"""
+from IMLogConvert.Conversation import Conversation
+from cStringIO import StringIO
+import struct
+import zlib
+import json
+import os
+
+_magic = "IMLCARC1"
+_footer_magic = "IMLCTOC1"
+# footer: offset and length of the table of contents, and _footer_magic
+_footer = struct.Struct('<QQ8s')
+
+
+class ArchiveEntry:
+    """ Entry in the table of contents of an archive: the service, account,
+        contact, start_time and timezone of a conversation, and where its XML
+        is stored: at 'offset' with 'length' bytes in the uncompressed data of
+        the block starting at 'block_offset' with 'block_length' bytes.
+    """
+    def __init__(self, service, account, contact, start_time, timezone,
+                 block_offset, block_length, offset, length):
+        """ Initialize the entry """
+        self.service = service
+        self.account = account
+        self.contact = contact
+        self.start_time = start_time
+        self.timezone = timezone
+        self.block_offset = block_offset
+        self.block_length = block_length
+        self.offset = offset
+        self.length = length
+
+    def to_list(self):
+        """ Return the entry as a list, for the stored table of contents """
+        return [self.service, self.account, self.contact, self.start_time,
+                self.timezone, self.block_offset, self.block_length,
+                self.offset, self.length]
+
+
+class ArchiveWriter:
+    """ Writer for archives. Conversations are serialized as native XML and
+        collected into blocks of about 'block_size' bytes, which are
+        compressed with zlib. The table of contents is written at the end of
+        the file when the archive is closed. When conversations are appended,
+        the new blocks and the combined table of contents are written after
+        the old table of contents, which stays in place: if the writer is
+        not closed (e.g. because the program crashed), ArchiveReader still
+        finds the old table of contents, and the archive keeps its old
+        content.
+    """
+    def __init__(self, filename, append=False, block_size=1<<20, level=6):
+        """ Create the archive 'filename', or, if 'append' is True and the
+            file exists, open it to add more conversations.
+        """
+        self.filename = filename
+        self.block_size = block_size
+        self.level = level
+        self.entries = []
+        if append and os.path.exists(filename):
+            self.fh = open(filename, 'r+b')
+            self.entries = _read_toc(self.fh, filename)
+            self.fh.seek(0, os.SEEK_END)
+        else:
+            self.fh = open(filename, 'wb')
+            self.fh.write(_magic)
+        self._block = []
+        self._block_entries = []
+        self._block_size = 0
+
+    def write(self, conversation):
+        """ Add the conversation to the archive """
+        data = conversation.to_xml()
+        self._block_entries.append(ArchiveEntry(conversation.service,
+            conversation.account, conversation.contact(), conversation.start_time,
+            conversation.timezone, None, None, self._block_size, len(data)))
+        self._block.append(data)
+        self._block_size += len(data)
+        if self._block_size >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """ Compress and write the current block """
+        if len(self._block) == 0:
+            return
+        block = zlib.compress(''.join(self._block), self.level)
+        block_offset = self.fh.tell()
+        self.fh.write(block)
+        for entry in self._block_entries:
+            entry.block_offset = block_offset
+            entry.block_length = len(block)
+        self.entries.extend(self._block_entries)
+        self._block = []
+        self._block_entries = []
+        self._block_size = 0
+
+    def close(self):
+        """ Write the last block and the table of contents, and close the
+            archive
+        """
+        self.flush()
+        toc = zlib.compress(json.dumps([entry.to_list()
+                                        for entry in self.entries]))
+        toc_offset = self.fh.tell()
+        self.fh.write(toc)
+        self.fh.write(_footer.pack(toc_offset, len(toc), _footer_magic))
+        self.fh.close()
+
+
+class ArchiveReader:
+    """ Reader for archives written by ArchiveWriter. 'entries' is the table
+        of contents, a list of ArchiveEntry objects in the order in which the
+        conversations were written.
+    """
+    def __init__(self, filename):
+        """ Open the archive 'filename' and read its table of contents """
+        self.filename = filename
+        self.fh = open(filename, 'rb')
+        if self.fh.read(len(_magic)) != _magic:
+            raise ValueError("%s is not an archive" % filename)
+        self.entries = _read_toc(self.fh, filename)
+        self._block_offset = None
+        self._block = None
+
+    def find(self, account=None, contact=None, start=None, end=None):
+        """ Return the entries of all conversations with the given account
+            and contact that started at a time with start <= time < end.
+            Any of the criteria may be None.
+        """
+        return [entry for entry in self.entries
+                if (account is None or entry.account == account)
+                and (contact is None or entry.contact == contact)
+                and (start is None or entry.start_time >= start)
+                and (end is None or entry.start_time < end)]
+
+    def read(self, entry):
+        """ Return the conversation for the given entry (an ArchiveEntry or
+            its index in self.entries)
+        """
+        if not isinstance(entry, ArchiveEntry):
+            entry = self.entries[entry]
+        if entry.block_offset != self._block_offset:
+            self.fh.seek(entry.block_offset)
+            self._block = zlib.decompress(self.fh.read(entry.block_length))
+            self._block_offset = entry.block_offset
+        conversation = Conversation()
+        conversation.from_xml(StringIO(
+            self._block[entry.offset:entry.offset + entry.length]),
+            exit_on_error=False)
+        return conversation
+
+    def __iter__(self):
+        """ Iterate over all conversations in the archive, decompressing
+            every block only once
+        """
+        for entry in self.entries:
+            yield self.read(entry)
+
+    def __len__(self):
+        """ Return the number of conversations in the archive """
+        return len(self.entries)
+
+    def close(self):
+        """ Close the archive """
+        self.fh.close()
+        self._block = None
+
+
+def _read_toc(fh, filename):
+    """ Read the footer and the table of contents of the archive in the open
+        file fh, and return the list of entries. If the file does not end
+        with a footer (because appending to it was interrupted), the last
+        complete footer before the end is used.
+    """
+    fh.seek(0, os.SEEK_END)
+    footer_end = fh.tell()
+    while footer_end is not None:
+        fh.seek(footer_end - _footer.size)
+        (toc_offset, toc_length, magic) = _footer.unpack(
+                                          fh.read(_footer.size))
+        if magic == _footer_magic \
+        and toc_offset + toc_length + _footer.size == footer_end:
+            fh.seek(toc_offset)
+            return [ArchiveEntry(*values) for values
+                    in json.loads(zlib.decompress(fh.read(toc_length)))]
+        footer_end = _find_footer(fh, footer_end - 1)
+    raise ValueError("%s is not a complete archive" % filename)
+
+def _find_footer(fh, end, blocksize=1<<16):
+    """ Return the position after the last occurrence of the footer magic
+        string that ends before position 'end' in fh, or None
+    """
+    overlap = len(_footer_magic) - 1
+    while end > len(_magic) + _footer.size:
+        start = max(len(_magic), end - blocksize)
+        fh.seek(start)
+        data = fh.read(end - start)
+        index = data.rfind(_footer_magic)
+        if index >= 0:
+            return start + index + len(_footer_magic)
+        end = start + overlap
+    return None
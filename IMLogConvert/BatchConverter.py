@@ -0,0 +1,510 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a class for converting many log files at once, spread
+over a pool of worker processes
+"""
+from IMLogConvert.Conversation import Conversation
+from IMLogConvert.Manifest import Manifest
+import IMLogConvert.Index
+import IMLogConvert.Stats
+import IMLogConvert.SeekIndex
+from cStringIO import StringIO
+import multiprocessing
+import threading
+import Queue
+import itertools
+import copy
+import os
+import time
+
+
+class BatchConverter:
+    """ Converter for a whole corpus of log files. Every input file is read
+        with 'reader' and the resulting conversation is written to
+        'output_dir' with 'writer', under the name given by
+        Conversation.filename(). The files are distributed over a pool of
+        worker processes. A file that cannot be converted is recorded in the
+        list of errors and does not stop the conversion of the other files.
+        The conversations are written to temporary files, which are renamed
+        to their final names by the current process. If two conversations
+        of the same run (or, with a Manifest, a conversation and the output
+        of another source) would get the same name, a suffix '-1', '-2', ...
+        is added to the name of the later one.
+    """
+    def __init__(self, reader=None, writer=None, output_dir='.',
+                 processes=None, chunksize=8):
+        """ Initialize the converter.
+            'reader' is an object with a read(filename) method that returns a
+            Conversation, like AdiumReader or PidginTextReader. If it is None,
+            the input is read as native XML (Conversation.from_xml).
+            'writer' is an object with a write(conversation, filename) method,
+            like PidginTextWriter. If it is None, the output is written as
+            native XML (Conversation.write_xml).
+            'processes' is the number of worker processes, defaulting to the
+            number of CPUs. With processes=1, everything is done in the
+            current process. 'chunksize' is the number of files handed to a
+            worker at a time.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.output_dir = output_dir
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.processes = processes
+        self.chunksize = chunksize
+        if writer is None:
+            self.extension = '.xml'
+        else:
+            self.extension = '.txt'
+        self.progress_stream = None
+        self.stats = None
+        # pipelined mode (see _convert_pipelined): number of threads reading
+        # files ahead, and the maximum number of files (as raw bytes) and of
+        # conversations waiting between the stages
+        self.pipeline = False
+        self.prefetch_threads = 4
+        self.read_queue_size = 16
+        self.write_queue_size = 16
+
+    def convert(self, filenames, progress=None, manifest=None, index=None):
+        """ Convert all the given files, and return a BatchResult.
+            If 'progress' is given, it is called after every file as
+            progress(done, total, filename, outfilename, error), where
+            outfilename is None and error is a string if the conversion
+            failed. If self.progress_stream is set (e.g. to sys.stderr), a
+            progress line is written to it after every file.
+            If self.stats is set to an IMLogConvert.Stats.Stats object, the
+            statistics of all conversions (from all worker processes) are
+            collected in it.
+            If a Manifest is given, only files that are new or changed
+            according to the manifest are converted, and the outputs of
+            sources that no longer exist are deleted.
+            If an IMLogConvert.Index.Index is given, every converted
+            conversation is added to it. The text is tokenized in the worker
+            processes, the index itself is written by the current process.
+            If self.pipeline is True, the files are converted in the current
+            process in a pipeline that overlaps reading, parsing and writing
+            (see _convert_pipelined), instead of in a pool of processes.
+        """
+        filenames = list(filenames)
+        skipped = []
+        if manifest is not None:
+            changed = []
+            for filename in filenames:
+                if manifest.changed(filename):
+                    changed.append(filename)
+                else:
+                    skipped.append(filename)
+            filenames = changed
+        result = BatchResult(len(filenames))
+        result.skipped = skipped
+        if self.processes == 1 or self.pipeline:
+            settings = (self.reader, self.writer, self.output_dir,
+                        self.extension, False, index is not None)
+            _init_worker(*settings)
+            enable_stats = (self.stats is not None
+                            and IMLogConvert.Stats.current is not self.stats)
+            if enable_stats:
+                self.stats.enable()
+            try:
+                if self.pipeline:
+                    results = self._convert_pipelined(filenames)
+                else:
+                    results = (_convert_file(filename)
+                               for filename in filenames)
+                try:
+                    self._collect(results, result, progress, index, manifest)
+                finally:
+                    # if _collect failed, this stops the pipeline threads
+                    results.close()
+            finally:
+                if enable_stats:
+                    self.stats.disable()
+        else:
+            settings = (self.reader, self.writer, self.output_dir,
+                        self.extension, self.stats is not None,
+                        index is not None)
+            pool = multiprocessing.Pool(self.processes, _init_worker,
+                                        settings)
+            try:
+                results = pool.imap_unordered(_convert_file, filenames,
+                                              self.chunksize)
+                self._collect(results, result, progress, index, manifest)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            pool.join()
+        if manifest is not None:
+            for (filename, outfilename) in result.converted:
+                manifest.record(filename, outfilename)
+            result.removed = manifest.remove_missing()
+        if index is not None:
+            if manifest is not None:
+                index.remove_missing()
+            index.commit()
+        result.elapsed = time.time() - result.start
+        return result
+
+    def update(self, filenames, progress=None, use_hash=False,
+               build_index=False):
+        """ Like convert, but using the manifest stored in the output
+            directory, so that only new or changed files are converted.
+            If 'build_index' is True, the full-text index stored in the
+            output directory is updated as well.
+        """
+        manifest = Manifest(os.path.join(self.output_dir,
+                                         Manifest.default_filename), use_hash)
+        index = None
+        if build_index:
+            index = IMLogConvert.Index.Index(os.path.join(self.output_dir,
+                    IMLogConvert.Index.Index.default_filename))
+        try:
+            return self.convert(filenames, progress, manifest, index)
+        finally:
+            manifest.close()
+            if index is not None:
+                index.close()
+
+    def _convert_pipelined(self, filenames):
+        """ Convert the files in three overlapping stages, and yield the
+            results like _convert_file: self.prefetch_threads threads read
+            the raw bytes of the upcoming files, the current thread parses
+            them, and a writer thread writes the conversations. The stages
+            are connected by queues of at most self.read_queue_size files
+            and self.write_queue_size conversations, so that memory usage
+            stays bounded. While a thread waits for I/O, the others keep
+            running, which helps when reading or writing files is slow (e.g.
+            on a network file system).
+            If the generator is closed (or the consumer raises an exception)
+            before all files are converted, the threads are stopped, and the
+            temporary files of the results that were not yielded are removed.
+        """
+        read_queue = Queue.Queue(self.read_queue_size)
+        write_queue = Queue.Queue(self.write_queue_size)
+        results = Queue.Queue()
+        pending = iter(filenames)
+        lock = threading.Lock()
+        stop = threading.Event()
+        threads = [threading.Thread(target=_prefetch,
+                                    args=(pending, lock, stop, read_queue))
+                   for i in xrange(self.prefetch_threads)]
+        threads.append(threading.Thread(target=_write_conversations,
+                                        args=(write_queue, results)))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        (reader, writer, output_dir, extension, collect_stats,
+         build_index) = _worker_settings
+        running = self.prefetch_threads
+        writing = True
+        try:
+            while running > 0:
+                (filename, raw, error) = read_queue.get()
+                if filename is None:
+                    running -= 1
+                    continue
+                if error is None:
+                    stats = IMLogConvert.Stats.current
+                    if stats is not None:
+                        # the readers only count the size of named files
+                        stats.count('bytes_in', len(raw))
+                    try:
+                        conversation = _read_conversation(reader,
+                                                          StringIO(raw))
+                    except (Exception, SystemExit), data:
+                        error = "%s: %s" % (data.__class__.__name__, data)
+                raw = None
+                if error is None:
+                    write_queue.put((filename, conversation))
+                else:
+                    results.put((filename, None, None, error, None, None))
+                conversation = None
+                while not results.empty():
+                    yield results.get()
+            write_queue.put((None, None))
+            writing = False
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            stop.set()
+            # unblock prefetch threads that wait for room in read_queue
+            while running > 0:
+                if read_queue.get()[0] is None:
+                    running -= 1
+            if writing:
+                write_queue.put((None, None))
+            for thread in threads:
+                thread.join()
+            while not results.empty():
+                item = results.get()
+                if item is not None and item[2] is not None:
+                    _remove_temporary(item[2])
+
+    def _collect(self, results, result, progress, index=None,
+                 manifest=None):
+        """ Gather the results of the individual conversions, and move the
+            written files to their final names
+        """
+        claimed = set()
+        for (filename, outfilename, tmpfilename, error, stats,
+             entries) in results:
+            if stats is not None and self.stats is not None:
+                self.stats.merge(stats)
+            if error is None:
+                try:
+                    outfilename = _claim_name(filename, outfilename, claimed,
+                                              manifest)
+                    _move_output(tmpfilename, outfilename)
+                except (IOError, OSError), data:
+                    error = "%s: %s" % (data.__class__.__name__, data)
+                    outfilename = None
+            if error is None:
+                result.converted.append((filename, outfilename))
+                if index is not None:
+                    index.add_entries(entries, filename, outfilename)
+            else:
+                result.errors.append((filename, error))
+            done = len(result.converted) + len(result.errors)
+            if progress is not None:
+                progress(done, result.total, filename, outfilename, error)
+            if self.progress_stream is not None:
+                self.progress_stream.write("[%i/%i] %s\n" % (
+                                           done, result.total, filename))
+
+
+class BatchResult:
+    """ Result of BatchConverter.convert. 'converted' is a list of tuples
+        (filename, outfilename) of the successfully converted files,
+        'errors' is a list of tuples (filename, error) of the files that
+        could not be converted. 'skipped' is the list of files that were
+        left out because they did not change, and 'removed' the list of
+        output files that were deleted because their source disappeared.
+        'elapsed' is the wall time of the conversion in seconds.
+    """
+    def __init__(self, total):
+        """ Initialize an empty result for 'total' input files """
+        self.total = total
+        self.converted = []
+        self.errors = []
+        self.skipped = []
+        self.removed = []
+        self.start = time.time()
+        self.elapsed = 0.0
+
+    def summary(self):
+        """ Return a human-readable report as a multi-line string """
+        result = "Converted %i of %i files in %.1f s" % (
+                 len(self.converted), self.total, self.elapsed)
+        if self.elapsed > 0:
+            result += " (%.1f files/s)" % (len(self.converted) / self.elapsed)
+        result += "\n"
+        if len(self.skipped) > 0:
+            result += "%i unchanged files skipped\n" % len(self.skipped)
+        if len(self.removed) > 0:
+            result += "%i obsolete output files removed\n" % len(self.removed)
+        if len(self.errors) > 0:
+            result += "%i files failed:\n" % len(self.errors)
+            for (filename, error) in self.errors:
+                result += "  %s: %s\n" % (filename, error)
+        return result
+
+
+# Settings of the worker process, set by _init_worker
+_worker_settings = None
+
+def _init_worker(reader, writer, output_dir, extension, collect_stats,
+                 build_index=False):
+    """ Store the converter settings in the (worker) process. If
+        collect_stats is True, statistics are collected for every file. If
+        build_index is True, the index entries of every file are returned.
+    """
+    global _worker_settings
+    reader = raising_reader(reader)
+    _worker_settings = (reader, writer, output_dir, extension, collect_stats,
+                        build_index)
+
+def raising_reader(reader):
+    """ Return the reader for use in a worker process: a copy of it with
+        exit_on_error set to False, if it has that setting, so that parse
+        errors are raised and reported back instead of ending the process
+    """
+    if hasattr(reader, 'exit_on_error'):
+        reader = copy.copy(reader)
+        reader.exit_on_error = False
+    return reader
+
+def _convert_file(filename):
+    """ Convert a single file, return a tuple (filename, outfilename,
+        tmpfilename, error, stats, entries), where outfilename is the name
+        the output should get, tmpfilename the name of the temporary file it
+        was written to, stats are the statistics collected for the file, and
+        entries is the result of IMLogConvert.Index.index_entries for the
+        conversation (both may be None)
+    """
+    (reader, writer, output_dir, extension, collect_stats,
+     build_index) = _worker_settings
+    stats = None
+    entries = None
+    if collect_stats:
+        stats = IMLogConvert.Stats.Stats()
+        stats.enable()
+    try:
+        conversation = _read_conversation(reader, filename)
+        (outfilename, tmpfilename, entries) \
+        = _write_conversation(conversation)
+    except (Exception, SystemExit), data:
+        outfilename = tmpfilename = None
+        error = "%s: %s" % (data.__class__.__name__, data)
+    else:
+        error = None
+    if stats is not None:
+        stats.disable()
+    return (filename, outfilename, tmpfilename, error, stats, entries)
+
+def _read_conversation(reader, filename_or_stream):
+    """ Read a conversation with reader (native XML if reader is None) """
+    if reader is None:
+        conversation = Conversation()
+        conversation.from_xml(filename_or_stream, exit_on_error=False)
+    else:
+        conversation = reader.read(filename_or_stream)
+    return conversation
+
+def _write_conversation(conversation):
+    """ Write the conversation according to the worker settings, to a
+        temporary file in the output directory. Return a tuple (outfilename,
+        tmpfilename, entries), where outfilename is the name the file should
+        get (see _claim_name), and entries are the index entries of the
+        conversation, or None.
+    """
+    (reader, writer, output_dir, extension, collect_stats,
+     build_index) = _worker_settings
+    name = os.path.splitext(conversation.filename())[0]
+    outfilename = os.path.join(output_dir, name + extension)
+    tmpfilename = os.path.join(output_dir, "%s.tmp%i-%i%s" % (name,
+                  os.getpid(), _next_temporary(), extension))
+    try:
+        if writer is None:
+            conversation.write_xml(tmpfilename)
+        else:
+            writer.write(conversation, tmpfilename)
+    except:
+        _remove_temporary(tmpfilename)
+        raise
+    entries = None
+    if build_index:
+        entries = IMLogConvert.Index.index_entries(conversation)
+    return (outfilename, tmpfilename, entries)
+
+# counter for the names of temporary files in this process
+_temporary_counter = itertools.count()
+
+def _next_temporary():
+    """ Return a number for a new temporary file name """
+    return _temporary_counter.next()
+
+def _claim_name(filename, outfilename, claimed, manifest=None):
+    """ Return outfilename, or, if it is in the set 'claimed' or recorded in
+        the manifest as the output of a source other than filename, the
+        first free name with a suffix '-1', '-2', ... Add the result to
+        'claimed'.
+    """
+    (base, extension) = os.path.splitext(outfilename)
+    result = outfilename
+    counter = 0
+    while result in claimed or (manifest is not None
+    and manifest.source(result) not in (None, os.path.abspath(filename))):
+        counter += 1
+        result = "%s-%i%s" % (base, counter, extension)
+    claimed.add(result)
+    return result
+
+def _move_output(tmpfilename, outfilename):
+    """ Rename the temporary output file (and its seek index, if any) to
+        outfilename, replacing an existing file
+    """
+    os.rename(tmpfilename, outfilename)
+    seek_filename = IMLogConvert.SeekIndex.seek_filename(tmpfilename)
+    if os.path.exists(seek_filename):
+        os.rename(seek_filename,
+                  IMLogConvert.SeekIndex.seek_filename(outfilename))
+
+def _remove_temporary(tmpfilename):
+    """ Delete a temporary output file and its seek index, if they exist """
+    for name in (tmpfilename,
+                 IMLogConvert.SeekIndex.seek_filename(tmpfilename)):
+        if os.path.exists(name):
+            os.remove(name)
+
+def _prefetch(filenames, lock, stop, read_queue):
+    """ Thread of the pipelined mode: read the raw bytes of the files from
+        the iterator 'filenames' (shared with the other prefetch threads and
+        guarded by lock), and put tuples (filename, data, error) into
+        read_queue, until all files are read or the threading.Event 'stop'
+        is set. A tuple (None, None, None) marks the end.
+    """
+    while True:
+        lock.acquire()
+        try:
+            filename = None
+            if not stop.is_set():
+                filename = next(filenames, None)
+        finally:
+            lock.release()
+        if filename is None:
+            read_queue.put((None, None, None))
+            return
+        try:
+            infile = open(filename, 'rb')
+            try:
+                read_queue.put((filename, infile.read(), None))
+            finally:
+                infile.close()
+        except (IOError, OSError), data:
+            read_queue.put((filename, None,
+                            "%s: %s" % (data.__class__.__name__, data)))
+
+def _write_conversations(write_queue, results):
+    """ Thread of the pipelined mode: write the conversations from the
+        tuples (filename, conversation) in write_queue, and put the results
+        (as returned by _convert_file) into 'results', followed by None after
+        the tuple (None, None) that marks the end.
+    """
+    while True:
+        (filename, conversation) = write_queue.get()
+        if filename is None:
+            results.put(None)
+            return
+        try:
+            (outfilename, tmpfilename, entries) \
+            = _write_conversation(conversation)
+        except (Exception, SystemExit), data:
+            results.put((filename, None, None,
+                         "%s: %s" % (data.__class__.__name__, data), None,
+                         None))
+        else:
+            results.put((filename, outfilename, tmpfilename, None, None,
+                         entries))
@@ -0,0 +1,243 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains an on-disk cache of parsed conversations, so that logs
+that were already parsed once do not have to be parsed again (e.g. when the
+same corpus is exported repeatedly with different alias or service
+replacements)
+"""
+from IMLogConvert.Conversation import Conversation, Message, StatusMessage
+from IMLogConvert.Conversation import intern_name
+import IMLogConvert.Manifest
+from array import array
+import sqlite3
+import marshal
+import multiprocessing
+import os
+
+# version of the serialization format, part of every key
+_format_version = 2
+
+class ConversationCache:
+    """ Persistent cache of parsed conversations, stored in an sqlite
+        database. Every conversation is stored as it was parsed by a reader
+        (i.e. before the alias and service replacements of the reader are
+        applied), in a compact marshal serialization, under a key made from
+        the SHA-1 hash of the content of the log and the cache_key() of the
+        reader (its class, version, and the settings that affect parsing).
+        The version is the parser_version attribute of the reader class,
+        which is increased whenever a change of the parser changes its
+        results, so that conversations cached by older versions are parsed
+        again.
+        When the total size of the stored conversations exceeds max_size
+        bytes, the least recently used ones are evicted.
+        A reader uses the cache if its 'cache' attribute is set to a
+        ConversationCache. The cache can be handed to worker processes (e.g.
+        by BatchConverter), which then open their own connection to the
+        database and commit every change immediately (see _open); in that
+        case, max_size is only enforced approximately, since every process
+        keeps its own count of the total size.
+    """
+    default_filename = '.imlogconvert-cache.sqlite'
+
+    def __init__(self, filename, max_size=1<<30, commit_interval=100):
+        """ Open (or create) the cache database 'filename', with a size cap
+            of max_size bytes. Changes are committed every commit_interval
+            operations, and in commit() and close().
+        """
+        self.filename = filename
+        self.max_size = max_size
+        self.commit_interval = commit_interval
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def _open(self):
+        """ Connect to the database, and create the table if necessary.
+            In a worker process, every change is committed immediately.
+        """
+        if multiprocessing.current_process().name != 'MainProcess':
+            # several processes can only share the database if every one of
+            # them keeps its write transactions short; a process holding an
+            # open transaction locks out all others. Since synchronous is
+            # off, a commit does not wait for the disk.
+            self.commit_interval = 1
+        self._pid = os.getpid()
+        self.db = sqlite3.connect(self.filename, timeout=60)
+        self.db.text_factory = str
+        # the cache can always be rebuilt, so durability is not needed
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS conversations (
+                           key TEXT PRIMARY KEY, data BLOB, size INTEGER,
+                           used INTEGER)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS conversations_used
+                           ON conversations (used)""")
+        self.db.commit()
+        (self._total, self._clock) = self.db.execute(
+             "SELECT COALESCE(SUM(size), 0), COALESCE(MAX(used), 0) "
+             "FROM conversations").fetchone()
+        self._uncommitted = 0
+
+    def read(self, reader, filename):
+        """ Return the conversation parsed from filename by reader, from the
+            cache if possible. Otherwise, the file is parsed with
+            reader.parse(filename) and the result is stored in the cache.
+            The returned conversation is a new object, which the caller may
+            modify.
+        """
+        self._check_process()
+        key = file_key(reader, filename)
+        conversation = self.get(key)
+        if conversation is None:
+            conversation = reader.parse(filename)
+            self.put(key, conversation)
+        return conversation
+
+    def get(self, key):
+        """ Return the conversation stored under key, or None """
+        self._check_process()
+        row = self.db.execute("SELECT data FROM conversations WHERE key = ?",
+                              (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._clock += 1
+        self.db.execute("UPDATE conversations SET used = ? WHERE key = ?",
+                        (self._clock, key))
+        self._changed()
+        return loads(str(row[0]))
+
+    def put(self, key, conversation):
+        """ Store the conversation under key, and evict the least recently
+            used conversations if the cache is too large
+        """
+        self._check_process()
+        data = dumps(conversation)
+        self._clock += 1
+        row = self.db.execute("SELECT size FROM conversations WHERE key = ?",
+                              (key,)).fetchone()
+        if row is not None:
+            self._total -= row[0]
+        self.db.execute("INSERT OR REPLACE INTO conversations VALUES "
+                        "(?,?,?,?)", (key, sqlite3.Binary(data), len(data),
+                                      self._clock))
+        self._total += len(data)
+        if self._total > self.max_size:
+            self.evict()
+        self._changed()
+
+    def evict(self):
+        """ Delete the least recently used conversations until the total size
+            is at most max_size. The conversations are visited in the order
+            of the index on 'used', so only the evicted ones are read.
+        """
+        if self._total <= self.max_size:
+            return
+        cursor = self.db.execute("SELECT key, size FROM conversations "
+                                 "ORDER BY used")
+        evicted = []
+        for (key, size) in cursor:
+            if self._total <= self.max_size:
+                break
+            evicted.append((key,))
+            self._total -= size
+        cursor.close()
+        self.db.executemany("DELETE FROM conversations WHERE key = ?",
+                            evicted)
+
+    def clear(self):
+        """ Delete all conversations from the cache """
+        self.db.execute("DELETE FROM conversations")
+        self.db.commit()
+        self._total = 0
+
+    def _check_process(self):
+        """ Open a new connection to the database if this is a forked child
+            of the process that opened the current one (sqlite connections
+            must not be shared between processes)
+        """
+        if self._pid != os.getpid():
+            self._open()
+
+    def _changed(self):
+        """ Count a change, and commit every commit_interval changes """
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """ Write all changes to the database """
+        self.db.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """ Commit and close the cache database """
+        self.commit()
+        self.db.close()
+
+    def __getstate__(self):
+        """ Return state for pickling, without the database connection """
+        return (self.filename, self.max_size, self.commit_interval)
+
+    def __setstate__(self, state):
+        """ Restore state from pickling, and open the database """
+        (self.filename, self.max_size, self.commit_interval) = state
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+
+def file_key(reader, filename):
+    """ Return the cache key for the log file filename, parsed by reader """
+    return "%s:%i:%s" % (IMLogConvert.Manifest.file_hash(filename),
+                         _format_version, reader.cache_key())
+
+def dumps(conversation):
+    """ Return the conversation serialized as a string """
+    messages = conversation.messages
+    times = array('d', [message.time for message in messages])
+    # 's' for status messages, 'm' for messages
+    kinds = ''.join([isinstance(message, StatusMessage) and 's' or 'm'
+                     for message in messages])
+    senders = [getattr(message, 'sender', None) for message in messages]
+    texts = [message.text for message in messages]
+    return marshal.dumps((conversation.service, conversation.account,
+                          conversation.start_time, conversation.timezone,
+                          conversation.participants.items(),
+                          times.tostring(), kinds, senders, texts))
+
+def loads(data):
+    """ Return the conversation serialized in the string data (see dumps) """
+    (service, account, start_time, timezone, participants, times, kinds,
+     senders, texts) = marshal.loads(data)
+    conversation = Conversation(service, account, start_time, timezone)
+    for (participant, alias) in participants:
+        conversation.participants[participant] = alias
+    times = array('d', times)
+    messages = conversation.messages
+    for (index, text) in enumerate(texts):
+        if kinds[index] == 's':
+            messages.append(StatusMessage(times[index], text))
+        else:
+            messages.append(Message(times[index], intern_name(senders[index]),
+                                    text))
+    return conversation
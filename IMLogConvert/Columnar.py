@@ -0,0 +1,254 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a columnar export of conversations for analytics: the
+messages of a whole corpus are stored as flat arrays in a directory of NumPy
+.npy files, which can be memory-mapped without copying.
+
+Writing does not need NumPy (the .npy files are written directly), loading
+does.
+"""
+import struct
+import math
+import os
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# size of the .npy headers written by ColumnarWriter, including the magic
+# string and the header length
+_header_size = 128
+# number of values that are collected before they are written to the files
+_flush_size = 65536
+
+# the .npy files: name -> dtype description
+_columns = {
+    # messages: time (epoch seconds), sender (string id, -1 for status
+    # messages), conversation id, and the UTF-8 encoded text, which is
+    # text[text_offsets[i]:text_offsets[i+1]]
+    'time': '<i8',
+    'sender': '<i4',
+    'conversation': '<i4',
+    'text_offsets': '<i8',
+    'text': '|u1',
+    # conversations: start time, string ids of service, account, contact
+    # and time zone, and the messages of conversation i are
+    # first[i]:first[i+1]
+    'conversation_start': '<i8',
+    'conversation_service': '<i4',
+    'conversation_account': '<i4',
+    'conversation_contact': '<i4',
+    'conversation_timezone': '<i4',
+    'conversation_first': '<i8',
+    # string dictionary: string i is
+    # strings[string_offsets[i]:string_offsets[i+1]] (UTF-8)
+    'string_offsets': '<i8',
+    'strings': '|u1',
+}
+_struct_codes = {'<i8': 'q', '<i4': 'i'}
+
+
+class ColumnarWriter:
+    """ Writer for the columnar export of a corpus into 'directory'. The
+        conversations are added one by one, and their messages are written
+        out in blocks, so that memory usage does not grow with the size of
+        the corpus (except for the dictionary of distinct strings).
+    """
+    def __init__(self, directory):
+        """ Create the export directory and its files """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self._files = {}
+        for (name, descr) in _columns.items():
+            self._files[name] = _NpyWriter(os.path.join(directory,
+                                           name + '.npy'), descr)
+        self._string_ids = {}
+        self._conversations = 0
+        self._messages = 0
+        self._text_size = 0
+        self._strings_size = 0
+        self._files['text_offsets'].append(0)
+        self._files['string_offsets'].append(0)
+
+    def add(self, conversation, messages=None):
+        """ Add a conversation. The messages are taken from the iterable
+            'messages', or from conversation.messages if it is None (so that
+            e.g. the messages from Conversation.iter_xml can be exported
+            without loading the whole conversation).
+        """
+        if messages is None:
+            messages = conversation.messages
+        files = self._files
+        contact = conversation.contact()
+        conversation_id = self._conversations
+        files['conversation_start'].append(int(math.floor(
+                                           conversation.start_time)))
+        files['conversation_service'].append(
+                                      self.string_id(conversation.service))
+        files['conversation_account'].append(
+                                      self.string_id(conversation.account))
+        files['conversation_contact'].append(self.string_id(contact))
+        files['conversation_timezone'].append(
+                                      self.string_id(conversation.timezone))
+        files['conversation_first'].append(self._messages)
+        self._conversations += 1
+        times = files['time']
+        senders = files['sender']
+        conversations = files['conversation']
+        text_offsets = files['text_offsets']
+        text = files['text']
+        string_id = self.string_id
+        count = 0
+        for message in messages:
+            times.append(int(math.floor(message.time)))
+            sender = getattr(message, 'sender', None)
+            if sender is None:
+                senders.append(-1)
+            else:
+                senders.append(string_id(sender))
+            conversations.append(conversation_id)
+            data = message.text.encode('utf-8')
+            text.write(data)
+            self._text_size += len(data)
+            text_offsets.append(self._text_size)
+            count += 1
+        self._messages += count
+
+    def string_id(self, string):
+        """ Return the id of string in the string dictionary """
+        if string is None:
+            string = u''
+        try:
+            return self._string_ids[string]
+        except KeyError:
+            pass
+        string_id = len(self._string_ids)
+        self._string_ids[string] = string_id
+        data = unicode(string).encode('utf-8')
+        self._files['strings'].write(data)
+        self._strings_size += len(data)
+        self._files['string_offsets'].append(self._strings_size)
+        return string_id
+
+    def close(self):
+        """ Finish all files """
+        self._files['conversation_first'].append(self._messages)
+        for npy_file in self._files.values():
+            npy_file.close()
+
+
+class _NpyWriter:
+    """ Writer for a one-dimensional .npy file whose length is not known in
+        advance. A header of fixed size is reserved at the start of the
+        file, and filled in with the final shape by close().
+    """
+    def __init__(self, filename, descr):
+        """ Create the file for values with the given dtype description """
+        self.fh = open(filename, 'wb')
+        self.descr = descr
+        self.count = 0
+        self._values = []
+        self._code = _struct_codes.get(descr)
+        self.fh.write(_npy_header(descr, 0))
+
+    def append(self, value):
+        """ Append a number """
+        self._values.append(value)
+        if len(self._values) >= _flush_size:
+            self.flush()
+
+    def write(self, data):
+        """ Append bytes (only for the type '|u1') """
+        self.fh.write(data)
+        self.count += len(data)
+
+    def flush(self):
+        """ Write the collected numbers """
+        if len(self._values) > 0:
+            self.fh.write(struct.pack('<%i%s' % (len(self._values),
+                                      self._code), *self._values))
+            self.count += len(self._values)
+            self._values = []
+
+    def close(self):
+        """ Write the remaining numbers and the final header """
+        self.flush()
+        self.fh.seek(0)
+        self.fh.write(_npy_header(self.descr, self.count))
+        self.fh.close()
+
+
+def _npy_header(descr, count):
+    """ Return the .npy (version 1.0) header for a one-dimensional array of
+        'count' values with the given dtype description, padded to
+        _header_size bytes
+    """
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%i,), }" \
+             % (descr, count)
+    header = header.ljust(_header_size - 10 - 1) + "\n"
+    return "\x93NUMPY\x01\x00" + struct.pack('<H', len(header)) + header
+
+
+class ColumnarCorpus:
+    """ Columnar export loaded by load(). The dictionary 'columns' maps the
+        name of every column to a read-only, memory-mapped numpy array (see
+        _columns for the names and their meaning).
+    """
+    def __init__(self, directory):
+        """ Map all columns in directory """
+        if numpy is None:
+            raise ImportError("Loading a columnar export requires numpy")
+        self.directory = directory
+        self.columns = {}
+        for name in _columns.keys():
+            self.columns[name] = numpy.load(os.path.join(directory,
+                                            name + '.npy'), mmap_mode='r')
+
+    def string(self, string_id):
+        """ Return the string with the given id from the dictionary """
+        offsets = self.columns['string_offsets']
+        return self.columns['strings'][offsets[string_id]:
+                                       offsets[string_id + 1]]\
+               .tostring().decode('utf-8')
+
+    def string_ids(self):
+        """ Return a dictionary string -> id for all strings """
+        return dict([(self.string(i), i)
+                     for i in xrange(len(self.columns['string_offsets']) - 1)])
+
+    def text(self, index):
+        """ Return the text of the message with the given index """
+        offsets = self.columns['text_offsets']
+        return self.columns['text'][offsets[index]:offsets[index + 1]]\
+               .tostring().decode('utf-8')
+
+    def __len__(self):
+        """ Return the number of messages """
+        return len(self.columns['time'])
+
+
+def load(directory):
+    """ Return the ColumnarCorpus exported to directory, with all columns
+        memory-mapped (no data is copied)
+    """
+    return ColumnarCorpus(directory)
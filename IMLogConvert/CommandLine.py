@@ -0,0 +1,280 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains the imlogconvert command line program. The format of
+every input file is detected from its first bytes, and only the reader and
+writer that are actually needed are imported, so that the program starts
+quickly.
+"""
+from optparse import OptionParser
+import IMLogConvert.Compression
+import sys
+import os
+
+# number of bytes at the start of a file that are used to detect its format
+_sniff_size = 1024
+
+def sniff_format(filename):
+    """ Return the format of the log file 'filename': 'adium' for an Adium
+        chatlog, 'xml' for native XML, 'pidgin' for a Pidgin text log, or None
+        if the format cannot be recognized. Compressed files are recognized
+        by their content.
+    """
+    source = IMLogConvert.Compression.open_input(filename)
+    try:
+        head = source.read(_sniff_size)
+    finally:
+        source.close()
+    if head.startswith('\xef\xbb\xbf'):
+        head = head[3:]
+    head = head.lstrip()
+    if head.startswith('Conversation with'):
+        return 'pidgin'
+    if head.startswith('<'):
+        if '<chat' in head:
+            return 'adium'
+        if '<conversation' in head:
+            return 'xml'
+    return None
+
+def get_reader(format, aliases, cache=None):
+    """ Return a reader for the given input format (see sniff_format), with
+        the given aliases of the log owner, or None for native XML. If an
+        IMLogConvert.Cache.ConversationCache is given, the reader uses it.
+    """
+    if format == 'adium':
+        from IMLogConvert.AdiumReader import AdiumReader
+        reader = AdiumReader()
+        reader.exit_on_error = False
+    elif format == 'pidgin':
+        if len(aliases) == 0:
+            raise ValueError("Pidgin logs need at least one --alias")
+        from IMLogConvert.PidginReader import PidginTextReader
+        reader = PidginTextReader(aliases)
+    else:
+        return None
+    reader.cache = cache
+    return reader
+
+def get_writer(format):
+    """ Return a writer for the given output format ('xml' or 'pidgin'), or
+        None for native XML
+    """
+    if format == 'pidgin':
+        from IMLogConvert.PidginWriter import PidginTextWriter
+        return PidginTextWriter()
+    return None
+
+def read(reader, filename):
+    """ Read a conversation from filename with reader (native XML if reader
+        is None)
+    """
+    if reader is None:
+        from IMLogConvert.Conversation import Conversation
+        conversation = Conversation()
+        conversation.from_xml(filename, exit_on_error=False)
+        return conversation
+    return reader.read(filename)
+
+def read_days(reader, filename):
+    """ Yield the conversation in filename split into days (see
+        IMLogConvert.Split.split_days). Native XML is read as a stream, so
+        that only one day is held in memory.
+    """
+    from IMLogConvert.Split import split_days
+    if reader is None:
+        from IMLogConvert.Conversation import Conversation
+        messages = Conversation().iter_xml(filename)
+        conversation = messages.next()
+        return split_days(conversation, messages)
+    return split_days(reader.read(filename))
+
+def main(argv=None):
+    """ Run the imlogconvert program, return the exit status """
+    parser = OptionParser(usage="%prog [options] LOGFILE ...",
+             description="Convert Adium, Pidgin and native XML IM logs to "
+             "native XML or Pidgin text logs. The format of every input file "
+             "is detected automatically.")
+    parser.add_option('-o', '--output-dir', default='.', metavar='DIR',
+                      help="write the converted logs to DIR (default: "
+                      "current directory), or to standard output if DIR "
+                      "is '-'")
+    parser.add_option('-f', '--format', choices=['xml', 'pidgin'],
+                      default='xml',
+                      help="output format: 'xml' (default) or 'pidgin'")
+    parser.add_option('-a', '--alias', action='append', dest='aliases',
+                      default=[], metavar='ALIAS',
+                      help="alias of the log owner in Pidgin logs (can be "
+                      "given more than once)")
+    parser.add_option('-d', '--split-days', action='store_true',
+                      default=False,
+                      help="write one log per calendar day of every "
+                      "conversation")
+    parser.add_option('-j', '--processes', type='int', default=1,
+                      help="number of worker processes (default: 1)")
+    parser.add_option('-u', '--update', action='store_true', default=False,
+                      help="only convert files that changed since the last "
+                      "update of the output directory")
+    parser.add_option('-c', '--cache', metavar='FILE',
+                      help="keep the parsed Adium and Pidgin logs in the "
+                      "cache database FILE, so that they are not parsed "
+                      "again in later runs")
+    parser.add_option('-s', '--stats', choices=['json', 'csv'],
+                      metavar='FORMAT',
+                      help="instead of converting, write statistics of the "
+                      "logs to standard output, as 'json' or 'csv' (per "
+                      "contact)")
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help="do not print the names of the converted files")
+    (options, filenames) = parser.parse_args(argv)
+    if len(filenames) == 0:
+        parser.error("no input files")
+    if options.output_dir == '-' and (options.update
+                                      or options.processes > 1):
+        parser.error("--update and --processes need an output directory")
+    if options.split_days and (options.update or options.processes > 1):
+        parser.error("--split-days cannot be used with --update or "
+                     "--processes")
+    errors = 0
+    formats = {}
+    for filename in filenames:
+        try:
+            format = sniff_format(filename)
+        except IOError, data:
+            print >> sys.stderr, "%s: %s" % (filename, data)
+            errors += 1
+            continue
+        if format is None:
+            print >> sys.stderr, "%s: unknown log format" % filename
+            errors += 1
+            continue
+        formats.setdefault(format, []).append(filename)
+    cache = None
+    if options.cache is not None:
+        from IMLogConvert.Cache import ConversationCache
+        cache = ConversationCache(options.cache)
+    try:
+        if options.stats is not None:
+            return _write_stats(formats, options, errors, cache)
+        writer = get_writer(options.format)
+        for (format, format_filenames) in sorted(formats.items()):
+            try:
+                reader = get_reader(format, options.aliases, cache)
+            except ValueError, data:
+                for filename in format_filenames:
+                    print >> sys.stderr, "%s: %s" % (filename, data)
+                errors += len(format_filenames)
+                continue
+            if options.update or options.processes > 1:
+                errors += _convert_batch(reader, writer, format_filenames,
+                                         options)
+            else:
+                errors += _convert(reader, writer, format_filenames,
+                                   options)
+    finally:
+        if cache is not None:
+            cache.close()
+    if errors > 0:
+        return 1
+    return 0
+
+def _convert(reader, writer, filenames, options):
+    """ Convert the files one by one in the current process. Return the
+        number of files that failed.
+    """
+    errors = 0
+    if writer is None:
+        extension = '.xml'
+    else:
+        extension = '.txt'
+    for filename in filenames:
+        try:
+            if options.split_days:
+                conversations = read_days(reader, filename)
+            else:
+                conversations = [read(reader, filename)]
+            for conversation in conversations:
+                if options.output_dir == '-':
+                    if writer is None:
+                        conversation.write_xml(sys.stdout)
+                        sys.stdout.write("\n")
+                    else:
+                        writer.write_stream(conversation, sys.stdout)
+                    continue
+                outfilename = os.path.join(options.output_dir,
+                              os.path.splitext(conversation.filename())[0]
+                              + extension)
+                if writer is None:
+                    conversation.write_xml(outfilename)
+                else:
+                    writer.write(conversation, outfilename)
+                if not options.quiet:
+                    print "%s -> %s" % (filename, outfilename)
+        except (Exception, SystemExit), data:
+            print >> sys.stderr, "%s: %s: %s" % (filename,
+                                 data.__class__.__name__, data)
+            errors += 1
+    return errors
+
+def _write_stats(formats, options, errors, cache=None):
+    """ Write the statistics of the files (given as a dictionary of file
+        names by format) to standard output, and return the exit status
+    """
+    from IMLogConvert.CorpusStatistics import CorpusStatistics, collect
+    stats = CorpusStatistics()
+    for (format, format_filenames) in sorted(formats.items()):
+        try:
+            reader = get_reader(format, options.aliases, cache)
+        except ValueError, data:
+            for filename in format_filenames:
+                print >> sys.stderr, "%s: %s" % (filename, data)
+            errors += len(format_filenames)
+            continue
+        stats.merge(collect(format_filenames, reader, options.processes))
+    for (filename, error) in stats.errors:
+        print >> sys.stderr, "%s: %s" % (filename, error)
+    errors += len(stats.errors)
+    if options.stats == 'json':
+        stats.write_json(sys.stdout)
+        sys.stdout.write("\n")
+    else:
+        stats.write_csv(sys.stdout)
+    if errors > 0:
+        return 1
+    return 0
+
+def _convert_batch(reader, writer, filenames, options):
+    """ Convert the files with a BatchConverter. Return the number of files
+        that failed.
+    """
+    from IMLogConvert.BatchConverter import BatchConverter
+    converter = BatchConverter(reader, writer, options.output_dir,
+                               options.processes)
+    if options.update:
+        result = converter.update(filenames)
+    else:
+        result = converter.convert(filenames)
+    for (filename, error) in result.errors:
+        print >> sys.stderr, "%s: %s" % (filename, error)
+    if not options.quiet:
+        for (filename, outfilename) in result.converted:
+            print "%s -> %s" % (filename, outfilename)
+    return len(result.errors)
@@ -0,0 +1,245 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains functions for reading and writing gzip, bzip2 and xz
+compressed logs transparently, without temporary files
+"""
+import zlib
+import bz2
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# magic bytes at the start of compressed files
+_magic = [('gz', '\x1f\x8b'), ('bz2', 'BZh'), ('xz', '\xfd7zXZ\x00')]
+_sniff_size = 6
+# file name extensions of compressed output
+_extensions = {'.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz'}
+
+
+def sniff(data):
+    """ Return the compression ('gz', 'bz2', 'xz') of a file that starts
+        with 'data', or None if it is not compressed
+    """
+    for (compression, magic) in _magic:
+        if data.startswith(magic):
+            return compression
+    return None
+
+def compression_of(filename):
+    """ Return the compression indicated by the extension of filename, or
+        None
+    """
+    for (extension, compression) in _extensions.items():
+        if filename.endswith(extension):
+            return compression
+    return None
+
+def open_input(filename_or_stream):
+    """ Open filename_or_stream for reading, decompressing it on the fly if
+        its content shows that it is compressed. A file name is opened only
+        once: if the file is uncompressed, the open file itself is returned
+        (positioned at the start), otherwise a DecompressingStream that reads
+        from it; either must be closed by the caller. A stream is always
+        wrapped in a DecompressingStream (which passes uncompressed data
+        through), because the bytes that were read for sniffing cannot be
+        pushed back. Other objects without a read method (like an xml.sax
+        InputSource) are returned unchanged.
+    """
+    if isinstance(filename_or_stream, basestring):
+        fh = open(filename_or_stream, 'rb')
+        compression = sniff(fh.read(_sniff_size))
+        fh.seek(0)
+        if compression is None:
+            return fh
+        return DecompressingStream(fh, compression, close_stream=True)
+    if not hasattr(filename_or_stream, 'read'):
+        return filename_or_stream
+    prefix = filename_or_stream.read(_sniff_size)
+    return DecompressingStream(filename_or_stream, sniff(prefix),
+                               prefix=prefix)
+
+def open_output(filename, mode='w'):
+    """ Open filename for writing. If its extension is '.gz', '.bz2' or
+        '.xz', a CompressingStream is returned, otherwise a plain file
+        opened with the given mode.
+    """
+    compression = compression_of(filename)
+    if compression is None:
+        return open(filename, mode)
+    return CompressingStream(open(filename, 'wb'), compression,
+                             close_stream=True)
+
+
+class DecompressingStream:
+    """ Read-only file-like object that decompresses the data from 'stream'
+        incrementally. If 'compression' is None, the data is passed through
+        unchanged. 'prefix' are bytes that were already read from the
+        stream. Concatenated compressed streams (as produced by e.g.
+        'cat a.gz b.gz') are decompressed as a whole.
+    """
+    def __init__(self, stream, compression, prefix='', close_stream=False,
+                 blocksize=1<<16):
+        """ Initialize the stream """
+        self.stream = stream
+        self.compression = compression
+        self.close_stream = close_stream
+        self.blocksize = blocksize
+        self._decompressor = None
+        if compression is not None:
+            self._decompressor = _decompressor(compression)
+        self._input = prefix
+        self._buffer = ''
+        self._position = 0
+        self._eof = False
+
+    def _fill(self, size):
+        """ Decompress data until the buffer holds at least 'size' unread
+            bytes, or all data was read (if size is negative)
+        """
+        if self._position > 0:
+            self._buffer = self._buffer[self._position:]
+            self._position = 0
+        chunks = [self._buffer]
+        available = len(self._buffer)
+        while (size < 0 or available < size) and not self._eof:
+            data = self._input or self.stream.read(self.blocksize)
+            self._input = ''
+            if data == '':
+                self._eof = True
+                if self._decompressor is not None \
+                and hasattr(self._decompressor, 'flush'):
+                    chunks.append(self._decompressor.flush())
+                break
+            if self._decompressor is not None:
+                decompressor = self._decompressor
+                try:
+                    data = decompressor.decompress(data)
+                except EOFError:
+                    # the previous compressed stream ended exactly at the end
+                    # of the last block (bz2 and xz decompressors refuse
+                    # further data instead of returning it as unused_data)
+                    decompressor = _decompressor(self.compression)
+                    self._decompressor = decompressor
+                    data = decompressor.decompress(data)
+                if decompressor.unused_data:
+                    # the next compressed stream begins
+                    self._decompressor = _decompressor(self.compression)
+                    self._input = decompressor.unused_data
+            chunks.append(data)
+            available += len(data)
+        self._buffer = ''.join(chunks)
+
+    def read(self, size=-1):
+        """ Return up to 'size' decompressed bytes (all if size < 0) """
+        if self._decompressor is None and self._input == '' \
+        and self._position == len(self._buffer):
+            # uncompressed, and nothing buffered
+            if size < 0:
+                return self.stream.read()
+            return self.stream.read(size)
+        if size < 0 or len(self._buffer) - self._position < size:
+            self._fill(size)
+        start = self._position
+        if size < 0:
+            self._position = len(self._buffer)
+        else:
+            self._position = min(start + size, len(self._buffer))
+        return self._buffer[start:self._position]
+
+    def readline(self, size=-1):
+        """ Return the next line of decompressed data """
+        position = self._buffer.find('\n', self._position)
+        while position < 0 and not self._eof:
+            self._fill(len(self._buffer) - self._position + self.blocksize)
+            position = self._buffer.find('\n', self._position)
+        if position < 0:
+            return self.read(size)
+        length = position + 1 - self._position
+        if size >= 0:
+            length = min(length, size)
+        return self.read(length)
+
+    def __iter__(self):
+        """ Iterate over the lines of the decompressed data """
+        return iter(self.readline, '')
+
+    def close(self):
+        """ Close the underlying stream, if this object opened it """
+        if self.close_stream:
+            self.stream.close()
+
+
+class CompressingStream:
+    """ Write-only file-like object that compresses everything written to
+        it into 'stream'. The compressed data is complete only after close().
+    """
+    def __init__(self, stream, compression, level=6, close_stream=False):
+        """ Initialize the stream """
+        self.stream = stream
+        self.close_stream = close_stream
+        if compression == 'gz':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                                16 + zlib.MAX_WBITS)
+        elif compression == 'bz2':
+            self._compressor = bz2.BZ2Compressor(max(1, level))
+        else:
+            self._compressor = _lzma().LZMACompressor(preset=level)
+
+    def write(self, data):
+        """ Compress and write data """
+        self.stream.write(self._compressor.compress(data))
+
+    def flush(self):
+        """ Flush the underlying stream. Data still held by the compressor
+            is only written in close().
+        """
+        self.stream.flush()
+
+    def close(self):
+        """ Finish the compressed data, and close the underlying stream if
+            this object opened it
+        """
+        self.stream.write(self._compressor.flush())
+        if self.close_stream:
+            self.stream.close()
+        else:
+            self.stream.flush()
+
+
+def _decompressor(compression):
+    """ Return a new decompressor object for the given compression """
+    if compression == 'gz':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return _lzma().LZMADecompressor()
+
+def _lzma():
+    """ Return the lzma module, or raise ValueError if it is not installed """
+    if lzma is None:
+        raise ValueError("xz compression requires the lzma module "
+                         "(backports.lzma on Python 2)")
+    return lzma
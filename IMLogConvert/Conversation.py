@@ -23,11 +23,16 @@
 This module contains two classes: one to describe a IM Conversations and on
 to describe an individual Instant Message.
 """
-from xml.sax import saxutils, make_parser, ContentHandler
+from xml.parsers import expat
 import IMLogConvert.Time
+import IMLogConvert.Stats
+import IMLogConvert.SeekIndex
+import IMLogConvert.Compression
 from time import gmtime
 import sys
 import codecs
+from cStringIO import StringIO
+from array import array
 
 class Conversation:
     """ Instant Message Conversation. A conversation is characterized by the
@@ -56,50 +61,232 @@ class Conversation:
         self.participants = {}
         self.messages = []
 
-    def to_xml(self, filename=None):
-        """ Return an XML file representing the conversation as a UTF-8 encoded
-            string. If filename is given, write the xml to file.
+    def contact(self):
+        """ Return the username of the person the conversation is with: the
+            last of the participants (in the order of the participants
+            dictionary) that is not the account, or '' if there is none
         """
-        result  = r'<?xml version="1.0" encoding="utf-8"?>'+"\n"
-        result += \
-        "<conversation service=%s account=%s start_time=%s timezone=%s>\n" % (
-        saxutils.quoteattr(self.service).encode('utf-8'),
-        saxutils.quoteattr(self.account).encode('utf-8'),
-        saxutils.quoteattr( IMLogConvert.Time.tz_strftime(
-          '%a %d %b %Y %H:%M:%S', self.start_time, self.timezone, 
-          append_offset=False)),
-        saxutils.quoteattr(str(self.timezone)) )
-        result += r'  <participants>' + "\n"
+        contact = ''
         for participant in self.participants.keys():
-            result += "    <participant alias=%s>%s</participant>\n" % (
-                      saxutils.quoteattr(
-                          self.participants[participant]).encode('utf-8'),
-                      saxutils.escape(participant).encode('utf-8'),
-                      )
-        result += r'  </participants>' + "\n"
-        result += r'  <messages>' + "\n"
-        for message in self.messages:
-            result += r'    ' + message.to_xml(self.timezone) + "\n"
-        result += r'  </messages>' + "\n"
-        result += r'</conversation>'
+            if participant != self.account:
+                contact = participant
+        return contact
+
+    def to_xml(self, filename=None, seek_stride=None):
+        """ Return an XML file representing the conversation as a UTF-8 encoded
+            string. If filename is given, write the xml to file, compressed
+            if the filename ends in '.gz', '.bz2' or '.xz'. If seek_stride is
+            given as well, a seek index is written next to the file (see
+            write_xml); the XML is then written to the file incrementally,
+            and None is returned.
+        """
+        if filename is not None and seek_stride is not None \
+        and IMLogConvert.Compression.compression_of(filename) is None:
+            self.write_xml(filename, seek_stride=seek_stride)
+            return None
+        buffer = StringIO()
+        self.write_xml(buffer)
+        result = buffer.getvalue()
         if filename is not None:
-            outfile = open(filename, 'w')
+            outfile = IMLogConvert.Compression.open_output(filename)
             outfile.write(result)
             outfile.close()
         return result
 
-    def from_xml(self, filename_or_stream):
+    def write_xml(self, filename_or_stream, buffer_lines=1000,
+                  seek_stride=None):
+        """ Write the XML representation of the conversation (see to_xml) to
+            filename_or_stream. The document is written incrementally, in
+            UTF-8 encoded blocks of up to 'buffer_lines' lines, so that it
+            never has to be held in memory as a whole. A filename ending in
+            '.gz', '.bz2' or '.xz' is written compressed.
+            If seek_stride is given and filename_or_stream is the name of an
+            uncompressed file, an IMLogConvert.SeekIndex of every
+            seek_stride-th message is written next to the file, so that
+            from_xml can read a time window without parsing the whole file.
+        """
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('xml.write')
+        if isinstance(filename_or_stream, basestring):
+            stream = IMLogConvert.Compression.open_output(filename_or_stream)
+        else:
+            stream = filename_or_stream
+        write = stream.write
+        size = 0
+        lines = []
+        seek_index = None
+        if seek_stride is not None and stream is not filename_or_stream \
+        and IMLogConvert.Compression.compression_of(filename_or_stream) is None:
+            seek_index = IMLogConvert.SeekIndex.SeekIndex(seek_stride)
+        lines.append(r'<?xml version="1.0" encoding="utf-8"?>'+"\n")
+        lines.append(
+        "<conversation service=%s account=%s start_time=%s timezone=%s>\n" % (
+        _quoteattr(self.service).encode('utf-8'),
+        _quoteattr(self.account).encode('utf-8'),
+        _quoteattr( IMLogConvert.Time.CONVERSATION_CODEC.format(
+          self.start_time, self.timezone, append_offset=False)),
+        _quoteattr(str(self.timezone)) ))
+        lines.append(r'  <participants>' + "\n")
+        for participant in self.participants.keys():
+            lines.append("    <participant alias=%s>%s</participant>\n" % (
+                      _quoteattr(
+                          self.participants[participant]).encode('utf-8'),
+                      _escape(participant).encode('utf-8'),
+                      ))
+        lines.append(r'  </participants>' + "\n")
+        lines.append(r'  <messages>' + "\n")
+        for (index, message) in enumerate(self.messages):
+            if seek_index is not None and index % seek_stride == 0:
+                # flush, so that size is the offset of the message
+                block = ''.join(lines)
+                write(block)
+                size += len(block)
+                del lines[:]
+                if index == 0:
+                    seek_index.header_end = size
+                seek_index.add(message.time, size)
+            lines.append(r'    ' + message.to_xml(self.timezone) + "\n")
+            if len(lines) >= buffer_lines:
+                block = ''.join(lines)
+                write(block)
+                size += len(block)
+                del lines[:]
+        if seek_index is not None:
+            seek_index.body_end = size + sum([len(line) for line in lines])
+            if len(self.messages) == 0:
+                seek_index.header_end = seek_index.body_end
+        lines.append(r'  </messages>' + "\n")
+        lines.append(r'</conversation>')
+        block = ''.join(lines)
+        write(block)
+        size += len(block)
+        if stream is not filename_or_stream:
+            stream.close()
+        if seek_index is not None:
+            seek_index.write(filename_or_stream)
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_written(self, size)
+
+    def from_xml(self, filename_or_stream, exit_on_error=True,
+                 use_expat=True, window=None):
         """ Fill the conversation with data from the XML in the
-            filename_or_stream
+            filename_or_stream. If the XML cannot be parsed, the program is
+            terminated, unless exit_on_error is False, in which case the
+            exception is raised to the caller. The XML is parsed with expat
+            directly (see expat_parse), unless use_expat is False, or
+            filename_or_stream is neither a filename nor a stream, in which
+            case xml.sax is used. Compressed files and streams (gzip, bzip2,
+            xz) are decompressed on the fly.
+            If window is given as a tuple (start, end) of epoch seconds
+            (either of which may be None), only the messages with
+            start <= time < end are kept. If the file has a seek index (see
+            write_xml), only the part of the file that contains these
+            messages is parsed.
         """
-        parser = make_parser()
-        parser.setContentHandler(ConversationContentHandler(self))
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('xml.parse')
+        handler = ConversationContentHandler(self)
+        source = IMLogConvert.Compression.open_input(filename_or_stream)
+        if window is not None and isinstance(filename_or_stream, basestring) \
+        and isinstance(source, file):
+            # an uncompressed file, which may have a seek index
+            seek_index = IMLogConvert.SeekIndex.load(filename_or_stream)
+            if seek_index is not None:
+                try:
+                    window_source = _read_xml_window(source, seek_index,
+                                                     window)
+                finally:
+                    source.close()
+                source = window_source
         try:
-            parser.parse(filename_or_stream)
+            if use_expat and (isinstance(source, basestring)
+            or hasattr(source, 'read')):
+                expat_parse(handler, source)
+            else:
+                sax_parse(handler, source)
         except Exception, data:
+            if not exit_on_error:
+                raise
             print >> sys.stderr, \
             "There was a fatal error in parsing the xml file:\n%s" % data
             sys.exit()
+        finally:
+            if source is not filename_or_stream:
+                source.close()
+        if window is not None:
+            self.messages = IMLogConvert.SeekIndex.in_window(self.messages,
+                                                             window)
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_read(self, filename_or_stream)
+
+    def iter_xml(self, filename_or_stream):
+        """ Read the XML in filename_or_stream incrementally. The service,
+            account, start_time, timezone and participants of the
+            conversation are filled in, and the conversation itself is
+            yielded as soon as this header is complete. After that, the
+            individual messages (Message/StatusMessage) are yielded one by
+            one, in the order of the file. The messages are not stored in
+            self.messages, and elements are discarded as soon as they have
+            been processed, so that memory usage does not depend on the length
+            of the conversation. Errors in the XML are raised as exceptions
+            from the iterator. Compressed input is decompressed on the fly.
+        """
+        source = IMLogConvert.Compression.open_input(filename_or_stream)
+        try:
+            for item in self._iter_xml(source):
+                yield item
+        finally:
+            if source is not filename_or_stream:
+                source.close()
+
+    def _iter_xml(self, filename_or_stream):
+        """ Implementation of iter_xml for uncompressed input """
+        from xml.etree.cElementTree import iterparse
+        codec = IMLogConvert.Time.CONVERSATION_CODEC
+        header_done = False
+        parent = None
+        for (event, element) in iterparse(filename_or_stream,
+                                          events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == "conversation":
+                    self.service = _unicode_or_none(element.get("service"))
+                    self.account = _unicode_or_none(element.get("account"))
+                    self.timezone = _unicode_or_none(element.get("timezone"))
+                    self.start_time = codec.parse(element.get("start_time"),
+                                                  self.timezone)
+                elif tag == "messages":
+                    parent = element
+                    if not header_done:
+                        header_done = True
+                        yield self
+                continue
+            if tag == "participant":
+                participant = unicode(element.text or '').strip()
+                self.participants[intern_name(participant)] \
+                = intern_name(_unicode_or_none(element.get("alias")))
+            elif tag == "message":
+                time = codec.parse(element.get("time"), self.timezone)
+                sender = intern_name(_unicode_or_none(element.get("sender")))
+                yield Message(time, sender, unicode(element.text or ''))
+            elif tag == "status":
+                time = codec.parse(element.get("time"), self.timezone)
+                yield StatusMessage(time, unicode(element.text or ''))
+            if tag in ("message", "status") and parent is not None:
+                parent.clear()
+        if not header_done:
+            yield self
+
+    def compact(self):
+        """ Replace the list of messages by a MessageStore, to reduce the
+            memory needed to keep the conversation loaded
+        """
+        if not isinstance(self.messages, MessageStore):
+            self.messages = MessageStore(self.messages)
 
     def filename(self):
         """ Generate a generic filename for the conversation, like
@@ -137,12 +324,52 @@ class Conversation:
         return outfilename
 
 
-class Message:
+def _read_xml_window(infile, seek_index, window):
+    """ Return a stream with the XML document in the open file infile,
+        reduced to the messages in the given window (plus at most a stride of
+        messages on either side), as located by the seek_index
+    """
+    (begin, end) = seek_index.byte_range(*window)
+    infile.seek(0)
+    parts = [infile.read(seek_index.header_end)]
+    infile.seek(begin)
+    parts.append(infile.read(end - begin))
+    infile.seek(seek_index.body_end)
+    parts.append(infile.read())
+    return StringIO(''.join(parts))
+
+def _escape(data):
+    """ Escape '&', '<', and '>' in a string of data, like
+        xml.sax.saxutils.escape (which is not imported, because it takes
+        a lot of time to load)
+    """
+    return data.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;")
+
+def _quoteattr(data):
+    """ Escape and quote an attribute value, like xml.sax.saxutils.quoteattr
+    """
+    data = _escape(data).replace("\n", "&#10;").replace("\r", "&#13;")\
+           .replace("\t", "&#9;")
+    if '"' in data:
+        if "'" in data:
+            return '"%s"' % data.replace('"', "&quot;")
+        return "'%s'" % data
+    return '"%s"' % data
+
+def _unicode_or_none(value):
+    """ Convert an XML attribute value to unicode, keeping None """
+    if value is None:
+        return None
+    return unicode(value)
+
+
+class Message(object):
     """
     Message that is part of a conversation. A message is characterized by the
     'time', 'sender', and 'text', as explained inthe documentation of the
     constructor.
     """
+    __slots__ = ('time', 'sender', 'text')
     def __init__(self, time=None, sender=None, text=None):
         """ Initialize a message with the given time, sender, and text.
             'time' is the time at wich the message was received in epoch
@@ -153,13 +380,19 @@ class Message:
         self.time = time
         self.sender = sender
         self.text = text
+    def __getstate__(self):
+        """ Return state for pickling (required because of __slots__) """
+        return (self.time, self.sender, self.text)
+    def __setstate__(self, state):
+        """ Restore state from pickling """
+        (self.time, self.sender, self.text) = state
     def to_xml(self, timezone):
         """ Return a UTF-8 encoded string containing the message """
         return "<message time=%s sender=%s>%s</message>" % (
-        saxutils.quoteattr( IMLogConvert.Time.tz_strftime(
-          '%a %d %b %Y %H:%M:%S', self.time, timezone, append_offset=False)),
-        saxutils.quoteattr(self.sender).encode('utf-8'),
-        saxutils.escape(self.text).encode('utf-8') )
+        _quoteattr( IMLogConvert.Time.CONVERSATION_CODEC.format(
+          self.time, timezone, append_offset=False)),
+        _quoteattr(self.sender).encode('utf-8'),
+        _escape(self.text).encode('utf-8') )
 
 class StatusMessage(Message):
     """
@@ -167,80 +400,236 @@ class StatusMessage(Message):
     'time', and 'text', but no 'sender' as explained in the documentation of
     the constructor.
     """
+    __slots__ = ()
     def __init__(self, time=None, text=None):
         """ Initialize a message with the given time and text.  'time' is the
              time at wich the message was received in epoch seconds. 'text' is
              a unicode string containing the content of the status message.
         """
-        Message.__init__(self, time=time, text=text)
         self.time = time
         self.text = text
-        del self.sender
+    def __getstate__(self):
+        """ Return state for pickling (required because of __slots__) """
+        return (self.time, self.text)
+    def __setstate__(self, state):
+        """ Restore state from pickling """
+        (self.time, self.text) = state
     def to_xml(self, timezone):
         """ Return a UTF-8 encoded string containing the message """
         return "<status time=%s>%s</status>" % (
-        saxutils.quoteattr( IMLogConvert.Time.tz_strftime(
-          '%a %d %b %Y %H:%M:%S', self.time, timezone, append_offset=False)),
-        saxutils.escape(self.text).encode('utf-8') )
+        _quoteattr( IMLogConvert.Time.CONVERSATION_CODEC.format(
+          self.time, timezone, append_offset=False)),
+        _escape(self.text).encode('utf-8') )
 
-class ConversationContentHandler(ContentHandler):
+class MessageStore:
+    """ Compact replacement for the list of messages of a Conversation. The
+        times of all messages are stored in a packed array of doubles, the
+        senders and texts in plain lists. The store supports the list
+        operations that are used on Conversation.messages (append, extend,
+        len, indexing, slicing, and iteration).  Messages are created when
+        they are accessed, so changes to a message that was taken from the
+        store must be written back by item assignment, e.g.
+        store[-1] = message
+    """
+    def __init__(self, messages=()):
+        """ Initialize the store with the given messages """
+        self.times = array('d')
+        self.senders = []
+        self.texts = []
+        self.extend(messages)
+    def append(self, message):
+        """ Append a Message or StatusMessage """
+        self.times.append(message.time)
+        if isinstance(message, StatusMessage):
+            self.senders.append(_STATUS)
+        else:
+            self.senders.append(intern_name(message.sender))
+        self.texts.append(message.text)
+    def extend(self, messages):
+        """ Append all the given messages """
+        for message in messages:
+            self.append(message)
+    def __len__(self):
+        """ Return the number of messages """
+        return len(self.times)
+    def __getitem__(self, index):
+        """ Return the message at the given index, or a list of messages for
+            a slice
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        sender = self.senders[index]
+        if sender is _STATUS:
+            return StatusMessage(self.times[index], self.texts[index])
+        return Message(self.times[index], sender, self.texts[index])
+    def __setitem__(self, index, message):
+        """ Replace the message at the given index """
+        self.times[index] = message.time
+        if isinstance(message, StatusMessage):
+            self.senders[index] = _STATUS
+        else:
+            self.senders[index] = intern_name(message.sender)
+        self.texts[index] = message.text
+    def __iter__(self):
+        """ Iterate over all messages """
+        for index in xrange(len(self.times)):
+            yield self[index]
+    def __getstate__(self):
+        """ Return state for pickling. The status placeholder is a module
+            level object, which does not survive pickling, so the status
+            messages are stored as a list of their indices.
+        """
+        senders = []
+        statuses = []
+        for (index, sender) in enumerate(self.senders):
+            if sender is _STATUS:
+                senders.append(None)
+                statuses.append(index)
+            else:
+                senders.append(sender)
+        return (self.times, senders, self.texts, statuses)
+    def __setstate__(self, state):
+        """ Restore state from pickling """
+        (self.times, senders, self.texts, statuses) = state
+        self.senders = [intern_name(sender) for sender in senders]
+        for index in statuses:
+            self.senders[index] = _STATUS
+
+# Placeholder sender for status messages in a MessageStore
+_STATUS = object()
+
+
+# Interned sender/alias names
+_names = {}
+
+def intern_name(name):
+    """ Return a canonical instance of the (unicode) string 'name', so that
+        equal names that occur in many messages share the same object.
+        Unlike the builtin intern, this also works for unicode strings.
+    """
+    try:
+        return _names[name]
+    except KeyError:
+        _names[name] = name
+        return name
+    except TypeError:
+        # unhashable, just return as is
+        return name
+
+
+class ConversationContentHandler:
     """ ContentHandler for XML Parser. Construct a Conversation from XML """
     def __init__(self, conversation):
         """Initialize parser state variables """
         self.conversation = conversation
         self.open_element = ""
         self.buffer = {}
+        # text chunks of the open element, joined when the element closes
+        self.chunks = None
+        self.codec = IMLogConvert.Time.CONVERSATION_CODEC
+        self._start_handlers = {
+            "message": self._start_message,
+            "status": self._start_message,
+            "participant": self._start_participant,
+            "conversation": self._start_conversation }
+        self._end_handlers = {
+            "message": self._end_message,
+            "status": self._end_status,
+            "participant": self._end_participant }
     def startElement(self, name, attrs):
         """Hook for opening XML tags """
-        if name == "participant":
-            self.open_element = name
-            self.buffer['alias'] = attrs.get("alias", None)
-            self.buffer['participant'] = ''
-        if name == "conversation":
-            self.conversation.service = attrs.get("service", None)
-            self.conversation.account = attrs.get("account", None)
-            self.conversation.timezone = attrs.get("timezone", None)
-            self.conversation.start_time = IMLogConvert.Time.tz_strpmktime(
-                    attrs.get("start_time", None), '%a %d %b %Y %H:%M:%S', 
-                    self.conversation.timezone)
-        if name == "message":
-            self.open_element = name
-            self.buffer['time'] = attrs.get("time", None)
-            self.buffer['sender'] = attrs.get("sender", None)
-            self.buffer['text'] = ''
-        if name == "status":
-            self.open_element = name
-            self.buffer['time'] = attrs.get("time", None)
-            self.buffer['text'] = ''
+        handler = self._start_handlers.get(name)
+        if handler is not None:
+            handler(name, attrs)
     def characters(self, content):
         """Hook for XML text data """
-        if self.open_element == "participant":
-            self.buffer['participant'] += content.strip()
-        if self.open_element == "message":
-            self.buffer['text'] += content
-        if self.open_element == "status":
-            self.buffer['text'] += content
+        if self.chunks is not None:
+            self.chunks.append(content)
     def endElement(self, name):
         """Hook for closing XML tags """
-        if name == "participant":
-            participant = self.buffer['participant'].strip()
-            self.conversation.participants[participant] = self.buffer['alias']
-            self.open_element = ""
-        if name == "message":
-            text = self.buffer['text']
-            time = IMLogConvert.Time.tz_strpmktime(
-                    self.buffer['time'], '%a %d %b %Y %H:%M:%S', 
-                    self.conversation.timezone)
-            sender = self.buffer['sender']
-            message = Message(time, sender, text)
-            self.conversation.messages.append(message)
-            self.open_element = ""
-        if name == "status":
-            text = self.buffer['text']
-            time = IMLogConvert.Time.tz_strpmktime(
-                    self.buffer['time'], '%a %d %b %Y %H:%M:%S', 
-                    self.conversation.timezone)
-            message = StatusMessage(time, text)
-            self.conversation.messages.append(message)
-            self.open_element = ""
+        handler = self._end_handlers.get(name)
+        if handler is not None:
+            handler()
+    def _start_conversation(self, name, attrs):
+        """Hook for opening <conversation> """
+        self.conversation.service = attrs.get("service", None)
+        self.conversation.account = attrs.get("account", None)
+        self.conversation.timezone = attrs.get("timezone", None)
+        self.conversation.start_time = self.codec.parse(
+                attrs.get("start_time", None), self.conversation.timezone)
+    def _start_participant(self, name, attrs):
+        """Hook for opening <participant> """
+        self.open_element = name
+        self.buffer['alias'] = attrs.get("alias", None)
+        self.chunks = []
+    def _start_message(self, name, attrs):
+        """Hook for opening <message> and <status> """
+        self.open_element = name
+        self.buffer['time'] = attrs.get("time", None)
+        self.buffer['sender'] = attrs.get("sender", None)
+        self.chunks = []
+    def _end_participant(self):
+        """Hook for closing <participant> """
+        participant = u''.join(self.chunks).strip()
+        self.conversation.participants[intern_name(participant)] \
+        = intern_name(self.buffer['alias'])
+        self.open_element = ""
+        self.chunks = None
+    def _end_message(self):
+        """Hook for closing <message> """
+        text = u''.join(self.chunks)
+        time = self.codec.parse(self.buffer['time'],
+                                self.conversation.timezone)
+        sender = intern_name(self.buffer['sender'])
+        message = Message(time, sender, text)
+        self.conversation.messages.append(message)
+        self.open_element = ""
+        self.chunks = None
+    def _end_status(self):
+        """Hook for closing <status> """
+        text = u''.join(self.chunks)
+        time = self.codec.parse(self.buffer['time'],
+                                self.conversation.timezone)
+        message = StatusMessage(time, text)
+        self.conversation.messages.append(message)
+        self.open_element = ""
+        self.chunks = None
 
+
+def expat_parse(handler, filename_or_stream):
+    """ Feed the XML in filename_or_stream to the ContentHandler 'handler',
+        using xml.parsers.expat directly instead of xml.sax. Only the
+        startElement, endElement and characters hooks of the handler are
+        called; attributes are passed as a plain dictionary. Adjacent text is
+        delivered in a single characters call where possible.
+    """
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = handler.startElement
+    parser.EndElementHandler = handler.endElement
+    parser.CharacterDataHandler = handler.characters
+    if isinstance(filename_or_stream, basestring):
+        stream = open(filename_or_stream, 'rb')
+        try:
+            parser.ParseFile(stream)
+        finally:
+            stream.close()
+    else:
+        parser.ParseFile(filename_or_stream)
+
+def sax_parse(handler, source):
+    """ Feed the XML in source (a filename, stream or
+        xml.sax.xmlreader.InputSource) to the ContentHandler 'handler', using
+        xml.sax. Like in expat_parse, only the startElement, endElement and
+        characters hooks of the handler are called. xml.sax is only imported
+        here, as most input is parsed with expat_parse.
+    """
+    from xml.sax import make_parser
+    from xml.sax.handler import ContentHandler
+    sax_handler = ContentHandler()
+    sax_handler.startElement = handler.startElement
+    sax_handler.endElement = handler.endElement
+    sax_handler.characters = handler.characters
+    parser = make_parser()
+    parser.setContentHandler(sax_handler)
+    parser.parse(source)
@@ -0,0 +1,280 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains statistics about the conversations in a corpus
+(message counts per contact, activity by hour and weekday, message lengths),
+which are collected in a single pass over the logs, and can be computed in
+parallel and merged
+"""
+from IMLogConvert.Conversation import Conversation
+import IMLogConvert.Time
+import IMLogConvert.BatchConverter
+import multiprocessing
+import time
+import json
+import csv
+
+_weekday_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_csv_fields = ['service', 'account', 'contact', 'conversations', 'messages',
+               'sent', 'received', 'status_messages', 'first', 'last']
+
+
+class CorpusStatistics:
+    """ Mergeable statistics of a corpus of conversations. 'contacts' maps
+        (service, account, contact) to a ContactStatistics object, 'hours'
+        and 'weekdays' are the number of messages in every hour of the day
+        and on every weekday (Monday first), in the local time of the
+        conversation. 'lengths' is a histogram of the message lengths in
+        characters: lengths[i] is the number of messages with a length
+        that has i binary digits (0, 1, 2-3, 4-7, ...). 'errors' is a list of
+        tuples (filename, error) of logs that could not be read.
+    """
+    def __init__(self):
+        """ Initialize empty statistics """
+        self.contacts = {}
+        self.hours = [0] * 24
+        self.weekdays = [0] * 7
+        self.lengths = []
+        self.messages = 0
+        self.characters = 0
+        self.files = 0
+        self.errors = []
+
+    def add(self, conversation, messages=None):
+        """ Add a conversation. The messages are taken from the iterable
+            'messages', or from conversation.messages if it is None, so that
+            e.g. the messages from Conversation.iter_xml can be counted
+            without loading the whole conversation.
+        """
+        if messages is None:
+            messages = conversation.messages
+        key = (conversation.service, conversation.account,
+               conversation.contact())
+        if not self.contacts.has_key(key):
+            self.contacts[key] = ContactStatistics()
+        contact_stats = self.contacts[key]
+        contact_stats.conversations += 1
+        account = conversation.account
+        offset_sec = IMLogConvert.Time.resolve_offset(
+                     conversation.timezone)[1]
+        hours = self.hours
+        weekdays = self.weekdays
+        lengths = self.lengths
+        count = sent = received = status_messages = characters = 0
+        first = last = None
+        for message in messages:
+            count += 1
+            local_seconds = int(message.time + offset_sec)
+            hours[(local_seconds // 3600) % 24] += 1
+            # 1 Jan 1970 was a Thursday
+            weekdays[(local_seconds // 86400 + 3) % 7] += 1
+            length = len(message.text)
+            characters += length
+            bucket = _bit_length(length)
+            while len(lengths) <= bucket:
+                lengths.append(0)
+            lengths[bucket] += 1
+            sender = getattr(message, 'sender', None)
+            if sender is None:
+                status_messages += 1
+            elif sender == account:
+                sent += 1
+            else:
+                received += 1
+            if first is None or message.time < first:
+                first = message.time
+            if last is None or message.time > last:
+                last = message.time
+        self.messages += count
+        self.characters += characters
+        contact_stats.add(count, sent, received, status_messages, first,
+                          last)
+
+    def add_file(self, filename, reader=None):
+        """ Read a log with reader (an object with a read(filename) method,
+            like AdiumReader or PidginTextReader) and add it. If reader is
+            None, the log is read as native XML, as a stream. Errors are
+            recorded in self.errors.
+        """
+        try:
+            if reader is None:
+                messages = Conversation().iter_xml(filename)
+                conversation = messages.next()
+                self.add(conversation, messages)
+            else:
+                self.add(reader.read(filename))
+        except (Exception, SystemExit), data:
+            self.errors.append((filename, "%s: %s" % (
+                                data.__class__.__name__, data)))
+        else:
+            self.files += 1
+
+    def merge(self, other):
+        """ Add the statistics from another CorpusStatistics object (e.g.
+            collected in a different process)
+        """
+        for (key, contact_stats) in other.contacts.items():
+            if not self.contacts.has_key(key):
+                self.contacts[key] = ContactStatistics()
+            self.contacts[key].merge(contact_stats)
+        for (hour, count) in enumerate(other.hours):
+            self.hours[hour] += count
+        for (weekday, count) in enumerate(other.weekdays):
+            self.weekdays[weekday] += count
+        while len(self.lengths) < len(other.lengths):
+            self.lengths.append(0)
+        for (bucket, count) in enumerate(other.lengths):
+            self.lengths[bucket] += count
+        self.messages += other.messages
+        self.characters += other.characters
+        self.files += other.files
+        self.errors.extend(other.errors)
+
+    def to_dict(self):
+        """ Return the statistics as a dictionary of plain data, as used for
+            the JSON output
+        """
+        contacts = []
+        for key in sorted(self.contacts.keys()):
+            contacts.append(self.contacts[key].to_dict(*key))
+        lengths = []
+        for (bucket, count) in enumerate(self.lengths):
+            lengths.append({'min': (1 << bucket) >> 1,
+                            'max': (1 << bucket) - 1, 'messages': count})
+        return {'files': self.files, 'messages': self.messages,
+                'characters': self.characters, 'contacts': contacts,
+                'hours': self.hours,
+                'weekdays': dict(zip(_weekday_names, self.weekdays)),
+                'lengths': lengths,
+                'errors': [{'file': filename, 'error': error}
+                           for (filename, error) in self.errors]}
+
+    def write_json(self, stream):
+        """ Write the statistics as JSON to stream """
+        json.dump(self.to_dict(), stream, indent=2, sort_keys=True)
+
+    def write_csv(self, stream):
+        """ Write the statistics per contact as CSV (UTF-8) to stream """
+        writer = csv.writer(stream)
+        writer.writerow(_csv_fields)
+        for key in sorted(self.contacts.keys()):
+            row = self.contacts[key].to_dict(*key)
+            writer.writerow([unicode(row[field]).encode('utf-8')
+                             for field in _csv_fields])
+
+
+class ContactStatistics:
+    """ Statistics of the conversations with one contact: the number of
+        conversations, messages, messages sent and received by the account,
+        status messages, and the times of the first and last message
+    """
+    def __init__(self):
+        """ Initialize empty statistics """
+        self.conversations = 0
+        self.messages = 0
+        self.sent = 0
+        self.received = 0
+        self.status_messages = 0
+        self.first = None
+        self.last = None
+
+    def add(self, messages, sent, received, status_messages, first, last):
+        """ Add counts, and the times of the first and last message (which
+            may be None)
+        """
+        self.messages += messages
+        self.sent += sent
+        self.received += received
+        self.status_messages += status_messages
+        if first is not None and (self.first is None or first < self.first):
+            self.first = first
+        if last is not None and (self.last is None or last > self.last):
+            self.last = last
+
+    def merge(self, other):
+        """ Add the statistics from another ContactStatistics object """
+        self.conversations += other.conversations
+        self.add(other.messages, other.sent, other.received,
+                 other.status_messages, other.first, other.last)
+
+    def to_dict(self, service, account, contact):
+        """ Return the statistics as a dictionary, with the first and last
+            time as UTC time stamps
+        """
+        return {'service': service, 'account': account, 'contact': contact,
+                'conversations': self.conversations,
+                'messages': self.messages, 'sent': self.sent,
+                'received': self.received,
+                'status_messages': self.status_messages,
+                'first': _utc_time(self.first), 'last': _utc_time(self.last)}
+
+
+def collect(filenames, reader=None, processes=None, chunksize=16):
+    """ Return the CorpusStatistics for the given log files, read with
+        reader (see CorpusStatistics.add_file). The files are distributed
+        over a pool of 'processes' worker processes (defaulting to the number
+        of CPUs), each of which collects statistics for a chunk of
+        'chunksize' files at a time; the results are merged in the current
+        process. With processes=1, everything is done in the current
+        process.
+    """
+    result = CorpusStatistics()
+    filenames = list(filenames)
+    if processes == 1:
+        for filename in filenames:
+            result.add_file(filename, reader)
+        return result
+    reader = IMLogConvert.BatchConverter.raising_reader(reader)
+    chunks = [(filenames[i:i+chunksize], reader)
+              for i in xrange(0, len(filenames), chunksize)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        for partial in pool.imap_unordered(_collect_chunk, chunks):
+            result.merge(partial)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return result
+
+def _collect_chunk(chunk):
+    """ Return the CorpusStatistics for a tuple (filenames, reader) """
+    (filenames, reader) = chunk
+    result = CorpusStatistics()
+    for filename in filenames:
+        result.add_file(filename, reader)
+    return result
+
+def _bit_length(value):
+    """ Return the number of binary digits of a non-negative integer """
+    length = 0
+    while value:
+        value >>= 1
+        length += 1
+    return length
+
+def _utc_time(epoch_seconds):
+    """ Return epoch_seconds as 'YYYY-MM-DD HH:MM:SS' in UTC, or '' for None
+    """
+    if epoch_seconds is None:
+        return ''
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch_seconds))
@@ -0,0 +1,244 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a full-text index of converted conversations, so that
+messages can be found without parsing the logs again
+"""
+import sqlite3
+import re
+import os
+
+_word_pattern = re.compile(r'\w+', re.UNICODE)
+
+class Index:
+    """ Inverted index of the text of all messages, stored in an sqlite
+        database. For every term, the index holds postings (conversation id,
+        message ordinal), where the ordinal is the position of the message in
+        conversation.messages. The time and sender of every message, and the
+        service, account and contact of every conversation are stored as
+        facets that searches can be restricted to.
+    """
+    default_filename = '.imlogconvert-index.sqlite'
+
+    def __init__(self, filename):
+        """ Open (or create) the index database 'filename' """
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS conversations (
+                id INTEGER PRIMARY KEY, source TEXT UNIQUE, output TEXT,
+                service TEXT, account TEXT, contact TEXT, start_time REAL);
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation INTEGER, ordinal INTEGER, time REAL,
+                sender TEXT, PRIMARY KEY (conversation, ordinal))
+                WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY, term TEXT UNIQUE, count INTEGER);
+            CREATE TABLE IF NOT EXISTS postings (
+                term INTEGER, conversation INTEGER, ordinal INTEGER,
+                PRIMARY KEY (term, conversation, ordinal)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_conversation
+                ON postings (conversation);
+            CREATE INDEX IF NOT EXISTS messages_sender
+                ON messages (sender, time);
+            CREATE INDEX IF NOT EXISTS conversations_account
+                ON conversations (account);""")
+        self.db.commit()
+        self._term_ids = None
+
+    def add(self, conversation, source, output=None):
+        """ Index the conversation that was read from the file 'source' and
+            written to 'output'. An earlier entry for 'source' is replaced.
+        """
+        self.add_entries(index_entries(conversation), source, output)
+
+    def add_entries(self, entries, source, output=None):
+        """ Index a conversation given as the result of index_entries(). This
+            allows the (expensive) tokenization to happen in a different
+            process than the writing of the index.
+        """
+        (service, account, contact, start_time, messages) = entries
+        source = os.path.abspath(source)
+        if output is not None:
+            output = os.path.abspath(output)
+        self.remove(source)
+        cursor = self.db.execute(
+                 "INSERT INTO conversations VALUES (NULL,?,?,?,?,?,?)",
+                 (source, output, service, account, contact, start_time))
+        conversation_id = cursor.lastrowid
+        term_ids = self._get_term_ids()
+        counts = {}
+        postings = []
+        for (ordinal, (msg_time, sender, terms)) in enumerate(messages):
+            for term in terms:
+                term_id = term_ids.get(term)
+                if term_id is None:
+                    term_id = self.db.execute(
+                              "INSERT INTO terms VALUES (NULL,?,0)",
+                              (term,)).lastrowid
+                    term_ids[term] = term_id
+                counts[term_id] = counts.get(term_id, 0) + 1
+                postings.append((term_id, conversation_id, ordinal))
+        self.db.executemany("INSERT INTO messages VALUES (?,?,?,?)",
+                            [(conversation_id, ordinal, msg_time, sender)
+                             for (ordinal, (msg_time, sender, terms))
+                             in enumerate(messages)])
+        self.db.executemany("INSERT INTO postings VALUES (?,?,?)", postings)
+        self.db.executemany("UPDATE terms SET count = count + ? WHERE id = ?",
+                            [(count, term_id)
+                             for (term_id, count) in counts.items()])
+
+    def remove(self, source):
+        """ Remove the conversation read from 'source' from the index """
+        source = os.path.abspath(source)
+        row = self.db.execute("SELECT id FROM conversations WHERE source = ?",
+                              (source,)).fetchone()
+        if row is None:
+            return
+        conversation_id = row[0]
+        self.db.execute("""UPDATE terms SET count = count - (
+                           SELECT COUNT(*) FROM postings WHERE term = terms.id
+                           AND conversation = ?) WHERE id IN (
+                           SELECT term FROM postings WHERE conversation = ?)""",
+                        (conversation_id, conversation_id))
+        self.db.execute("DELETE FROM postings WHERE conversation = ?",
+                        (conversation_id,))
+        self.db.execute("DELETE FROM messages WHERE conversation = ?",
+                        (conversation_id,))
+        self.db.execute("DELETE FROM conversations WHERE id = ?",
+                        (conversation_id,))
+
+    def remove_missing(self):
+        """ Remove all conversations whose source no longer exists. Return
+            the list of removed sources.
+        """
+        removed = []
+        for (source,) in self.db.execute(
+                         "SELECT source FROM conversations").fetchall():
+            if not os.path.exists(source):
+                self.remove(source)
+                removed.append(source)
+        return removed
+
+    def search(self, query, sender=None, account=None, contact=None,
+               start=None, end=None, limit=None):
+        """ Return a list of Hit objects for all messages that contain every
+            term in 'query' (matching is case-insensitive, on whole words),
+            ordered by time. The search can be restricted to messages from a
+            given sender (username), to conversations of a given account or
+            with a given contact, and to messages with start <= time < end
+            (in epoch seconds).
+        """
+        term_ids = []
+        for term in set(tokenize(query)):
+            row = self.db.execute("SELECT id, count FROM terms WHERE term = ?",
+                                  (term,)).fetchone()
+            if row is None or row[1] == 0:
+                return []
+            term_ids.append((row[1], row[0]))
+        if len(term_ids) == 0:
+            return []
+        # start from the rarest term, check the others for each posting
+        term_ids.sort()
+        sql = ["""SELECT c.source, c.output, p.ordinal, m.time, m.sender,
+                  c.service, c.account, c.contact
+                  FROM postings p
+                  JOIN messages m ON m.conversation = p.conversation
+                                 AND m.ordinal = p.ordinal
+                  JOIN conversations c ON c.id = p.conversation
+                  WHERE p.term = ?"""]
+        args = [term_ids[0][1]]
+        for (_, term_id) in term_ids[1:]:
+            sql.append("""AND EXISTS (SELECT 1 FROM postings q WHERE
+                          q.term = ? AND q.conversation = p.conversation
+                          AND q.ordinal = p.ordinal)""")
+            args.append(term_id)
+        for (condition, value) in [("m.sender = ?", sender),
+                                   ("c.account = ?", account),
+                                   ("c.contact = ?", contact),
+                                   ("m.time >= ?", start),
+                                   ("m.time < ?", end)]:
+            if value is not None:
+                sql.append("AND " + condition)
+                args.append(value)
+        sql.append("ORDER BY m.time")
+        if limit is not None:
+            sql.append("LIMIT %i" % limit)
+        return [Hit(*row) for row in self.db.execute("\n".join(sql), args)]
+
+    def commit(self):
+        """ Write all pending changes to the database """
+        self.db.commit()
+
+    def close(self):
+        """ Commit and close the index database """
+        self.db.commit()
+        self.db.close()
+
+    def _get_term_ids(self):
+        """ Return the dictionary term -> term id, loading it on first use """
+        if self._term_ids is None:
+            self._term_ids = dict(self.db.execute(
+                                  "SELECT term, id FROM terms").fetchall())
+        return self._term_ids
+
+
+class Hit:
+    """ Search result: the message with index 'ordinal' in the conversation
+        read from 'source' and written to 'output'. 'sender' is None for
+        status messages.
+    """
+    def __init__(self, source, output, ordinal, time, sender, service,
+                 account, contact):
+        """ Initialize the hit """
+        self.source = source
+        self.output = output
+        self.ordinal = ordinal
+        self.time = time
+        self.sender = sender
+        self.service = service
+        self.account = account
+        self.contact = contact
+
+    def __repr__(self):
+        """ Return a printable representation """
+        return "<Hit %s #%i>" % (self.output or self.source, self.ordinal)
+
+
+def tokenize(text):
+    """ Return the list of lowercase words in text """
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    return _word_pattern.findall(text.lower())
+
+def index_entries(conversation):
+    """ Return the data from the conversation that goes into the index, as a
+        tuple (service, account, contact, start_time, messages), where
+        messages is a list of tuples (time, sender, terms) with the distinct
+        terms of every message
+    """
+    contact = conversation.contact()
+    messages = []
+    for message in conversation.messages:
+        messages.append((message.time, getattr(message, 'sender', None),
+                         tuple(set(tokenize(message.text)))))
+    return (conversation.service, conversation.account, contact,
+            conversation.start_time, messages)
@@ -0,0 +1,182 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a class for keeping track of which source logs have
+already been converted, so that repeated conversions can skip unchanged files
+"""
+import sqlite3
+import hashlib
+import os
+
+class Manifest:
+    """ Persistent record of converted files, stored in an sqlite database.
+        For every source file, the manifest stores its mtime, size and
+        (optionally) a SHA-1 hash of its content, together with the name of
+        the output file that was produced from it.
+    """
+    default_filename = '.imlogconvert-manifest.sqlite'
+
+    def __init__(self, filename, use_hash=False, commit_interval=1000):
+        """ Open (or create) the manifest database 'filename'.
+            If 'use_hash' is True, a source file whose mtime changed is only
+            considered changed if its content hash changed as well.
+            Changes are committed every commit_interval records, and in
+            commit() and close().
+        """
+        self.filename = filename
+        self.use_hash = use_hash
+        self.commit_interval = commit_interval
+        self.db = sqlite3.connect(filename)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS sources (
+                           source TEXT PRIMARY KEY, mtime REAL,
+                           size INTEGER, hash TEXT, output TEXT)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS sources_output
+                           ON sources (output)""")
+        self.db.commit()
+        self._pending = {}
+        self._uncommitted = 0
+
+    def changed(self, source):
+        """ Return True if 'source' is not in the manifest, or if it was
+            modified since it was recorded. A source that cannot be read
+            (e.g. because it does not exist) is reported as changed, so that
+            converting it reports the error.
+        """
+        source = os.path.abspath(source)
+        try:
+            stat = os.stat(source)
+        except OSError:
+            return True
+        row = self.db.execute(
+              "SELECT mtime, size, hash FROM sources WHERE source = ?",
+              (source,)).fetchone()
+        if row is not None and row[0] == stat.st_mtime \
+        and row[1] == stat.st_size:
+            return False
+        content_hash = None
+        if self.use_hash:
+            try:
+                content_hash = file_hash(source)
+            except IOError:
+                return True
+        self._pending[source] = (stat.st_mtime, stat.st_size, content_hash)
+        if row is None or row[1] != stat.st_size:
+            return True
+        if content_hash is not None and content_hash == row[2]:
+            # only touched: remember new mtime, but don't convert again
+            self.db.execute("UPDATE sources SET mtime = ? WHERE source = ?",
+                            (stat.st_mtime, source))
+            self._changed()
+            return False
+        return True
+
+    def output(self, source):
+        """ Return the output file recorded for 'source', or None """
+        row = self.db.execute("SELECT output FROM sources WHERE source = ?",
+                              (os.path.abspath(source),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def source(self, output):
+        """ Return the source recorded for the output file 'output', or None
+        """
+        row = self.db.execute("SELECT source FROM sources WHERE output = ?",
+                              (os.path.abspath(output),)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def record(self, source, output):
+        """ Record that 'source' was converted to 'output'. If 'source'
+            previously produced a different output file that no other source
+            maps to, that file is deleted.
+        """
+        source = os.path.abspath(source)
+        output = os.path.abspath(output)
+        if self._pending.has_key(source):
+            (mtime, size, content_hash) = self._pending.pop(source)
+        else:
+            stat = os.stat(source)
+            (mtime, size) = (stat.st_mtime, stat.st_size)
+            content_hash = None
+            if self.use_hash:
+                content_hash = file_hash(source)
+        old_output = self.output(source)
+        self.db.execute("INSERT OR REPLACE INTO sources VALUES (?,?,?,?,?)",
+                        (source, mtime, size, content_hash, output))
+        if old_output is not None and old_output != output:
+            self._remove_output(old_output)
+        self._changed()
+
+    def remove_missing(self):
+        """ Forget all sources that no longer exist, and delete their output
+            files. Return the list of deleted output files.
+        """
+        removed = []
+        rows = self.db.execute("SELECT source, output FROM sources").fetchall()
+        for (source, output) in rows:
+            if not os.path.exists(source):
+                self.db.execute("DELETE FROM sources WHERE source = ?",
+                                (source,))
+                if self._remove_output(output):
+                    removed.append(output)
+        self.commit()
+        return removed
+
+    def _remove_output(self, output):
+        """ Delete the file 'output' unless it is still recorded as the output
+            of some source. Return True if the file was deleted.
+        """
+        row = self.db.execute("SELECT 1 FROM sources WHERE output = ?",
+                              (output,)).fetchone()
+        if row is None and os.path.exists(output):
+            os.remove(output)
+            return True
+        return False
+
+    def _changed(self):
+        """ Count a change, and commit every commit_interval changes """
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        """ Write all changes to the database """
+        self.db.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """ Commit and close the manifest database """
+        self.commit()
+        self.db.close()
+
+
+def file_hash(filename, blocksize=1<<20):
+    """ Return the SHA-1 hex digest of the content of filename """
+    digest = hashlib.sha1()
+    fh = open(filename, 'rb')
+    block = fh.read(blocksize)
+    while block:
+        digest.update(block)
+        block = fh.read(blocksize)
+    fh.close()
+    return digest.hexdigest()
@@ -0,0 +1,227 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a class for merging overlapping conversations that were
+logged by more than one client, dropping the duplicate messages
+"""
+from IMLogConvert.Conversation import Conversation
+from collections import deque
+import heapq
+import re
+
+_whitespace_pattern = re.compile(r'\s+', re.UNICODE)
+
+
+class Merger:
+    """ Merger of conversations from different sources (e.g. Adium and Pidgin
+        logs of the same chats). Conversations are grouped by service,
+        account and contact. Within a group, conversations whose time spans
+        overlap (up to 'tolerance' seconds) are merged into one: their
+        messages are combined by a k-way merge on time, and a message is
+        dropped as a duplicate if a message with the same sender and
+        normalized text (see normalize_text) from a different source lies
+        within 'tolerance' seconds. Repeated messages within one source are
+        never dropped.
+
+        Sorting the conversations and the heap merge of their messages take
+        O(n log n) time. The merged conversations are produced one at a time
+        by merge(), which only holds the messages of the conversations being
+        merged, and the duplicate candidates of the last 'tolerance' seconds.
+        Conversations given to add() are held in memory until they are
+        merged; for large corpora, the logs should be given to add_file()
+        instead, which only keeps the group and time span of every log, and
+        reads it again when it is merged.
+    """
+    def __init__(self, tolerance=2.0, reader=None):
+        """ Initialize an empty merger. 'reader' is used by add_file to read
+            logs: an object with a read(filename) method, like AdiumReader or
+            PidginTextReader, or None for native XML (which is then read as
+            a stream, see Conversation.iter_xml).
+        """
+        self.tolerance = tolerance
+        self.reader = reader
+        self.duplicates = 0
+        self._groups = {}
+        self._serial = 0
+
+    def add(self, conversation):
+        """ Add a conversation to be merged """
+        if len(conversation.messages) > 0:
+            end_time = conversation.messages[-1].time
+        else:
+            end_time = conversation.start_time
+        self._add(group_key(conversation), conversation.start_time, end_time,
+                  conversation)
+
+    def add_file(self, filename):
+        """ Add the conversation in the log file filename, read with
+            self.reader. Only its group and time span are kept; the log is
+            read again when it is merged.
+        """
+        if self.reader is None:
+            messages = Conversation().iter_xml(filename)
+            conversation = messages.next()
+            end_time = conversation.start_time
+            for message in messages:
+                end_time = message.time
+        else:
+            conversation = self.reader.read(filename)
+            if len(conversation.messages) > 0:
+                end_time = conversation.messages[-1].time
+            else:
+                end_time = conversation.start_time
+        self._add(group_key(conversation), conversation.start_time, end_time,
+                  filename)
+
+    def _add(self, key, start_time, end_time, source):
+        """ Add a Conversation or the name of a log file ('source') to its
+            group
+        """
+        self._groups.setdefault(key, []).append(
+            (start_time, self._serial, end_time, source))
+        self._serial += 1
+
+    def merge(self):
+        """ Yield the merged conversations, ordered by group, and by start
+            time within each group. The added conversations are released as
+            they are merged.
+        """
+        for key in sorted(self._groups.keys()):
+            group = self._groups.pop(key)
+            group.sort()
+            cluster = []
+            cluster_end = None
+            for (start_time, _, end_time, source) in group:
+                if cluster and start_time > cluster_end + self.tolerance:
+                    yield self._merge_cluster(cluster)
+                    cluster = []
+                if not cluster or end_time > cluster_end:
+                    cluster_end = end_time
+                cluster.append(source)
+            if cluster:
+                yield self._merge_cluster(cluster)
+            del group
+
+    def _read(self, source, stream):
+        """ Return a tuple (conversation, messages) for an added Conversation
+            or log file. If 'stream' is True and the log is native XML, the
+            messages are an iterator that reads them one by one, and the
+            conversation has no messages.
+        """
+        if not isinstance(source, basestring):
+            return (source, source.messages)
+        if self.reader is not None:
+            conversation = self.reader.read(source)
+            return (conversation, conversation.messages)
+        if stream:
+            messages = Conversation().iter_xml(source)
+            return (messages.next(), messages)
+        conversation = Conversation()
+        conversation.from_xml(source, exit_on_error=False)
+        return (conversation, conversation.messages)
+
+    def _merge_cluster(self, cluster):
+        """ Return a single conversation from the overlapping conversations
+            (or log files) in 'cluster' (ordered by start time)
+        """
+        if len(cluster) == 1:
+            return self._read(cluster[0], False)[0]
+        cluster = [self._read(source, True) for source in cluster]
+        first = cluster[0][0]
+        result = Conversation(first.service, first.account, first.start_time,
+                              first.timezone)
+        for (conversation, messages) in cluster:
+            for (participant, alias) in conversation.participants.items():
+                if not result.participants.has_key(participant):
+                    result.participants[participant] = alias
+        streams = [_tagged(messages, source)
+                   for (source, (conversation, messages))
+                   in enumerate(cluster)]
+        tolerance = self.tolerance
+        recent = {}         # (sender, text) -> list of [time, sources]
+        expiry = deque()    # (time, (sender, text)) in order of time
+        messages = result.messages
+        for (time, source, ordinal, message) in heapq.merge(*streams):
+            while expiry and expiry[0][0] < time - tolerance:
+                old_key = expiry.popleft()[1]
+                entries = recent[old_key]
+                del entries[0]
+                if len(entries) == 0:
+                    del recent[old_key]
+            sender = getattr(message, 'sender', None)
+            if sender is not None:
+                sender = sender.lower()
+            key = (sender, normalize_text(message.text))
+            duplicate = False
+            for entry in recent.get(key, ()):
+                if source not in entry[1]:
+                    entry[1].add(source)
+                    duplicate = True
+                    break
+            if duplicate:
+                self.duplicates += 1
+                continue
+            recent.setdefault(key, []).append([time, set([source])])
+            expiry.append((time, key))
+            messages.append(message)
+        return result
+
+
+def merge_conversations(conversations, tolerance=2.0):
+    """ Yield the merged conversations for an iterable of conversations
+        (see Merger). All conversations are held in memory until they are
+        merged; see merge_files for large corpora.
+    """
+    merger = Merger(tolerance)
+    for conversation in conversations:
+        merger.add(conversation)
+    return merger.merge()
+
+def merge_files(filenames, tolerance=2.0, reader=None):
+    """ Yield the merged conversations for the given log files, read with
+        reader (see Merger.add_file), holding only the logs of one cluster of
+        overlapping conversations in memory at a time
+    """
+    merger = Merger(tolerance, reader)
+    for filename in filenames:
+        merger.add_file(filename)
+    return merger.merge()
+
+def group_key(conversation):
+    """ Return the tuple (service, account, contact) that identifies the
+        conversations to be merged, with all names in lowercase
+    """
+    return (unicode(conversation.service or '').lower(),
+            unicode(conversation.account or '').lower(),
+            conversation.contact().lower())
+
+def normalize_text(text):
+    """ Return the text of a message in the form used to detect duplicates:
+        in lowercase, with runs of whitespace replaced by a single space
+    """
+    return _whitespace_pattern.sub(u' ', text).strip().lower()
+
+def _tagged(messages, source):
+    """ Yield tuples (time, source, ordinal, message) for the messages of
+        the conversation with index 'source' in a cluster
+    """
+    for (ordinal, message) in enumerate(messages):
+        yield (message.time, source, ordinal, message)
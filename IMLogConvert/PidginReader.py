@@ -23,14 +23,22 @@ This module contains a class for reading text format IM logs created by Pidgin
 (or libpurple in general)
 """
 from IMLogConvert.Conversation import Conversation, Message, StatusMessage
+from IMLogConvert.Conversation import intern_name
 import IMLogConvert.Time
+import IMLogConvert.Stats
+import IMLogConvert.SeekIndex
+import IMLogConvert.Compression
 import re
 import codecs
+import mmap
+import os
 
 
 class PidginTextReader:
     """ Reader for text format logs created by Pidgin
     """
+    parser_version = 1
+
     def __init__(self, aliases):
         """ Initialize the reader.
             'alias' is the alias of the person who created the log, as it
@@ -38,7 +46,15 @@ class PidginTextReader:
         """
         self.aliases = aliases
         self.encoding = 'utf-8'
+        self.use_mmap = False
         self.alias_replacements = {}
+        # if set to an IMLogConvert.Cache.ConversationCache, files are only
+        # parsed if they are not in the cache
+        self.cache = None
+        # line_pattern extended to whole lines (see _get_scan_pattern), and
+        # the line_pattern it was made from
+        self._scan_pattern = None
+        self._scan_line_pattern = None
         self.firstline_patterns = [
         re.compile(
         # Conversation with 345 at Mon 23 Jul 2006 03:59:08 PM on 123 (icq)
@@ -79,15 +95,17 @@ class PidginTextReader:
             \s+ on \s+ (?P<account>[^/]+)(/(?P<resource>[^()]+))? \s+
             \((?P<service>[^()]+)\)''', re.X)
         ]
-        self.msgline_pattern = re.compile(
+        # message lines "(time) alias: text" and status lines "(time) text"
+        # are matched in a single pass. If the 'alias' group does not match,
+        # the line is a status line
+        self.line_pattern = re.compile(
         r'''^\(   (\d{2}/\d{2}/\d{4}\s+)?
                   (?P<time>[0-9]{1,2}:[0-9]{2}:[0-9]{2} [ ]? (AM|PM)?)
             \)[ ]
-            (?P<alias>[^:]+):[ ] (?P<text>.*)''', re.X)
-        self.status_pattern = re.compile(
-        r'''^\(   (\d{2}/\d{2}/\d{4}\s+)?
-                  (?P<time>[0-9]{1,2}:[0-9]{2}:[0-9]{2} [ ]? (AM|PM)?)
-            \)[ ] (?P<text>.*)''', re.X)
+            ((?P<alias>[^:]+):[ ])? (?P<text>.*)''', re.X)
+        # messages from these "aliases" are really status messages
+        self.status_alias_pattern = re.compile(
+        r'The following message|TeXIM|Unable to send message|GaimTeX|OTR Error')
         self.date_patterns = [
                 r'%d %b %Y %H:%M:%S',    # 03 Apr 2008 23:10:54
                 r'%d %b %Y %I:%M:%S %p', # 23 Jul 2006 03:59:08 PM
@@ -95,13 +113,176 @@ class PidginTextReader:
                 r'%d.%m.%Y %H:%M:%S',    # 12.06.2004 20:04:59
                 r'%m/%d/%Y %I:%M:%S %p'  # 8/15/2007 10:55:37 PM
         ]
-    def read(self, filename):
-        """ Parse the contents of filename and create a conversation
+    def read(self, filename, window=None):
+        """ Parse the contents of filename and create a conversation.
+            Instead of a filename, an open stream of bytes may be given.
+            If self.use_mmap is True, the file is scanned as bytes in a
+            memory map instead of being decoded line by line (see read_mmap).
+            Compressed files (gzip, bzip2, xz) are decompressed on the fly.
+            If window is given as a tuple (start, end) of epoch seconds
+            (either of which may be None), only the messages with
+            start <= time < end are kept. If the file has a seek index (see
+            PidginTextWriter.seek_stride), only the part of the file that
+            contains these messages is parsed.
+            If self.cache is set, files are read from the cache if possible
+            (unless a seek index is used); the alias replacements are applied
+            afterwards.
+        """
+        conversation = None
+        if window is not None and isinstance(filename, basestring):
+            seek_index = IMLogConvert.SeekIndex.load(filename)
+            if seek_index is not None:
+                conversation = self._read_window(filename, seek_index, window)
+        if conversation is None:
+            if self.cache is not None and isinstance(filename, basestring):
+                conversation = self.cache.read(self, filename)
+            else:
+                conversation = self.parse(filename)
+            if window is not None:
+                conversation.messages = IMLogConvert.SeekIndex.in_window(
+                                        conversation.messages, window)
+        self._replace_aliases(conversation)
+        return conversation
+
+    def parse(self, filename):
+        """ Parse the contents of filename (or a stream) like read, but
+            without the cache, and without applying the alias replacements
+        """
+        source = IMLogConvert.Compression.open_input(filename)
+        if isinstance(filename, basestring):
+            name = filename
+        else:
+            name = getattr(filename, 'name', '<stream>')
+        if self.use_mmap and isinstance(source, file):
+            try:
+                conversation = self._read_mmap(source, name)
+            except:
+                source.close()
+                raise
+            if conversation is not None:
+                source.close()
+                return conversation
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('pidgin.parse')
+        fh = codecs.getreader(self.encoding)(source, errors='replace')
+        try:
+            firstline = fh.readline()
+            (conversation, contactname, clock) \
+            = self._read_firstline(firstline, name)
+            match = self._get_scan_pattern().match
+            continuation_lines = self._read_lines(conversation, contactname,
+                                 clock, (match(line) for line in fh), unicode)
+        finally:
+            fh.close()
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_read(conversation, filename, continuation_lines)
+        return conversation
+
+    def cache_key(self):
+        """ Return a string that identifies the parser and the settings that
+            affect its results, for the keys of
+            IMLogConvert.Cache.ConversationCache
+        """
+        return "PidginTextReader/%i:%r" % (self.parser_version,
+               (self.aliases, self.encoding,
+                [pattern.pattern for pattern in self.firstline_patterns],
+                self.line_pattern.pattern, self.status_alias_pattern.pattern,
+                self.date_patterns))
+
+    def read_mmap(self, filename):
+        """ Parse the contents of filename like read, but by memory-mapping
+            the file and matching the patterns against the raw bytes. Only
+            the text captured from each line is decoded. The result is
+            identical to that of read. If the file cannot be handled this way
+            (an encoding other than UTF-8/ASCII, line breaks other than
+            '\n' and '\r\n', or an empty file), None is returned.
+        """
+        fh = open(filename, 'rb')
+        try:
+            conversation = self._read_mmap(fh, filename)
+        finally:
+            fh.close()
+        if conversation is not None:
+            self._replace_aliases(conversation)
+        return conversation
+
+    def _read_mmap(self, fh, filename):
+        """ Implementation of read_mmap for the open file fh (which is left
+            open), without the alias replacements
         """
-        fh = codecs.open(filename, 'r', self.encoding, errors='replace')
+        if codecs.lookup(self.encoding).name not in ('utf-8', 'ascii'):
+            return None
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('pidgin.parse')
+        buffer = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # codecs would also break lines at these characters
+            if _other_linebreaks_pattern.search(buffer):
+                return None
+            encoding = self.encoding
+            def decode(data):
+                """ Decode bytes from the log """
+                return unicode(data, encoding, 'replace')
+            firstline = decode(buffer.readline())
+            (conversation, contactname, clock) \
+            = self._read_firstline(firstline, filename)
+            continuation_lines = self._read_lines(conversation, contactname,
+                                 clock, self._get_scan_pattern().finditer(
+                                 buffer, buffer.tell()), decode)
+        finally:
+            buffer.close()
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_read(conversation, filename, continuation_lines)
+        return conversation
+
+    def _read_window(self, filename, seek_index, window):
+        """ Parse the first line of filename, and the lines that
+            seek_index locates for the window. Return a conversation with the
+            messages in the window. The header (in particular the start time)
+            is the same as in a full read: the first message of the log,
+            which may move the start time (see _read_lines), is always
+            parsed as well.
+        """
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('pidgin.parse')
+        fh = open(filename, 'rb')
+        try:
+            firstline = unicode(fh.readline(), self.encoding, 'replace')
+            (conversation, contactname, clock) \
+            = self._read_firstline(firstline, filename)
+            (begin, end) = seek_index.byte_range(*window)
+            fh.seek(seek_index.header_end)
+            first_message = fh.readline()
+            begin = max(begin, seek_index.header_end + len(first_message))
+            fh.seek(begin)
+            data = unicode(first_message + fh.read(max(0, end - begin)),
+                           self.encoding, 'replace')
+        finally:
+            fh.close()
+        match = self._get_scan_pattern().match
+        continuation_lines = self._read_lines(conversation, contactname,
+                             clock, [match(line) for line
+                                     in data.splitlines(True)], unicode)
+        conversation.messages = IMLogConvert.SeekIndex.in_window(
+                                conversation.messages, window)
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_read(conversation, None, continuation_lines)
+        return conversation
 
-        # extract info from the first line
-        firstline = fh.readline()
+    def _read_firstline(self, firstline, filename):
+        """ Extract the information from the first line of a log. Return a
+            tuple (conversation, contactname, clock), where conversation is a
+            new Conversation without messages, and clock is the _DayClock
+            that calculates the times of the messages.
+        """
         start_time = None
         account = None
         service = None
@@ -120,9 +301,9 @@ class PidginTextReader:
             time_str = firstline_match.group('time').strip()
             start_time = None
             for date_pattern in self.date_patterns:
+                date_codec = IMLogConvert.Time.get_codec(date_pattern)
                 try:
-                    start_time = IMLogConvert.Time.tz_strpmktime(time_str, 
-                                 date_pattern, timezone)
+                    start_time = date_codec.parse(time_str, timezone)
                     used_date_pattern = date_pattern
                     break
                 except ValueError:
@@ -130,90 +311,159 @@ class PidginTextReader:
             if start_time is None:
                 raise ValueError("'%s' does not match any date pattern (%s)" 
                                  % (time_str, filename))
-            account = firstline_match.group('account')
+            account = intern_name(firstline_match.group('account'))
             service = firstline_match.group('service')
             date_day = firstline_match.group('date')
         else:
             raise ValueError(
             "First line in %s does not match the expected pattern" % filename)
-        contactname = firstline_match.group('contactname')
+        contactname = intern_name(firstline_match.group('contactname'))
         conversation = Conversation(service, account, start_time)
         conversation.participants[account] = self.aliases[0]
         conversation.participants[contactname] = contactname
         conversation.timezone = timezone
+        clock = _DayClock(date_day, used_date_pattern, time_str, start_time,
+                          timezone, filename)
+        return (conversation, contactname, clock)
 
-        # go through the individual messages
-        for line in fh:
-            msgline_match = self.msgline_pattern.match(line)
-            if msgline_match:
-                is_status = False
-                contactname_alias = msgline_match.group('alias')
-                contactname_alias = contactname_alias.replace(
-                ' <AUTO-REPLY>', '')
-                for substring in [
-                'The following message', 'TeXIM', 'Unable to send message', 
-                'GaimTeX', 'OTR Error']:
-                    if substring in contactname_alias:
-                        is_status = True
-                if not is_status:
-                    message = Message()
-                    time_str = date_day + ' ' + msgline_match.group('time')
-                    try:
-                        message.time = IMLogConvert.Time.tz_strpmktime(time_str,
-                                       used_date_pattern, timezone)
-                    except ValueError:
-                        raise ValueError(
-                        "'%s' does not match date pattern %s (%s)"
-                        % (time_str, used_date_pattern, filename))
-                    if message.time < conversation.start_time - 2*3600:
-                        message.time += 24*3600
-                    if message.time < conversation.start_time - 2:
-                        if len(conversation.messages) == 0:
-                            # time stamp on initial message trumps conversation
-                            conversation.start_time = message.time
-                        else:
-                            raise ValueError(
-                            "Nonsensical timestamp '%s' in %s" 
-                            % (msgline_match.group('time'), filename))
-                    if (msgline_match.group('alias') in self.aliases or
-                    msgline_match.group('alias') == account): 
-                        message.sender = account
-                    else:
-                        message.sender = contactname
-                        conversation.participants[contactname] \
-                        = contactname_alias
-                    message.text = unicode(msgline_match.group('text'))
-                    conversation.messages.append(message)
-                    continue
-            status_match = self.status_pattern.match(line)
-            if status_match:
-                message = StatusMessage()
-                time_str = date_day + ' ' + status_match.group('time')
+    def _get_scan_pattern(self):
+        """ Return self.line_pattern, extended to match every line of a log
+            (see _read_lines), compiled for multi-line matching
+        """
+        if self._scan_line_pattern is not self.line_pattern:
+            # every line that is not a message or status line is matched by
+            # 'rest' alone; the lookahead avoids an empty match at the end
+            self._scan_pattern = re.compile(r'(?=[\s\S])(?:%s)?(?P<rest>.*)\n?'
+                                 % self.line_pattern.pattern,
+                                 self.line_pattern.flags | re.M)
+            self._scan_line_pattern = self.line_pattern
+        return self._scan_pattern
+
+    def _read_lines(self, conversation, contactname, clock, matches, decode):
+        """ Add the messages of the log (without the first line) to the
+            conversation. 'matches' are the matches of the pattern returned
+            by _get_scan_pattern for every line of the log. The text of the
+            messages is converted to unicode with decode. Return the number
+            of continuation lines (lines that were appended to the previous
+            message).
+        """
+        continuation_lines = 0
+        filename = clock.filename
+        account = conversation.account
+        status_alias_pattern = self.status_alias_pattern
+        messages = conversation.messages
+        # alias in the log => (sender, alias of the contact); the sender is
+        # None for the "aliases" of status messages, the alias of the
+        # contact is None unless the sender is the contact
+        senders = {}
+        for line_match in matches:
+            (msg_time_str, alias, text) \
+            = line_match.group('time', 'alias', 'text')
+            if msg_time_str is None:
+                # fall-through: append to last message
+                messages[-1].text += "\n" + decode(line_match.group('rest'))
+                continuation_lines += 1
+                continue
+            sender = None
+            contactname_alias = None
+            if alias is not None:
                 try:
-                    message.time = IMLogConvert.Time.tz_strpmktime(time_str, 
-                                    used_date_pattern, timezone)
-                except ValueError:
-                    raise ValueError("'%s' does not match date pattern %s (%s)" 
-                                    % (time_str, used_date_pattern, filename))
-                if message.time < conversation.start_time - 2*3600:
-                    message.time += 24*3600
-                if message.time < conversation.start_time - 2:
-                    if len(conversation.messages) == 0:
-                        # time stamp on initial message trumps conversation
-                        conversation.start_time = message.time
+                    (sender, contactname_alias) = senders[alias]
+                except KeyError:
+                    decoded_alias = decode(alias)
+                    contactname_alias \
+                    = decoded_alias.replace(' <AUTO-REPLY>', '')
+                    if status_alias_pattern.search(contactname_alias):
+                        contactname_alias = None
+                    elif (decoded_alias in self.aliases
+                    or decoded_alias == account):
+                        sender = account
+                        contactname_alias = None
                     else:
-                        raise ValueError("Nonsensical timestamp '%s' in %s" % (
-                            status_match.group('time'), filename))
-                message.text = unicode(status_match.group('text'))
-                conversation.messages.append(message)
-                continue
-            # fall-through: append to last message
-            if line.endswith("\n"):
-                line = line[:-1]
-            conversation.messages[-1].text += "\n" + unicode(line)
+                        sender = contactname
+                        contactname_alias = intern_name(contactname_alias)
+                    senders[alias] = (sender, contactname_alias)
+            if sender is None:
+                message = StatusMessage()
+                if alias is not None:
+                    text = alias + ': ' + text
+            else:
+                message = Message()
+                message.sender = sender
+            message.time = clock.message_time(msg_time_str)
+            if message.time < conversation.start_time - 2*3600:
+                message.time += 24*3600
+            if message.time < conversation.start_time - 2:
+                if len(messages) == 0:
+                    # time stamp on initial message trumps conversation
+                    conversation.start_time = message.time
+                else:
+                    raise ValueError("Nonsensical timestamp '%s' in %s" 
+                                     % (msg_time_str, filename))
+            if contactname_alias is not None:
+                conversation.participants[contactname] = contactname_alias
+            message.text = decode(text)
+            messages.append(message)
+        return continuation_lines
+
+    def _replace_aliases(self, conversation):
+        """ Apply self.alias_replacements to the participants """
         for (account, alias) in conversation.participants.items():
             if self.alias_replacements.has_key(alias):
                 conversation.participants[account] \
                 = self.alias_replacements[alias]
 
-        return conversation
+
+# Line breaks (besides '\n' and '\r\n') at which codecs would split lines of
+# UTF-8 encoded text
+_other_linebreaks_pattern = re.compile(
+    r'\r(?!\n)|[\x0b\x0c\x1c\x1d\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]')
+
+
+class _DayClock:
+    """ Calculator for the times of the messages in a Pidgin log. Within the
+        log, the date does not change, so the message times are calculated
+        from the epoch seconds at midnight of that day and the seconds of the
+        day in the time stamp of the message.
+    """
+    def __init__(self, date_day, date_pattern, time_str, start_time,
+                 timezone, filename):
+        """ Initialize the clock for a log starting at 'time_str' (which
+            consists of the date 'date_day' and a time, in the format
+            'date_pattern'), corresponding to 'start_time' in epoch seconds.
+        """
+        self.date_day = date_day
+        self.date_pattern = date_pattern
+        self.date_codec = IMLogConvert.Time.get_codec(date_pattern)
+        self.timezone = timezone
+        self.filename = filename
+        self.time_codec = None
+        for directive in ('%H', '%I'):
+            if directive in date_pattern:
+                self.time_codec = IMLogConvert.Time.get_codec(
+                                  date_pattern[date_pattern.index(directive):])
+                break
+        if self.time_codec is not None:
+            self.day_base = start_time - self.time_codec.seconds_of_day(
+                            time_str[len(date_day):].strip())
+        self._seconds_of_day = {}
+
+    def message_time(self, msg_time_str):
+        """ Return the epoch seconds for the time stamp of a message on the
+            day of the log
+        """
+        try:
+            return self.day_base + self._seconds_of_day[msg_time_str]
+        except (KeyError, AttributeError):
+            pass
+        try:
+            if self.time_codec is None:
+                return self.date_codec.parse(
+                       self.date_day + ' ' + msg_time_str, self.timezone)
+            seconds = self.time_codec.seconds_of_day(msg_time_str)
+        except ValueError:
+            raise ValueError("'%s' does not match date pattern %s (%s)" 
+                             % (self.date_day + ' ' + msg_time_str,
+                                self.date_pattern, self.filename))
+        self._seconds_of_day[msg_time_str] = seconds
+        return self.day_base + seconds
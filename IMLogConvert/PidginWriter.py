@@ -19,12 +19,16 @@
 ############################################################################
 
 """ 
-This module contains a class for writing Conversations in the Pidgin IM log
-text format IM logs
+This module contains classes for writing Conversations in the Pidgin IM log
+text format IM logs, as single files or as a libpurple log directory tree
 """
 from IMLogConvert.Conversation import StatusMessage
 import IMLogConvert.Time
-import codecs
+import IMLogConvert.Stats
+import IMLogConvert.SeekIndex
+import IMLogConvert.Compression
+import re
+import os
 
 class PidginTextWriter:
     """ Reader for text format logs created by Pidgin
@@ -33,31 +37,236 @@ class PidginTextWriter:
         """ Initialize the writer
         """
         self.encoding = 'utf-8'
+        self.start_time_codec = IMLogConvert.Time.get_codec(
+                                '%a %d %b %Y %I:%M:%S %p')
+        self.message_time_codec = IMLogConvert.Time.get_codec('%I:%M:%S %p')
+        # if set, write an IMLogConvert.SeekIndex of every seek_stride-th
+        # message next to every log
+        self.seek_stride = None
+        # number of lines that are collected before they are encoded and
+        # written in one block
+        self.buffer_lines = 4096
+        # formatted message times by second of the day (if
+        # message_time_codec only shows the time of day), and the codec they
+        # were formatted with
+        self._time_strings = {}
+        self._time_strings_codec = None
 
     def write(self, conversation, filename):
-        """ Writer a conversation to the given filename
-        """
-        fh = codecs.open(filename, 'w', self.encoding)
-        contactname = ''
-        for participant in conversation.participants.keys():
-            if participant != conversation.account:
-                contactname = participant
-        fh.write("Conversation with %s " % contactname)
-        fh.write("at %s " % IMLogConvert.Time.tz_strftime(
-                            '%a %d %b %Y %I:%M:%S %p', 
-                            conversation.start_time,
-                            conversation.timezone))
-        fh.write("on %s " % conversation.account)
-        fh.write("(%s)\n" % conversation.service)
-        for message in conversation.messages:
-            msg_time_str = IMLogConvert.Time.tz_strftime('%I:%M:%S %p', 
-                           message.time, conversation.timezone,
-                           append_offset=False)
+        """ Writer a conversation to the given filename. If the filename ends
+            in '.gz', '.bz2' or '.xz', the log is written compressed (and
+            without a seek index).
+        """
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('pidgin.write')
+        seek_index = None
+        if self.seek_stride is not None and \
+        IMLogConvert.Compression.compression_of(filename) is None:
+            seek_index = IMLogConvert.SeekIndex.SeekIndex(self.seek_stride)
+        fh = IMLogConvert.Compression.open_output(filename, 'wb')
+        try:
+            self._write(conversation, fh, seek_index)
+        finally:
+            fh.close()
+        if seek_index is not None:
+            seek_index.write(filename)
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_written(conversation, os.path.getsize(filename))
+
+    def write_stream(self, conversation, stream):
+        """ Write a conversation to an open binary stream, in the same format
+            as write. The stream is not closed, so that any number of
+            conversations can be written to it one after the other (e.g. for
+            a concatenated export). Return the number of bytes written.
+        """
+        stats = IMLogConvert.Stats.current
+        if stats is not None:
+            timer = stats.start('pidgin.write')
+        size = self._write(conversation, stream)
+        if stats is not None:
+            stats.stop(timer)
+            stats.count_written(conversation, size)
+        return size
+
+    def _write(self, conversation, stream, seek_index=None):
+        """ Write a conversation to the binary stream. The lines are
+            collected in blocks of self.buffer_lines, which are encoded and
+            written at once. If a seek_index is given, the offsets of the
+            messages (relative to the start of the conversation) are added to
+            it. Return the number of bytes written.
+        """
+        encoding = self.encoding
+        timezone = conversation.timezone
+        contactname = conversation.contact()
+        lines = ["Conversation with %s at %s on %s (%s)\n" % (contactname,
+                 self.start_time_codec.format(conversation.start_time,
+                                              timezone),
+                 conversation.account, conversation.service)]
+        # everything between the time stamp and the text, for every sender
+        prefixes = {}
+        for (participant, alias) in conversation.participants.items():
+            prefixes[participant] = ") %s: " % alias
+        time_strings = self._get_time_strings()
+        message_time_codec = self.message_time_codec
+        offset_sec = IMLogConvert.Time.resolve_offset(timezone)[1]
+        buffer_lines = self.buffer_lines
+        stride = None
+        if seek_index is not None:
+            stride = seek_index.stride
+        write = stream.write
+        size = 0
+        for (index, message) in enumerate(conversation.messages):
+            if stride is not None and index % stride == 0:
+                # flush, so that size is the offset of the message
+                block = ''.join(lines).encode(encoding)
+                write(block)
+                size += len(block)
+                del lines[:]
+                if index == 0:
+                    seek_index.header_end = size
+                seek_index.add(message.time, size)
+            if time_strings is None:
+                msg_time_str = message_time_codec.format(message.time,
+                               timezone, append_offset=False)
+            else:
+                second = int(message.time + offset_sec) % 86400
+                try:
+                    msg_time_str = time_strings[second]
+                except KeyError:
+                    msg_time_str = message_time_codec.format(second,
+                                   '+0000', append_offset=False)
+                    time_strings[second] = msg_time_str
             if isinstance(message, StatusMessage):
-                fh.write("(%s) %s\n" % (msg_time_str, message.text))
+                lines.append("(%s) %s\n" % (msg_time_str, message.text))
             else:
-                sender = conversation.participants[message.sender]
-                fh.write("(%s) %s: %s\n" % (msg_time_str, sender, message.text))
-        
-        fh.close()
+                lines.append("(%s%s%s\n" % (msg_time_str,
+                             prefixes[message.sender], message.text))
+            if len(lines) >= buffer_lines:
+                block = ''.join(lines).encode(encoding)
+                write(block)
+                size += len(block)
+                del lines[:]
+        block = ''.join(lines).encode(encoding)
+        write(block)
+        size += len(block)
+        if seek_index is not None:
+            seek_index.body_end = size
+            if len(conversation.messages) == 0:
+                seek_index.header_end = size
+        return size
+
+    def _get_time_strings(self):
+        """ Return the cache of formatted message times by second of the day,
+            or None if message_time_codec shows more than the time of day
+        """
+        if self._time_strings_codec is not self.message_time_codec:
+            self._time_strings = {}
+            self._time_strings_codec = self.message_time_codec
+            if re.search(r'%[^HIMSp%]',
+                         self.message_time_codec.format_str) is not None:
+                self._time_strings = None
+        return self._time_strings
+
+
+class PidginDirectoryWriter:
+    """ Writer for a whole corpus of conversations, in the directory layout
+        used by libpurple: every conversation is written as a Pidgin text log
+        to basedir/protocol/account/contact/YYYY-MM-DD.HHMMSS+ZZZZ.txt
+    """
+    def __init__(self, basedir, sync=None, batch_size=1000):
+        """ Initialize the writer for the log directory 'basedir'.
+            'sync' determines whether the written files are flushed to disk
+            with fsync: None for never, 'file' for after every file, and
+            'batch' for every 'batch_size' files and in close().
+        """
+        if sync not in (None, 'file', 'batch'):
+            raise ValueError("Invalid sync mode %s" % sync)
+        self.basedir = basedir
+        self.sync = sync
+        self.batch_size = batch_size
+        self.writer = PidginTextWriter()
+        self.filename_codec = IMLogConvert.Time.get_codec('%Y-%m-%d.%H%M%S')
+        self._directories = set()
+        self._filenames = set()
+        self._unsynced = []
+
+    def path(self, conversation):
+        """ Return the path of the log file for the conversation, relative to
+            basedir. If the path was already used by an earlier conversation
+            (a conversation with the same contact that started in the same
+            second), a suffix '-1', '-2', ... is added to the name.
+        """
+        contactname = conversation.contact()
+        directory = os.path.join(
+                    escape_filename(conversation.service.lower()),
+                    escape_filename(conversation.account.lower()),
+                    escape_filename(contactname.lower()))
+        name = self.filename_codec.format(conversation.start_time,
+                                          conversation.timezone)
+        name = name.replace(' ', '')
+        result = os.path.join(directory, name + '.txt')
+        counter = 0
+        while result in self._filenames:
+            counter += 1
+            result = os.path.join(directory, "%s-%i.txt" % (name, counter))
+        return result
+
+    def write(self, conversation):
+        """ Write the conversation to its log file, return the full filename
+        """
+        path = self.path(conversation)
+        self._filenames.add(path)
+        directory = os.path.join(self.basedir, os.path.dirname(path))
+        if directory not in self._directories:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._directories.add(directory)
+        filename = os.path.join(self.basedir, path)
+        self.writer.write(conversation, filename)
+        if self.sync == 'file':
+            _fsync(filename)
+        elif self.sync == 'batch':
+            self._unsynced.append(filename)
+            if len(self._unsynced) >= self.batch_size:
+                self.flush()
+        return filename
+
+    def flush(self):
+        """ fsync all files written since the last flush (in 'batch' mode) """
+        for filename in self._unsynced:
+            _fsync(filename)
+        self._unsynced = []
+
+    def close(self):
+        """ Flush all pending files to disk """
+        self.flush()
+
+
+# characters that purple_escape_filename leaves unescaped
+_filename_safe = frozenset('abcdefghijklmnopqrstuvwxyz'
+                           'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789@-_.#')
+
+def escape_filename(name):
+    """ Escape a name for use as a file name, like purple_escape_filename in
+        libpurple: all characters except ASCII letters, digits and '@-_.#'
+        are replaced by lowercase %xx escapes of their UTF-8 encoding
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    result = []
+    for char in name:
+        if char in _filename_safe:
+            result.append(char)
+        else:
+            result.append('%%%02x' % ord(char))
+    return ''.join(result)
 
+def _fsync(filename):
+    """ Flush the file with the given name to disk """
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
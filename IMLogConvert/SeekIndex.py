@@ -0,0 +1,132 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a sidecar index for log files written by
+Conversation.write_xml and PidginTextWriter, which maps message times to byte
+offsets, so that the messages in a time window can be read without parsing
+the whole file
+"""
+from bisect import bisect_left
+from array import array
+import sys
+import os
+
+_magic = "IMLogConvert seek index 1"
+
+class SeekIndex:
+    """ Byte offsets of every 'stride'-th message in a log file. 'times' and
+        'offsets' hold the time and the offset of the first byte of the
+        indexed messages. All messages are between 'header_end' (the end of
+        the part of the file before the first message) and 'body_end' (the
+        start of the part after the last message). The messages in the file
+        must be ordered by time, as they are in a Conversation.
+    """
+    def __init__(self, stride=100):
+        """ Initialize an empty index """
+        self.stride = stride
+        self.times = array('d')
+        self.offsets = array('d')
+        self.header_end = 0
+        self.body_end = 0
+
+    def add(self, time, offset):
+        """ Add a message with the given time at the given byte offset """
+        self.times.append(time)
+        self.offsets.append(offset)
+
+    def byte_range(self, start=None, end=None):
+        """ Return a tuple (begin, end) of byte offsets in the log file that
+            contain at least all messages with start <= time < end. A start
+            or end of None means that the window is open on that side.
+        """
+        begin_offset = self.header_end
+        end_offset = self.body_end
+        if start is not None:
+            i = bisect_left(self.times, start) - 1
+            if i >= 0:
+                begin_offset = int(self.offsets[i])
+        if end is not None:
+            j = bisect_left(self.times, end)
+            if j < len(self.times):
+                end_offset = int(self.offsets[j])
+        return (begin_offset, max(begin_offset, end_offset))
+
+    def write(self, filename):
+        """ Write the index as the sidecar of the log file 'filename'. This
+            must be done after the log file is complete.
+        """
+        stat = os.stat(filename)
+        fh = open(seek_filename(filename), 'wb')
+        fh.write("%s %i %i %i %i %r %i\n" % (_magic, self.stride,
+                 self.header_end, self.body_end, stat.st_size,
+                 stat.st_mtime, len(self.times)))
+        for values in (self.times, self.offsets):
+            if sys.byteorder == 'big':
+                values = array('d', values)
+                values.byteswap()
+            fh.write(values.tostring())
+        fh.close()
+
+
+def seek_filename(filename):
+    """ Return the name of the sidecar index of the log file 'filename' """
+    return filename + '.seek'
+
+def load(filename):
+    """ Return the SeekIndex of the log file 'filename', or None if there is
+        no index, or if it does not belong to the current version of the
+        file
+    """
+    try:
+        fh = open(seek_filename(filename), 'rb')
+    except IOError:
+        return None
+    try:
+        line = fh.readline()
+        if not line.startswith(_magic):
+            return None
+        fields = line[len(_magic):].split()
+        stat = os.stat(filename)
+        if len(fields) != 6 or int(fields[3]) != stat.st_size \
+        or float(fields[4]) != stat.st_mtime:
+            return None
+        index = SeekIndex(int(fields[0]))
+        index.header_end = int(fields[1])
+        index.body_end = int(fields[2])
+        count = int(fields[5])
+        for values in (index.times, index.offsets):
+            values.fromfile(fh, count)
+            if sys.byteorder == 'big':
+                values.byteswap()
+    except (ValueError, EOFError):
+        return None
+    finally:
+        fh.close()
+    return index
+
+def in_window(messages, window):
+    """ Return the list of messages with start <= time < end, where window is
+        a tuple (start, end), either of which may be None
+    """
+    (start, end) = window
+    return [message for message in messages
+            if (start is None or message.time >= start)
+            and (end is None or message.time < end)]
@@ -0,0 +1,83 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains a function for splitting conversations into one
+conversation per calendar day
+"""
+from IMLogConvert.Conversation import Conversation
+import IMLogConvert.Time
+
+
+def split_days(conversation, messages=None):
+    """ Yield one conversation for every calendar day (in the time zone of
+        the conversation) on which there are messages. The messages are
+        taken from the iterable 'messages', or from conversation.messages if
+        it is None, and must be ordered by time. Every conversation is
+        yielded as soon as the first message of the next day is seen, so
+        that with a streaming source like Conversation.iter_xml, only the
+        messages of a single day are in memory at any time.
+
+        The first day's conversation keeps the start time of the original
+        conversation (if it falls on that day), every later day starts at
+        the time of its first message. The participants of a day are the
+        account, the contact (the participant that names the conversation),
+        and everyone who sent a message on that day. A conversation without
+        messages is yielded as a single (empty) day.
+    """
+    if messages is None:
+        messages = conversation.messages
+    offset_sec = IMLogConvert.Time.resolve_offset(conversation.timezone)[1]
+    contact = conversation.contact()
+    participants = conversation.participants
+    day = None
+    shard = None
+    for message in messages:
+        message_day = int((message.time + offset_sec) // 86400)
+        if day is None or message_day > day:
+            if shard is not None:
+                yield shard
+            start_time = message.time
+            if day is None and int((conversation.start_time + offset_sec)
+                                   // 86400) == message_day:
+                start_time = min(conversation.start_time, message.time)
+            day = message_day
+            shard = _new_shard(conversation, start_time, contact)
+            shard_participants = shard.participants
+            shard_messages = shard.messages
+        sender = getattr(message, 'sender', None)
+        if sender is not None and sender not in shard_participants:
+            shard_participants[sender] = participants.get(sender, sender)
+        shard_messages.append(message)
+    if shard is None:
+        shard = _new_shard(conversation, conversation.start_time, contact)
+    yield shard
+
+def _new_shard(conversation, start_time, contact):
+    """ Return an empty conversation like 'conversation', starting at
+        start_time, with only the account and the contact as participants
+    """
+    shard = Conversation(conversation.service, conversation.account,
+                         start_time, conversation.timezone)
+    for participant in (conversation.account, contact):
+        if participant in conversation.participants:
+            shard.participants[participant] \
+            = conversation.participants[participant]
+    return shard
@@ -0,0 +1,209 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Opt-in instrumentation for the readers, writers and time conversion.
+
+Usage:
+
+    stats = IMLogConvert.Stats.Stats()
+    stats.enable(profile=True)
+    ... read and write conversations ...
+    stats.disable()
+    print stats.report()
+    stats.dump_profile('run.pstats')
+
+While no Stats object is enabled, the only cost is a check of
+IMLogConvert.Stats.current once per file.
+"""
+import IMLogConvert.Time
+import threading
+import time
+import os
+
+# The currently enabled Stats object, or None
+current = None
+
+class Stats:
+    """ Wall and CPU time per stage, and counters. The stages are
+        'adium.parse', 'pidgin.parse', 'xml.parse', 'xml.write',
+        'pidgin.write', and 'time' (all calls to the TimeCodec methods, which
+        happen inside the other stages). The counters are 'files_read',
+        'files_written', 'messages', 'status_messages', 'continuation_lines',
+        'bytes_in', and 'bytes_out'. The data may be updated from several
+        threads at once (like in the pipelined mode of
+        IMLogConvert.BatchConverter).
+    """
+    def __init__(self):
+        """ Initialize empty statistics """
+        self.calls = {}
+        self.wall = {}
+        self.cpu = {}
+        self.counters = {}
+        self.profiler = None
+        self._lock = threading.Lock()
+
+    def enable(self, profile=False):
+        """ Make this the Stats object that collects all data. If 'profile'
+            is True, also run cProfile until disable is called.
+        """
+        global current
+        if current is not None:
+            current.disable()
+        current = self
+        _instrument_time_codec()
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def disable(self):
+        """ Stop collecting data """
+        global current
+        if self.profiler is not None:
+            self.profiler.disable()
+        if current is self:
+            current = None
+            _restore_time_codec()
+
+    def start(self, stage):
+        """ Start timing a stage, return a timer for stop() """
+        return (stage, time.time(), time.clock())
+
+    def stop(self, timer):
+        """ Stop timing the stage started with start() """
+        (stage, wall, cpu) = timer
+        self.add_time(stage, time.time() - wall, time.clock() - cpu)
+
+    def add_time(self, stage, wall, cpu, calls=1):
+        """ Add wall and cpu seconds to the given stage """
+        self._lock.acquire()
+        try:
+            self.calls[stage] = self.calls.get(stage, 0) + calls
+            self.wall[stage] = self.wall.get(stage, 0.0) + wall
+            self.cpu[stage] = self.cpu.get(stage, 0.0) + cpu
+        finally:
+            self._lock.release()
+
+    def count(self, name, value=1):
+        """ Increase the counter 'name' by value """
+        self._lock.acquire()
+        try:
+            self.counters[name] = self.counters.get(name, 0) + value
+        finally:
+            self._lock.release()
+
+    def count_read(self, conversation, filename_or_stream=None,
+                   continuation_lines=0):
+        """ Count a conversation that was read from filename_or_stream """
+        self.count('files_read')
+        self.count('messages', len(conversation.messages))
+        status_messages = 0
+        for message in conversation.messages:
+            if not hasattr(message, 'sender'):
+                status_messages += 1
+        self.count('status_messages', status_messages)
+        self.count('continuation_lines', continuation_lines)
+        if isinstance(filename_or_stream, basestring):
+            self.count('bytes_in', os.path.getsize(filename_or_stream))
+
+    def count_written(self, conversation, size):
+        """ Count a conversation that was written as 'size' bytes """
+        self.count('files_written')
+        self.count('bytes_out', size)
+
+    def merge(self, other):
+        """ Add the data from another Stats object (e.g. collected in a
+            different process)
+        """
+        for stage in other.calls.keys():
+            self.add_time(stage, other.wall[stage], other.cpu[stage],
+                          other.calls[stage])
+        for (name, value) in other.counters.items():
+            self.count(name, value)
+
+    def dump_profile(self, filename):
+        """ Write the cProfile data in pstats format to filename """
+        if self.profiler is None:
+            raise ValueError("Profiling was not enabled")
+        self.profiler.dump_stats(filename)
+
+    def report(self):
+        """ Return a printable report """
+        lines = ["%-14s %10s %12s %12s" % ("stage", "calls", "wall [s]",
+                                           "cpu [s]")]
+        for stage in sorted(self.calls.keys()):
+            lines.append("%-14s %10i %12.3f %12.3f" % (stage,
+                         self.calls[stage], self.wall[stage], self.cpu[stage]))
+        for name in sorted(self.counters.keys()):
+            lines.append("%-20s %12i" % (name, self.counters[name]))
+        return "\n".join(lines)
+
+    def __getstate__(self):
+        """ Return state for pickling, without the profiler and lock """
+        state = self.__dict__.copy()
+        state['profiler'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        """ Restore the pickled state, with a new lock """
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+# original TimeCodec methods, while they are replaced by timed versions
+_time_codec_methods = {}
+
+def _instrument_time_codec():
+    """ Replace the TimeCodec methods by versions that record the 'time'
+        stage in the current Stats object
+    """
+    codec_class = IMLogConvert.Time.TimeCodec
+    for name in ('parse', 'format', 'seconds_of_day'):
+        if _time_codec_methods.has_key(name):
+            continue
+        method = codec_class.__dict__[name]
+        _time_codec_methods[name] = method
+        setattr(codec_class, name, _timed(method))
+
+def _restore_time_codec():
+    """ Undo _instrument_time_codec """
+    codec_class = IMLogConvert.Time.TimeCodec
+    for (name, method) in _time_codec_methods.items():
+        setattr(codec_class, name, method)
+    _time_codec_methods.clear()
+
+def _timed(method):
+    """ Return a version of method that adds its run time to the 'time'
+        stage of the current Stats object
+    """
+    def timed_method(*args, **kwargs):
+        """ Timed version of a TimeCodec method """
+        wall = time.time()
+        cpu = time.clock()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            if current is not None:
+                current.add_time('time', time.time() - wall,
+                                 time.clock() - cpu)
+    timed_method.__doc__ = method.__doc__
+    return timed_method
@@ -22,6 +22,8 @@
 Time utilities and data
 """
 import time
+import calendar
+import datetime
 import re
 
 timezones = {
@@ -80,29 +82,241 @@ def tz_offset_sec(offset):
 
 def tz_strftime(format, epoch_seconds, offset, append_offset=True):
     """ Return formatted time string in time zone offset """
-    if offset == '':
-        offset = '+0000'
-    if not re.match(r'[+-]\d{4}', offset):
-        offset = tz_offset(offset)
-    if not re.match(r'[+-]\d{4}', offset):
-        raise ValueError("Invalid time zone %s" % offset)
-    tz_time_tuple = time.gmtime(epoch_seconds+tz_offset_sec(offset))
-    result = time.strftime(format, tz_time_tuple)
-    if append_offset:
-        result = result + ' ' + offset
-    return result
+    return get_codec(format).format(epoch_seconds, offset, append_offset)
     
 def tz_strpmktime(time_str, format, offset):
     """ Parse formatted time string in time zone 'offset', return epoch
         seconds. The time_str itself should not contain any eplicit time zone
         information, but contain a local time in the 'offset' time zone
     """
-    if offset == '':
-        offset = '+0000'
-    if not re.match(r'[+-]\d{4}', offset):
-        offset = tz_offset(offset)
-    if not re.match(r'[+-]\d{4}', offset):
-        raise ValueError("Invalid time zone %s" % offset)
-    result = time.mktime(time.strptime(time_str, format))
-    result = result - time.timezone - tz_offset_sec(offset)
+    return get_codec(format).parse(time_str, offset)
+
+
+# Resolved time zone offsets: offset or abbreviation => (offset, seconds)
+_resolved_offsets = {}
+
+def resolve_offset(offset):
+    """ Normalize a time zone offset (e.g. '+0100') or abbreviation (e.g.
+        'EST') and return a tuple (offset, seconds), like ('-0500', -18000).
+        The empty offset is taken to be '+0000'. The result is cached, so that
+        every distinct offset is only validated once.
+    """
+    try:
+        return _resolved_offsets[offset]
+    except KeyError:
+        pass
+    normalized = offset
+    if normalized == '':
+        normalized = '+0000'
+    if not re.match(r'[+-]\d{4}', normalized):
+        normalized = tz_offset(normalized)
+    if not re.match(r'[+-]\d{4}', normalized):
+        raise ValueError("Invalid time zone %s" % normalized)
+    result = (normalized, tz_offset_sec(normalized))
+    _resolved_offsets[offset] = result
     return result
+
+
+_weekday_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+_month_numbers = dict([(name.lower(), number + 1)
+                       for (number, name) in enumerate(_month_names)])
+_epoch_ordinal = datetime.date(1970, 1, 1).toordinal()
+
+# Regular expressions for the directives understood by TimeCodec. These are
+# the same expressions that time.strptime uses in the C locale
+_directive_patterns = {
+    'a' : r'(?P<a>mon|tue|wed|thu|fri|sat|sun)',
+    'b' : r'(?P<b>jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)',
+    'd' : r'(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])',
+    'H' : r'(?P<H>2[0-3]|[0-1]\d|\d)',
+    'I' : r'(?P<I>1[0-2]|0[1-9]|[1-9])',
+    'm' : r'(?P<m>1[0-2]|0[1-9]|[1-9])',
+    'M' : r'(?P<M>[0-5]\d|\d)',
+    'S' : r'(?P<S>6[0-1]|[0-5]\d|\d)',
+    'Y' : r'(?P<Y>\d\d\d\d)',
+    'p' : r'(?P<p>am|pm)',
+}
+
+class TimeCodec:
+    """ Precompiled parser and formatter for a single time format, like
+        '%a %d %b %Y %H:%M:%S'. For formats consisting only of the directives
+        %a, %b, %d, %H, %I, %m, %M, %S, %Y, and %p, parsing and formatting is
+        done with plain integer arithmetic, always in UTC plus the given
+        offset. Any other format falls back to time.strptime/time.strftime.
+        Formatted strings are memoized per second and offset.
+    """
+    cache_size = 65536
+
+    def __init__(self, format):
+        """ Compile the given format """
+        self.format_str = format
+        self.generic = False
+        self._cache = {}
+        regex = ''
+        template = ''
+        self._fields = []
+        i = 0
+        while i < len(format):
+            char = format[i]
+            if char == '%' and i + 1 < len(format):
+                directive = format[i+1]
+                i += 2
+                if directive == '%':
+                    regex += '%'
+                    template += '%%'
+                elif _directive_patterns.has_key(directive):
+                    if directive in self._fields:
+                        self.generic = True
+                    regex += _directive_patterns[directive]
+                    template += '%s'
+                    self._fields.append(directive)
+                else:
+                    self.generic = True
+                continue
+            if char.isspace():
+                regex += r'\s+'
+                while i < len(format) and format[i].isspace():
+                    template += format[i]
+                    i += 1
+                continue
+            regex += re.escape(char)
+            template += char.replace('%', '%%')
+            i += 1
+        if ('I' in self._fields) != ('p' in self._fields):
+            self.generic = True
+        self._regex = re.compile(r'(?:%s)\Z' % regex, re.IGNORECASE)
+        self._template = template
+
+    def parse(self, time_str, offset):
+        """ Parse formatted time string in time zone 'offset', return epoch
+            seconds (see tz_strpmktime)
+        """
+        offset_sec = resolve_offset(offset)[1]
+        if self.generic:
+            return float(calendar.timegm(time.strptime(time_str,
+                                                       self.format_str))
+                         - offset_sec)
+        (year, month, day, hour, minute, second) = self._parse_fields(time_str)
+        # raises ValueError for days that do not exist, like time.strptime
+        days = datetime.date(year, month, day).toordinal() - _epoch_ordinal
+        return float(days * 86400 + hour * 3600 + minute * 60 + second
+                     - offset_sec)
+
+    def seconds_of_day(self, time_str):
+        """ Parse formatted time string and return only the number of seconds
+            since midnight. This is meant for formats that contain only a time
+            of day, like '%I:%M:%S %p'
+        """
+        if self.generic:
+            time_tuple = time.strptime(time_str, self.format_str)
+            return (time_tuple.tm_hour * 3600 + time_tuple.tm_min * 60
+                    + time_tuple.tm_sec)
+        (year, month, day, hour, minute, second) = self._parse_fields(time_str)
+        return hour * 3600 + minute * 60 + second
+
+    def _parse_fields(self, time_str):
+        """ Parse formatted time string into a tuple (year, month, day, hour,
+            minute, second)
+        """
+        match = self._regex.match(time_str)
+        if match is None:
+            raise ValueError("time data %r does not match format %r"
+                             % (time_str, self.format_str))
+        fields = match.groupdict()
+        year = 1900
+        month = 1
+        day = 1
+        hour = 0
+        minute = 0
+        second = 0
+        if fields.has_key('Y'):
+            year = int(fields['Y'])
+        if fields.has_key('m'):
+            month = int(fields['m'])
+        elif fields.has_key('b'):
+            month = _month_numbers[fields['b'].lower()]
+        if fields.has_key('d'):
+            day = int(fields['d'])
+        if fields.has_key('H'):
+            hour = int(fields['H'])
+        elif fields.has_key('I'):
+            hour = int(fields['I']) % 12
+            if fields['p'].lower() == 'pm':
+                hour += 12
+        if fields.has_key('M'):
+            minute = int(fields['M'])
+        if fields.has_key('S'):
+            second = int(fields['S'])
+        return (year, month, day, hour, minute, second)
+
+    def format(self, epoch_seconds, offset, append_offset=True):
+        """ Return formatted time string in time zone offset (see
+            tz_strftime)
+        """
+        (offset, offset_sec) = resolve_offset(offset)
+        local_seconds = int(epoch_seconds + offset_sec)
+        try:
+            result = self._cache[local_seconds]
+        except KeyError:
+            result = self._format(local_seconds)
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[local_seconds] = result
+        if append_offset:
+            result = result + ' ' + offset
+        return result
+
+    def _format(self, local_seconds):
+        """ Format the given number of seconds since the epoch (in local
+            time), without caching
+        """
+        if self.generic:
+            return time.strftime(self.format_str, time.gmtime(local_seconds))
+        (days, second) = divmod(local_seconds, 86400)
+        date = datetime.date.fromordinal(days + _epoch_ordinal)
+        (hour, second) = divmod(second, 3600)
+        (minute, second) = divmod(second, 60)
+        values = []
+        for field in self._fields:
+            if field == 'a':
+                values.append(_weekday_names[date.weekday()])
+            elif field == 'b':
+                values.append(_month_names[date.month - 1])
+            elif field == 'd':
+                values.append('%02i' % date.day)
+            elif field == 'H':
+                values.append('%02i' % hour)
+            elif field == 'I':
+                values.append('%02i' % (hour % 12 or 12))
+            elif field == 'm':
+                values.append('%02i' % date.month)
+            elif field == 'M':
+                values.append('%02i' % minute)
+            elif field == 'S':
+                values.append('%02i' % second)
+            elif field == 'Y':
+                values.append('%04i' % date.year)
+            elif field == 'p':
+                if hour < 12:
+                    values.append('AM')
+                else:
+                    values.append('PM')
+        return self._template % tuple(values)
+
+
+_codecs = {}
+
+def get_codec(format):
+    """ Return the (shared) TimeCodec instance for the given format """
+    try:
+        return _codecs[format]
+    except KeyError:
+        codec = TimeCodec(format)
+        _codecs[format] = codec
+        return codec
+
+# Codecs for the formats used throughout IMLogConvert
+CONVERSATION_CODEC = get_codec('%a %d %b %Y %H:%M:%S')
+ADIUM_CODEC = get_codec('%Y-%m-%dT%H:%M:%S')
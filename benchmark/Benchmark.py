@@ -0,0 +1,307 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Timed benchmarks of the IMLogConvert readers, writers and time functions on
+a synthetic corpus (see Corpus.py).
+
+Usage: python -m benchmark.Benchmark [options]
+
+Results can be saved as JSON with --save, and compared against a saved
+baseline with --compare. In compare mode, the exit status is 1 if any
+benchmark got slower than the threshold allows.
+"""
+from IMLogConvert.Conversation import Conversation
+from IMLogConvert.AdiumReader import AdiumReader
+from IMLogConvert.PidginReader import PidginTextReader
+from IMLogConvert.PidginWriter import PidginTextWriter
+from benchmark.Corpus import CorpusGenerator
+import IMLogConvert.Time
+from optparse import OptionParser
+import multiprocessing
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Benchmark:
+    """ Set of benchmarks on a generated corpus. Each benchmark is a method
+        'bench_<name>' that returns a tuple (messages, bytes): the number of
+        messages that were processed, and the number of bytes read or
+        written.
+    """
+    def __init__(self, directory, conversations=50, messages=500, seed=0):
+        """ Generate the corpus in 'directory' """
+        self.directory = directory
+        generator = CorpusGenerator(seed=seed, messages=messages)
+        self.files = {}
+        for (kind, write) in [('xml', generator.write_xml),
+                              ('pidgin', generator.write_pidgin),
+                              ('adium', generator.write_adium)]:
+            subdir = os.path.join(directory, kind)
+            os.mkdir(subdir)
+            self.files[kind] = write(subdir, conversations)
+        self.conversations = list(generator.conversations(conversations))
+        self.output = os.path.join(directory, 'output')
+        os.mkdir(self.output)
+
+    def names(self):
+        """ Return the names of all benchmarks """
+        return sorted([name[6:] for name in dir(self)
+                       if name.startswith('bench_')])
+
+    def run(self, name, repeat=3):
+        """ Run the benchmark 'name' 'repeat' times in a separate process,
+            and return a dictionary with the best timings
+        """
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=self._run_child,
+                                          args=(name, repeat, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        if isinstance(result, basestring):
+            raise RuntimeError("Benchmark %s failed: %s" % (name, result))
+        return result
+
+    def _run_child(self, name, repeat, queue):
+        """ Run a benchmark and put the result into queue """
+        try:
+            method = getattr(self, 'bench_' + name)
+            start_rss = _max_rss()
+            best = None
+            for i in xrange(repeat):
+                start = time.time()
+                (messages, size) = method()
+                elapsed = time.time() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            best = max(best, 1e-9)
+            queue.put({'seconds': best,
+                       'messages': messages,
+                       'bytes': size,
+                       'messages_per_s': messages / best,
+                       'mb_per_s': size / best / 1e6,
+                       'peak_memory_kb': _max_rss() - start_rss})
+        except Exception, data:
+            queue.put("%s: %s" % (data.__class__.__name__, data))
+
+    def _input_size(self, kind):
+        """ Return the total size of all input files of the given kind """
+        return sum([os.path.getsize(filename)
+                    for filename in self.files[kind]])
+
+    def bench_read_adium(self):
+        """ AdiumReader.read """
+        reader = AdiumReader()
+        messages = 0
+        for filename in self.files['adium']:
+            messages += len(reader.read(filename).messages)
+        return (messages, self._input_size('adium'))
+
+    def bench_read_pidgin(self):
+        """ PidginTextReader.read """
+        reader = PidginTextReader(["Me Myself"])
+        messages = 0
+        for filename in self.files['pidgin']:
+            messages += len(reader.read(filename).messages)
+        return (messages, self._input_size('pidgin'))
+
+    def bench_read_pidgin_mmap(self):
+        """ PidginTextReader.read with use_mmap """
+        reader = PidginTextReader(["Me Myself"])
+        reader.use_mmap = True
+        messages = 0
+        for filename in self.files['pidgin']:
+            messages += len(reader.read(filename).messages)
+        return (messages, self._input_size('pidgin'))
+
+    def bench_from_xml(self):
+        """ Conversation.from_xml """
+        messages = 0
+        for filename in self.files['xml']:
+            conversation = Conversation()
+            conversation.from_xml(filename)
+            messages += len(conversation.messages)
+        return (messages, self._input_size('xml'))
+
+    def bench_iter_xml(self):
+        """ Conversation.iter_xml """
+        messages = 0
+        for filename in self.files['xml']:
+            iterator = Conversation().iter_xml(filename)
+            iterator.next()
+            for message in iterator:
+                messages += 1
+        return (messages, self._input_size('xml'))
+
+    def bench_write_xml(self):
+        """ Conversation.write_xml """
+        messages = 0
+        size = 0
+        filename = os.path.join(self.output, 'out.xml')
+        for conversation in self.conversations:
+            conversation.write_xml(filename)
+            messages += len(conversation.messages)
+            size += os.path.getsize(filename)
+        return (messages, size)
+
+    def bench_write_pidgin(self):
+        """ PidginTextWriter.write """
+        writer = PidginTextWriter()
+        messages = 0
+        size = 0
+        filename = os.path.join(self.output, 'out.txt')
+        for conversation in self.conversations:
+            writer.write(conversation, filename)
+            messages += len(conversation.messages)
+            size += os.path.getsize(filename)
+        return (messages, size)
+
+    def bench_time_parse(self):
+        """ Time.tz_strpmktime """
+        strings = self._time_strings()
+        for (time_str, offset) in strings:
+            IMLogConvert.Time.tz_strpmktime(time_str,
+                                            '%a %d %b %Y %H:%M:%S', offset)
+        return (len(strings), sum([len(s) for (s, o) in strings]))
+
+    def bench_time_format(self):
+        """ Time.tz_strftime """
+        size = 0
+        count = 0
+        for conversation in self.conversations:
+            for message in conversation.messages:
+                size += len(IMLogConvert.Time.tz_strftime(
+                            '%a %d %b %Y %H:%M:%S', message.time,
+                            conversation.timezone, append_offset=False))
+                count += 1
+        return (count, size)
+
+    def _time_strings(self):
+        """ Return a list of (time_str, offset) for all messages """
+        result = []
+        codec = IMLogConvert.Time.CONVERSATION_CODEC
+        for conversation in self.conversations:
+            for message in conversation.messages:
+                result.append((codec.format(message.time,
+                               conversation.timezone, append_offset=False),
+                               conversation.timezone))
+        return result
+
+
+def _max_rss():
+    """ Return the peak resident memory of the process in kB, or 0 if it
+        cannot be determined
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def compare(results, baseline, threshold=0.1):
+    """ Compare results against baseline results. Return a tuple
+        (report, regressions), where report is a printable table and
+        regressions is the list of benchmarks whose throughput dropped by more
+        than the fraction 'threshold'.
+    """
+    lines = ["%-20s %14s %14s %8s" % ("benchmark", "baseline msg/s",
+                                      "msg/s", "change")]
+    regressions = []
+    for name in sorted(results.keys()):
+        if not baseline.has_key(name):
+            lines.append("%-20s %14s %14.0f %8s" % (name, "-",
+                         results[name]['messages_per_s'], "new"))
+            continue
+        old = baseline[name]['messages_per_s']
+        new = results[name]['messages_per_s']
+        change = (new - old) / old
+        flag = ""
+        if change < -threshold:
+            regressions.append(name)
+            flag = " REGRESSION"
+        lines.append("%-20s %14.0f %14.0f %+7.1f%%%s"
+                     % (name, old, new, 100 * change, flag))
+    return ("\n".join(lines), regressions)
+
+def report(results):
+    """ Return a printable table of benchmark results """
+    lines = ["%-20s %10s %12s %10s %12s" % ("benchmark", "seconds", "msg/s",
+                                           "MB/s", "peak mem kB")]
+    for name in sorted(results.keys()):
+        result = results[name]
+        lines.append("%-20s %10.4f %12.0f %10.2f %12i" % (name,
+                     result['seconds'], result['messages_per_s'],
+                     result['mb_per_s'], result['peak_memory_kb']))
+    return "\n".join(lines)
+
+def main(argv=None):
+    """ Run the benchmarks from the command line """
+    parser = OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option('--conversations', type='int', default=50,
+                      help="number of conversations in the corpus")
+    parser.add_option('--messages', type='int', default=500,
+                      help="number of messages per conversation")
+    parser.add_option('--seed', type='int', default=0,
+                      help="random seed for the corpus")
+    parser.add_option('--repeat', type='int', default=3,
+                      help="number of runs per benchmark (best is reported)")
+    parser.add_option('--save', metavar='FILE',
+                      help="save results as JSON to FILE")
+    parser.add_option('--compare', metavar='FILE',
+                      help="compare against baseline results in FILE")
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help="allowed relative slowdown in compare mode")
+    (options, names) = parser.parse_args(argv)
+    directory = tempfile.mkdtemp(prefix='imlogconvert-bench-')
+    try:
+        benchmark = Benchmark(directory, options.conversations,
+                              options.messages, options.seed)
+        if len(names) == 0:
+            names = benchmark.names()
+        results = {}
+        for name in names:
+            results[name] = benchmark.run(name, options.repeat)
+    finally:
+        shutil.rmtree(directory)
+    print report(results)
+    if options.save is not None:
+        outfile = open(options.save, 'w')
+        json.dump(results, outfile, indent=2, sort_keys=True)
+        outfile.close()
+    if options.compare is not None:
+        infile = open(options.compare)
+        baseline = json.load(infile)
+        infile.close()
+        (table, regressions) = compare(results, baseline, options.threshold)
+        print
+        print table
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Deterministic generator of synthetic IM log corpora for benchmarking: Adium
+chatlogs, Pidgin text logs in all the first-line dialects understood by
+PidginTextReader, and native Conversation XML.
+"""
+from IMLogConvert.Conversation import Conversation, Message, StatusMessage
+from xml.sax import saxutils
+import IMLogConvert.Time
+import random
+import os
+
+_words = ("hello", "hi", "yes", "no", "maybe", "tomorrow", "lunch", "meeting",
+          "the", "a", "is", "was", "code", "bug", "fixed", "see", "you",
+          "later", "thanks", "ok", "what", "about", "this", "that", u"schön",
+          u"Grüße", u"caf\xe9", "&", "<b>", "x > y", ":)")
+_names = [u"John Doe", u"Jane Roe", u"Jürgen Müller", u"Zoë", u"Max Power",
+          u"Ann Other", u"Bob", u"Alice"]
+_services = [("icq", "ICQ"), ("aim", "AIM"), ("jabber", "Jabber"),
+             ("msn", "MSN")]
+_timezones = ['+0100', '+0200', '-0500', '+0000', '+0530']
+_status_texts = [u"%s has signed on.", u"%s has signed off.",
+                 u"%s has gone away.", u"%s is no longer away."]
+
+# Pidgin first line dialects: (first line time format, message time format,
+# whether the first line contains the time zone)
+pidgin_dialects = [
+    ('%a %d %b %Y %I:%M:%S %p', '%I:%M:%S %p', True),
+    ('%a %d %b %Y %H:%M:%S', '%H:%M:%S', True),
+    ('%Y-%m-%d %H:%M:%S', '%H:%M:%S', False),
+    ('%m/%d/%Y %I:%M:%S %p', '%I:%M:%S %p', False),
+    ('%d.%m.%Y %H:%M:%S', '%H:%M:%S', False),
+]
+
+
+class CorpusGenerator:
+    """ Generator of random, but reproducible, conversations. Two generators
+        with the same seed produce exactly the same corpus.
+    """
+    def __init__(self, seed=0, messages=200, status_fraction=0.05,
+                 multiline_fraction=0.1):
+        """ Initialize the generator. 'messages' is the number of messages
+            per conversation, 'status_fraction' the fraction of status
+            messages, 'multiline_fraction' the fraction of messages that span
+            more than one line.
+        """
+        self.seed = seed
+        self.messages = messages
+        self.status_fraction = status_fraction
+        self.multiline_fraction = multiline_fraction
+
+    def conversations(self, count):
+        """ Yield 'count' random Conversation objects """
+        rand = random.Random(self.seed)
+        for i in xrange(count):
+            yield self._conversation(rand)
+
+    def _conversation(self, rand):
+        """ Return a single random conversation """
+        service = rand.choice(_services)[0]
+        account = u"me%i" % rand.randint(100, 999)
+        contact = u"contact%i" % rand.randint(1000, 9999)
+        timezone = rand.choice(_timezones)
+        # all messages are within 20 hours after the start, so that the
+        # Pidgin text format (which has only the time of day) is unambiguous
+        start_time = float(rand.randint(1100000000, 1250000000))
+        conversation = Conversation(service, account, start_time, timezone)
+        conversation.participants[account] = u"Me Myself"
+        conversation.participants[contact] = rand.choice(_names)
+        max_step = max(1, int(2 * 20 * 3600 / max(1, self.messages)))
+        msg_time = start_time
+        for i in xrange(self.messages):
+            if i > 0:
+                msg_time += rand.randint(0, max_step)
+            if rand.random() < self.status_fraction:
+                text = rand.choice(_status_texts) \
+                       % conversation.participants[contact]
+                conversation.messages.append(StatusMessage(msg_time, text))
+            else:
+                lines = 1
+                if rand.random() < self.multiline_fraction:
+                    lines = rand.randint(2, 4)
+                text = u"\n".join([self._sentence(rand)
+                                   for line in xrange(lines)])
+                sender = rand.choice([account, contact])
+                conversation.messages.append(Message(msg_time, sender, text))
+        return conversation
+
+    def _sentence(self, rand):
+        """ Return a random line of text """
+        return u" ".join([rand.choice(_words)
+                          for i in xrange(rand.randint(1, 15))])
+
+    def write_xml(self, directory, count):
+        """ Write 'count' conversations as native XML files into directory.
+            Return the list of filenames.
+        """
+        filenames = []
+        for (index, conversation) in enumerate(self.conversations(count)):
+            filename = os.path.join(directory, "%06i.xml" % index)
+            conversation.write_xml(filename)
+            filenames.append(filename)
+        return filenames
+
+    def write_pidgin(self, directory, count):
+        """ Write 'count' conversations as Pidgin text logs into directory,
+            cycling through all first line dialects. Return the list of
+            filenames.
+        """
+        filenames = []
+        for (index, conversation) in enumerate(self.conversations(count)):
+            dialect = pidgin_dialects[index % len(pidgin_dialects)]
+            filename = os.path.join(directory, "%06i.txt" % index)
+            fh = open(filename, 'w')
+            fh.write(pidgin_text(conversation, dialect).encode('utf-8'))
+            fh.close()
+            filenames.append(filename)
+        return filenames
+
+    def write_adium(self, directory, count):
+        """ Write 'count' conversations as Adium chatlogs into directory,
+            in the directory structure used by Adium
+            (Service.account/contact/contact (date).chatlog/contact (date).xml).
+            Return the list of filenames.
+        """
+        filenames = []
+        for conversation in self.conversations(count):
+            (account, contact) = _account_contact(conversation)
+            date = IMLogConvert.Time.tz_strftime('%Y-%m-%dT%H.%M.%S',
+                   conversation.start_time, conversation.timezone,
+                   append_offset=False) + conversation.timezone
+            name = u"%s (%s)" % (contact, date)
+            service = dict(_services)[conversation.service]
+            logdir = os.path.join(directory, u"%s.%s" % (service, account),
+                                  contact, name + u".chatlog")
+            if not os.path.isdir(logdir):
+                os.makedirs(logdir)
+            filename = os.path.join(logdir, name + u".xml")
+            fh = open(filename, 'w')
+            fh.write(adium_xml(conversation).encode('utf-8'))
+            fh.close()
+            filenames.append(filename)
+        return filenames
+
+
+def _account_contact(conversation):
+    """ Return the account and the contact of a two-person conversation """
+    return (conversation.account, conversation.contact())
+
+def pidgin_text(conversation, dialect):
+    """ Return the conversation as a Pidgin text log (unicode) in the given
+        dialect (see pidgin_dialects)
+    """
+    (firstline_format, time_format, with_timezone) = dialect
+    (account, contact) = _account_contact(conversation)
+    timezone = conversation.timezone
+    if not with_timezone:
+        # without time zone in the first line, times are read as UTC
+        timezone = '+0000'
+    start = IMLogConvert.Time.tz_strftime(firstline_format,
+            conversation.start_time, timezone, append_offset=with_timezone)
+    lines = [u"Conversation with %s at %s on %s (%s)\n"
+             % (contact, start, account, conversation.service)]
+    for (index, message) in enumerate(conversation.messages):
+        msg_time = IMLogConvert.Time.tz_strftime(time_format, message.time,
+                   timezone, append_offset=False)
+        if index % 17 == 5 and '%p' in time_format:
+            # some versions of Pidgin put the date into the time stamp
+            msg_time = IMLogConvert.Time.tz_strftime('%m/%d/%Y ',
+                       message.time, timezone, append_offset=False) + msg_time
+        if isinstance(message, StatusMessage):
+            lines.append(u"(%s) %s\n" % (msg_time, message.text))
+        else:
+            alias = conversation.participants[message.sender]
+            if index % 23 == 7 and message.sender != account:
+                alias += u" <AUTO-REPLY>"
+            lines.append(u"(%s) %s: %s\n" % (msg_time, alias, message.text))
+    return u"".join(lines)
+
+def adium_xml(conversation):
+    """ Return the conversation as an Adium chatlog (unicode) """
+    (account, contact) = _account_contact(conversation)
+    lines = [u'<?xml version="1.0" encoding="UTF-8" ?>\n',
+             u'<chat xmlns="http://purl.org/net/ulf/ns/0.4-02" account=%s '
+             u'service=%s>\n' % (saxutils.quoteattr(account),
+             saxutils.quoteattr(dict(_services)[conversation.service]))]
+    offset = conversation.timezone[:3] + ':' + conversation.timezone[3:]
+    def adium_time(epoch_seconds):
+        """ Return time stamp in Adium format """
+        return IMLogConvert.Time.tz_strftime('%Y-%m-%dT%H:%M:%S',
+               epoch_seconds, conversation.timezone,
+               append_offset=False) + offset
+    lines.append(u'<event type="windowOpened" sender=%s time="%s"/>\n'
+                 % (saxutils.quoteattr(account),
+                    adium_time(conversation.start_time)))
+    for message in conversation.messages:
+        if isinstance(message, StatusMessage):
+            lines.append(u'<status type="online" sender=%s time="%s">'
+                         u'%s</status>\n' % (saxutils.quoteattr(contact),
+                         adium_time(message.time),
+                         saxutils.escape(message.text)))
+        else:
+            text = u'<br/>'.join([saxutils.escape(line)
+                                  for line in message.text.split(u"\n")])
+            lines.append(u'<message sender=%s time="%s" alias=%s><div>'
+                         u'<span style="color: #000000;">%s</span></div>'
+                         u'</message>\n' % (
+                         saxutils.quoteattr(message.sender),
+                         adium_time(message.time), saxutils.quoteattr(
+                         conversation.participants[message.sender]), text))
+    lines.append(u'<event type="windowClosed" sender=%s time="%s"/>\n'
+                 % (saxutils.quoteattr(account),
+                    adium_time(conversation.messages[-1].time)))
+    lines.append(u'</chat>\n')
+    return u"".join(lines)
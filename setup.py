@@ -9,5 +9,6 @@ setup(name='IMLogConvert',
       author_email='goerz@physik.fu-berlin.de',
       url='www.michaelgoerz.net',
       license='GPL',
-      packages=['IMLogConvert']
+      packages=['IMLogConvert'],
+      scripts=['scripts/imlogconvert']
      )
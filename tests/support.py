@@ -0,0 +1,146 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+This module contains helpers shared by the tests. The tests are run from the
+top directory of the package with
+
+    python -m unittest discover tests
+"""
+from IMLogConvert.Conversation import Conversation, Message, StatusMessage
+import unittest
+import tempfile
+import json
+import shutil
+import os
+
+# directory of the test logs and of the expected outputs
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+def data_file(name):
+    """ Return the full name of the file 'name' in data_dir """
+    return os.path.join(data_dir, name)
+
+def sample_conversation(start_time=1200000000.0, contact=u'bob'):
+    """ Return a small conversation with messages and status messages """
+    conversation = Conversation(u'icq', u'me', start_time, '+0100')
+    conversation.participants[u'me'] = u'Me Myself'
+    conversation.participants[contact] = u'Bob'
+    for index in xrange(20):
+        time = start_time + 10 * index
+        if index % 4 == 3:
+            conversation.messages.append(StatusMessage(time,
+                                         u'Bob has gone away. %i' % index))
+        else:
+            conversation.messages.append(Message(time,
+                [u'me', contact][index % 2], u'hello w\xf6rld %i' % index))
+    return conversation
+
+def message_tuples(conversation):
+    """ Return the messages of a conversation as comparable tuples """
+    return [(message.__class__, message.time,
+             getattr(message, 'sender', None), message.text)
+            for message in conversation.messages]
+
+def conversation_tuple(conversation):
+    """ Return the header, the participants and the messages of a
+        conversation as a comparable tuple
+    """
+    return (conversation.service, conversation.account,
+            conversation.start_time, conversation.timezone,
+            sorted(conversation.participants.items()),
+            message_tuples(conversation))
+
+def conversation_data(conversation):
+    """ Return the header, the participants and the messages of a
+        conversation in the form used for the expected results in data_dir
+        (see load_data)
+    """
+    return json.loads(json.dumps({'service': conversation.service,
+        'account': conversation.account,
+        'start_time': conversation.start_time,
+        'timezone': conversation.timezone,
+        'participants': sorted(conversation.participants.items()),
+        'messages': [[message.__class__.__name__, message.time,
+                      getattr(message, 'sender', None), message.text]
+                     for message in conversation.messages]}))
+
+def conversation_from_data(data):
+    """ Return a new conversation from data in the form returned by
+        conversation_data
+    """
+    conversation = Conversation(data['service'], data['account'],
+                                data['start_time'], data['timezone'])
+    for (participant, alias) in data['participants']:
+        conversation.participants[participant] = alias
+    for (kind, time, sender, text) in data['messages']:
+        if kind == 'StatusMessage':
+            conversation.messages.append(StatusMessage(time, text))
+        else:
+            conversation.messages.append(Message(time, sender, text))
+    return conversation
+
+def load_data(name):
+    """ Return the JSON file 'name' in data_dir. The expected results of
+        reading a log are stored in the form returned by conversation_data,
+        or as {"error": <name of the exception class>}; they were created
+        with the original, unoptimized readers.
+    """
+    fh = open(data_file(name))
+    try:
+        return json.load(fh)
+    finally:
+        fh.close()
+
+
+def written_data(directory):
+    """ Return a list of tuples (conversation, content) for all files in
+        data_dir/directory. These files were written by the original writers,
+        from the conversation data (see conversation_from_data) in the JSON
+        file of the same name in data_dir/xml or data_dir/pidgin.
+    """
+    result = []
+    for filename in sorted(os.listdir(os.path.join(data_dir, directory))):
+        (name, extension) = os.path.splitext(filename)
+        if extension == '.json':
+            continue
+        if os.path.exists(data_file(os.path.join('xml', name + '.json'))):
+            data = load_data(os.path.join('xml', name + '.json'))
+        else:
+            data = load_data(os.path.join('pidgin', name + '.json'))
+        fh = open(data_file(os.path.join(directory, filename)), 'rb')
+        result.append((conversation_from_data(data), fh.read()))
+        fh.close()
+    return result
+
+
+class TemporaryDirectoryTestCase(unittest.TestCase):
+    """ Test case with a temporary directory self.directory """
+    def setUp(self):
+        """ Create the directory """
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """ Delete the directory """
+        shutil.rmtree(self.directory)
+
+    def path(self, *names):
+        """ Return the full name of a file in the temporary directory """
+        return os.path.join(self.directory, *names)
@@ -0,0 +1,124 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.AdiumReader
+"""
+from IMLogConvert.AdiumReader import AdiumReader
+from benchmark.Corpus import CorpusGenerator
+from support import TemporaryDirectoryTestCase, conversation_tuple
+from support import data_dir, load_data, conversation_data
+import IMLogConvert.Compression
+import glob
+import unittest
+import shutil
+import os
+
+
+class FindLogsTest(TemporaryDirectoryTestCase):
+    """ Tests for AdiumReader.find_logs """
+    def setUp(self):
+        """ Write a tree of Adium logs """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.filenames = CorpusGenerator(seed=1, messages=3).write_adium(
+                         self.directory, 30)
+        # logs of old versions of Adium are not in a .chatlog bundle
+        bundle = os.path.dirname(self.filenames[0])
+        old_filename = os.path.join(os.path.dirname(bundle),
+                                    os.path.basename(self.filenames[0]))
+        os.rename(self.filenames[0], old_filename)
+        os.rmdir(bundle)
+        self.filenames[0] = old_filename
+        self.reader = AdiumReader()
+
+    def test_all_logs(self):
+        """ All logs are found, with the times and accounts of their
+            content
+        """
+        logs = self.reader.find_logs(self.directory, threads=3)
+        self.assertEqual(sorted([log.filename for log in logs]),
+                         sorted(self.filenames))
+        for log in logs:
+            conversation = self.reader.read(log.filename)
+            self.assertEqual(log.time, conversation.start_time)
+            self.assertEqual(log.timezone, conversation.timezone)
+            self.assertEqual(log.account, conversation.account)
+
+    def test_filters(self):
+        """ Only the logs of the given contacts and time range are found """
+        logs = self.reader.find_logs(self.directory)
+        contact = logs[0].contact
+        times = sorted([log.time for log in logs])
+        (start, end) = (times[5], times[20])
+        expected = [log.filename for log in logs
+                    if log.contact == contact and start <= log.time < end]
+        self.assertEqual([log.filename for log in self.reader.find_logs(
+                          self.directory, start, end,
+                          contacts=[contact.upper()])], expected)
+        account = logs[-1].account
+        self.assertEqual([log.filename for log in self.reader.find_logs(
+                          self.directory, accounts=[account])],
+                         [log.filename for log in logs
+                          if log.account == account])
+
+
+class ParseTest(TemporaryDirectoryTestCase):
+    """ Tests for AdiumReader.parse """
+    def test_same_as_original(self):
+        """ The logs in data_dir/adium are read as by the original reader
+            (which gave the conversation data in the JSON file of the same
+            name), with expat and with xml.sax, from files, compressed files
+            and streams
+        """
+        filenames = sorted(glob.glob(os.path.join(data_dir, 'adium',
+                                                  '*.xml')))
+        self.assertTrue(len(filenames) > 3)
+        for filename in filenames:
+            expected = load_data(os.path.join('adium',
+                       os.path.basename(filename)[:-4] + '.json'))
+            gz_filename = self.path('log.xml.gz')
+            infile = open(filename, 'rb')
+            outfile = IMLogConvert.Compression.open_output(gz_filename)
+            shutil.copyfileobj(infile, outfile)
+            outfile.close()
+            infile.close()
+            for use_expat in (True, False):
+                reader = AdiumReader()
+                reader.use_expat = use_expat
+                for source in (filename, gz_filename):
+                    self.assertEqual(conversation_data(reader.read(source)),
+                                     expected)
+                stream = open(filename, 'rb')
+                self.assertEqual(conversation_data(reader.read(stream)),
+                                 expected)
+                stream.close()
+
+    def test_sax_and_expat(self):
+        """ xml.sax and expat read the same conversation """
+        filename = CorpusGenerator(seed=2, messages=20).write_adium(
+                   self.directory, 1)[0]
+        reader = AdiumReader()
+        expected = conversation_tuple(reader.parse(filename))
+        reader.use_expat = False
+        self.assertEqual(conversation_tuple(reader.parse(filename)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
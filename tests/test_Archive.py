@@ -0,0 +1,93 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Archive
+"""
+from IMLogConvert.Archive import ArchiveWriter, ArchiveReader
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple
+import unittest
+
+
+class ArchiveTest(TemporaryDirectoryTestCase):
+    """ Tests for ArchiveWriter and ArchiveReader """
+    def setUp(self):
+        """ Create the directory and some conversations """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.filename = self.path('logs.arc')
+        self.conversations = [sample_conversation(1200000000.0 + 1000 * i,
+                                                  u'contact%i' % (i % 3))
+                              for i in xrange(10)]
+
+    def _write(self, conversations, append=False):
+        """ Write conversations to the archive, in small blocks """
+        writer = ArchiveWriter(self.filename, append, block_size=2000)
+        for conversation in conversations:
+            writer.write(conversation)
+        writer.close()
+
+    def _read(self):
+        """ Return all conversations in the archive as tuples """
+        reader = ArchiveReader(self.filename)
+        try:
+            return [conversation_tuple(conversation)
+                    for conversation in reader]
+        finally:
+            reader.close()
+
+    def test_round_trip(self):
+        """ The conversations can be read back, and found by contact """
+        self._write(self.conversations)
+        self.assertEqual(self._read(), [conversation_tuple(conversation)
+                         for conversation in self.conversations])
+        reader = ArchiveReader(self.filename)
+        entries = reader.find(contact=u'contact1')
+        self.assertEqual([reader.read(entry).start_time
+                          for entry in entries],
+                         [conversation.start_time for conversation
+                          in self.conversations[1::3]])
+        reader.close()
+
+    def test_append(self):
+        """ Appended conversations follow the existing ones """
+        self._write(self.conversations[:4])
+        self._write(self.conversations[4:], append=True)
+        self.assertEqual(self._read(), [conversation_tuple(conversation)
+                         for conversation in self.conversations])
+
+    def test_interrupted_append(self):
+        """ An append that is never closed leaves the old content readable
+        """
+        self._write(self.conversations[:4])
+        writer = ArchiveWriter(self.filename, append=True)
+        for conversation in self.conversations[4:]:
+            writer.write(conversation)
+        writer.flush()
+        writer.fh.close()
+        self.assertEqual(self._read(), [conversation_tuple(conversation)
+                         for conversation in self.conversations[:4]])
+        self._write(self.conversations[4:], append=True)
+        self.assertEqual(self._read(), [conversation_tuple(conversation)
+                         for conversation in self.conversations])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.BatchConverter
+"""
+from IMLogConvert.BatchConverter import BatchConverter
+from IMLogConvert.Conversation import Conversation
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple
+import IMLogConvert.Stats
+import threading
+import unittest
+import os
+
+
+class BatchConverterTest(TemporaryDirectoryTestCase):
+    """ Tests for BatchConverter """
+    def _inputs(self, count):
+        """ Write 'count' copies of the sample conversation as native XML,
+            and return their filenames
+        """
+        filenames = []
+        for index in xrange(count):
+            filename = self.path('in%i.xml' % index)
+            sample_conversation().to_xml(filename)
+            filenames.append(filename)
+        return filenames
+
+    def test_colliding_outputs(self):
+        """ Inputs with the same output name are all kept """
+        filenames = self._inputs(3)
+        output_dir = self.path('out')
+        os.mkdir(output_dir)
+        converter = BatchConverter(output_dir=output_dir, processes=1)
+        result = converter.convert(filenames)
+        self.assertEqual(result.errors, [])
+        outputs = set([outfilename
+                       for (filename, outfilename) in result.converted])
+        self.assertEqual(len(outputs), 3)
+        self.assertEqual(sorted(os.listdir(output_dir)),
+                         sorted([os.path.basename(outfilename)
+                                 for outfilename in outputs]))
+        for outfilename in outputs:
+            conversation = Conversation()
+            conversation.from_xml(outfilename)
+            self.assertEqual(conversation_tuple(conversation),
+                             conversation_tuple(sample_conversation()))
+
+
+class PipelineTest(TemporaryDirectoryTestCase):
+    """ Tests for the pipelined mode of BatchConverter """
+    def setUp(self):
+        """ Write some native XML logs, and a file that is not XML """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.filenames = []
+        for index in xrange(20):
+            filename = self.path('in%i.xml' % index)
+            sample_conversation(start_time=1200000000.0 + 3600 * index,
+                                contact=u'user%i' % (index % 3)).to_xml(
+                                filename)
+            self.filenames.append(filename)
+        self.filenames.insert(7, self.path('broken.xml'))
+        fh = open(self.filenames[7], 'w')
+        fh.write('not xml')
+        fh.close()
+        self.filenames.append(self.path('missing.xml'))
+
+    def _convert(self, name, **settings):
+        """ Convert the inputs into the output directory 'name' with the
+            given converter attributes, return (result, stats, outputs),
+            where outputs maps every output file name to its content
+        """
+        output_dir = self.path(name)
+        os.mkdir(output_dir)
+        converter = BatchConverter(output_dir=output_dir, processes=1)
+        converter.stats = IMLogConvert.Stats.Stats()
+        for (key, value) in settings.items():
+            setattr(converter, key, value)
+        result = converter.convert(self.filenames)
+        outputs = {}
+        for outname in os.listdir(output_dir):
+            fh = open(os.path.join(output_dir, outname), 'rb')
+            outputs[outname] = fh.read()
+            fh.close()
+        return (result, converter.stats, outputs)
+
+    def test_same_as_sequential(self):
+        """ The pipeline converts the same files, with the same errors and
+            counters, as a single process
+        """
+        (expected, expected_stats, expected_outputs) \
+        = self._convert('sequential')
+        (result, stats, outputs) = self._convert('pipelined', pipeline=True,
+                                                 prefetch_threads=3,
+                                                 read_queue_size=2,
+                                                 write_queue_size=2)
+        self.assertEqual(len(result.converted), 20)
+        self.assertEqual(sorted([filename for (filename, outfilename)
+                                 in result.converted]),
+                         sorted([filename for (filename, outfilename)
+                                 in expected.converted]))
+        self.assertEqual(sorted([filename for (filename, error)
+                                 in result.errors]),
+                         sorted([self.filenames[7], self.filenames[-1]]))
+        self.assertEqual(outputs, expected_outputs)
+        for name in ('files_read', 'files_written', 'messages', 'bytes_out'):
+            self.assertEqual(stats.counters[name],
+                             expected_stats.counters[name])
+
+    def test_stop_on_error(self):
+        """ If collecting the results fails, the threads are stopped and no
+            temporary files are left behind
+        """
+        threads = threading.activeCount()
+        output_dir = self.path('out')
+        os.mkdir(output_dir)
+        converter = BatchConverter(output_dir=output_dir, processes=1)
+        converter.pipeline = True
+        converter.read_queue_size = 1
+        converter.write_queue_size = 1
+        def progress(done, total, filename, outfilename, error):
+            """ Fail after the second file """
+            if done == 2:
+                raise KeyboardInterrupt()
+        self.assertRaises(KeyboardInterrupt, converter.convert,
+                          self.filenames, progress)
+        self.assertEqual(threading.activeCount(), threads)
+        self.assertEqual([name for name in os.listdir(output_dir)
+                          if '.tmp' in name], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
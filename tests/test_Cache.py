@@ -0,0 +1,92 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Cache
+"""
+from IMLogConvert.Conversation import Message
+from IMLogConvert.Cache import ConversationCache, dumps, loads
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple, message_tuples
+import unittest
+import pickle
+
+
+class SerializationTest(unittest.TestCase):
+    """ Tests for dumps and loads """
+    def test_round_trip(self):
+        """ A conversation is loaded as it was dumped """
+        conversation = sample_conversation()
+        self.assertEqual(conversation_tuple(loads(dumps(conversation))),
+                         conversation_tuple(conversation))
+
+    def test_serialization_keeps_message_kinds(self):
+        """ A Message without sender is not loaded as a StatusMessage """
+        conversation = sample_conversation()
+        conversation.messages.append(Message(1.0, None, u'no sender'))
+        copy = loads(dumps(conversation))
+        self.assertEqual(message_tuples(copy), message_tuples(conversation))
+
+
+class ConversationCacheTest(TemporaryDirectoryTestCase):
+    """ Tests for ConversationCache """
+    def test_get_and_put(self):
+        """ Stored conversations are found again after reopening """
+        cache = ConversationCache(self.path('cache.sqlite'))
+        self.assertEqual(cache.get('a'), None)
+        cache.put('a', sample_conversation())
+        cache.close()
+        cache = ConversationCache(self.path('cache.sqlite'))
+        self.assertEqual(conversation_tuple(cache.get('a')),
+                         conversation_tuple(sample_conversation()))
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        cache.close()
+
+    def test_evict_least_recently_used(self):
+        """ The least recently used conversations are evicted first, and the
+            total size stays below max_size
+        """
+        size = len(dumps(sample_conversation()))
+        cache = ConversationCache(self.path('cache.sqlite'),
+                                  max_size=3 * size + size // 2)
+        for key in 'abc':
+            cache.put(key, sample_conversation())
+        cache.get('a')
+        cache.put('d', sample_conversation())
+        self.assertEqual(cache.get('b'), None)
+        for key in 'acd':
+            self.assertNotEqual(cache.get(key), None)
+        self.assertTrue(cache._total <= cache.max_size)
+        cache.close()
+
+    def test_pickle_keeps_settings(self):
+        """ An unpickled cache has the settings of the original """
+        cache = ConversationCache(self.path('cache.sqlite'), max_size=1000,
+                                  commit_interval=7)
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual((copy.filename, copy.max_size,
+                          copy.commit_interval),
+                         (cache.filename, 1000, 7))
+        copy.close()
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
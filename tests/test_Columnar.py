@@ -0,0 +1,61 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Columnar
+"""
+from IMLogConvert.Conversation import StatusMessage
+from support import TemporaryDirectoryTestCase, sample_conversation
+import IMLogConvert.Columnar
+import unittest
+
+
+class ColumnarTest(TemporaryDirectoryTestCase):
+    """ Tests for the columnar export """
+    def test_round_trip(self):
+        """ Texts and strings can be read back from a loaded export """
+        if IMLogConvert.Columnar.numpy is None:
+            self.skipTest("numpy is not installed")
+        conversations = [sample_conversation(),
+                         sample_conversation(1300000000.0, u'alice')]
+        writer = IMLogConvert.Columnar.ColumnarWriter(self.directory)
+        for conversation in conversations:
+            writer.add(conversation)
+        writer.close()
+        corpus = IMLogConvert.Columnar.load(self.directory)
+        messages = [message for conversation in conversations
+                    for message in conversation.messages]
+        self.assertEqual(len(corpus), len(messages))
+        for (index, message) in enumerate(messages):
+            self.assertEqual(corpus.text(index), message.text)
+            self.assertEqual(corpus.columns['time'][index], int(message.time))
+            sender_id = corpus.columns['sender'][index]
+            if isinstance(message, StatusMessage):
+                self.assertEqual(sender_id, -1)
+            else:
+                self.assertEqual(corpus.string(sender_id), message.sender)
+        contact_ids = corpus.columns['conversation_contact']
+        self.assertEqual([corpus.string(contact_ids[0]),
+                          corpus.string(contact_ids[1])],
+                         [u'bob', u'alice'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.CommandLine
+"""
+from IMLogConvert.CommandLine import sniff_format
+from IMLogConvert.PidginWriter import PidginTextWriter
+from benchmark.Corpus import CorpusGenerator
+from support import TemporaryDirectoryTestCase, sample_conversation
+import IMLogConvert.Compression
+import unittest
+
+
+class SniffFormatTest(TemporaryDirectoryTestCase):
+    """ Tests for sniff_format """
+    def write(self, name, data):
+        """ Write data to the file 'name' (compressed according to its
+            extension), return the full filename
+        """
+        filename = self.path(name)
+        fh = IMLogConvert.Compression.open_output(filename)
+        fh.write(data)
+        fh.close()
+        return filename
+
+    def test_formats(self):
+        """ Every supported format is recognized, also when compressed """
+        conversation = sample_conversation()
+        for extension in ('', '.gz', '.bz2'):
+            filename = self.path('pidgin.txt' + extension)
+            PidginTextWriter().write(conversation, filename)
+            self.assertEqual(sniff_format(filename), 'pidgin')
+            filename = self.path('native.xml' + extension)
+            conversation.write_xml(filename)
+            self.assertEqual(sniff_format(filename), 'xml')
+        adium_filename = CorpusGenerator(seed=1, messages=3).write_adium(
+                         self.directory, 1)[0]
+        self.assertEqual(sniff_format(adium_filename), 'adium')
+
+    def test_bom_and_whitespace(self):
+        """ A UTF-8 byte order mark and leading whitespace are skipped """
+        filename = self.write('bom.xml',
+                   '\xef\xbb\xbf\n  <?xml version="1.0"?>\n<conversation>')
+        self.assertEqual(sniff_format(filename), 'xml')
+
+    def test_unknown(self):
+        """ Unrecognized and empty files give None """
+        self.assertEqual(sniff_format(self.write('other.txt', 'hello')),
+                         None)
+        self.assertEqual(sniff_format(self.write('html.txt', '<html>')),
+                         None)
+        self.assertEqual(sniff_format(self.write('empty.txt', '')), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
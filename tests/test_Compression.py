@@ -0,0 +1,78 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Compression
+"""
+from IMLogConvert.Compression import DecompressingStream, open_input
+from IMLogConvert.Compression import open_output
+from support import TemporaryDirectoryTestCase
+from cStringIO import StringIO
+import xml.sax.xmlreader
+import unittest
+import bz2
+
+
+class CompressionTest(TemporaryDirectoryTestCase):
+    """ Tests for IMLogConvert.Compression """
+    def test_round_trip(self):
+        """ Compressed files are read back as they were written """
+        data = ''.join(['line %i\n' % index for index in xrange(5000)])
+        for extension in ('', '.gz', '.bz2'):
+            filename = self.path('log.txt' + extension)
+            fh = open_output(filename)
+            fh.write(data)
+            fh.close()
+            fh = open_input(filename)
+            self.assertEqual(fh.read(), data)
+            fh.close()
+
+    def test_uncompressed_file_opened_once(self):
+        """ An uncompressed file name gives the open file, at its start """
+        filename = self.path('log.txt')
+        fh = open(filename, 'wb')
+        fh.write('plain text\n')
+        fh.close()
+        fh = open_input(filename)
+        self.assertTrue(isinstance(fh, file))
+        self.assertEqual(fh.tell(), 0)
+        self.assertEqual(fh.read(), 'plain text\n')
+        fh.close()
+
+    def test_bz2_members_at_block_boundary(self):
+        """ Concatenated bz2 streams are read completely, also if a stream
+            ends exactly at the end of a block
+        """
+        first = bz2.compress('hello\n' * 1000)
+        second = bz2.compress('world\n' * 500)
+        for blocksize in (len(first), len(first) - 1, 7, 1<<16):
+            stream = DecompressingStream(StringIO(first + second), 'bz2',
+                                         blocksize=blocksize)
+            self.assertEqual(stream.read(),
+                             'hello\n' * 1000 + 'world\n' * 500)
+
+    def test_input_source_passes_through(self):
+        """ Objects without a read method are returned unchanged """
+        source = xml.sax.xmlreader.InputSource('log.xml')
+        self.assertTrue(open_input(source) is source)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Conversation
+"""
+from IMLogConvert.Conversation import Conversation, Message
+from support import sample_conversation, message_tuples, conversation_tuple
+from support import TemporaryDirectoryTestCase, conversation_from_data
+from support import data_dir, written_data
+from cStringIO import StringIO
+import IMLogConvert.Compression
+import xml.sax.xmlreader
+import unittest
+import glob
+import os
+import cPickle
+import pickle
+
+
+class ConversationTest(unittest.TestCase):
+    """ Tests for Conversation """
+    def test_contact(self):
+        """ The contact is the participant that is not the account """
+        self.assertEqual(sample_conversation(contact=u'alice').contact(),
+                         u'alice')
+        conversation = Conversation(u'icq', u'me', 0.0)
+        self.assertEqual(conversation.contact(), '')
+        conversation.participants[u'me'] = u'Me'
+        self.assertEqual(conversation.contact(), '')
+
+
+class WriteXMLTest(TemporaryDirectoryTestCase):
+    """ Tests for Conversation.write_xml and Conversation.to_xml """
+    def test_same_as_original(self):
+        """ The XML is byte for byte the same as that of the original
+            to_xml, however it is written
+        """
+        # written by the original to_xml
+        cases = written_data('xml')
+        self.assertTrue(len(cases) > 10)
+        filename = self.path('log.xml')
+        for (conversation, expected) in cases:
+            self.assertEqual(conversation.to_xml(), expected)
+            for buffer_lines in (1, 3, 1000):
+                stream = StringIO()
+                conversation.write_xml(stream, buffer_lines)
+                self.assertEqual(stream.getvalue(), expected)
+            for seek_stride in (None, 4):
+                conversation.to_xml(filename, seek_stride)
+                fh = open(filename, 'rb')
+                self.assertEqual(fh.read(), expected)
+                fh.close()
+
+
+class FromXMLTest(TemporaryDirectoryTestCase):
+    """ Tests for Conversation.from_xml """
+    def test_sax_and_expat(self):
+        """ xml.sax and expat read the same conversation """
+        filename = self.path('log.xml')
+        sample_conversation().write_xml(filename)
+        expected = Conversation()
+        expected.from_xml(filename)
+        for source in (filename, xml.sax.xmlreader.InputSource(filename)):
+            conversation = Conversation()
+            conversation.from_xml(source, use_expat=False)
+            self.assertEqual(conversation_tuple(conversation),
+                             conversation_tuple(expected))
+        self.assertEqual(conversation_tuple(expected),
+                         conversation_tuple(sample_conversation()))
+
+
+class IterXMLTest(TemporaryDirectoryTestCase):
+    """ Tests for Conversation.iter_xml """
+    def read(self, filename_or_stream):
+        """ Return (header, messages) from iter_xml, where header is the
+            conversation_tuple of the yielded conversation before the first
+            message
+        """
+        conversation = Conversation()
+        items = iter(conversation.iter_xml(filename_or_stream))
+        self.assertTrue(items.next() is conversation)
+        header = conversation_tuple(conversation)
+        messages = list(items)
+        self.assertEqual(len(conversation.messages), 0)
+        return (header, messages)
+
+    def test_same_as_from_xml(self):
+        """ iter_xml gives the header and messages that from_xml reads, from
+            files, compressed files and streams
+        """
+        for filename in sorted(glob.glob(os.path.join(data_dir, 'xml',
+                                                      '*.xml'))):
+            expected = Conversation()
+            expected.from_xml(filename)
+            fh = open(filename, 'rb')
+            data = fh.read()
+            fh.close()
+            gz_filename = self.path('log.xml.gz')
+            outfile = IMLogConvert.Compression.open_output(gz_filename)
+            outfile.write(data)
+            outfile.close()
+            for source in (filename, gz_filename, StringIO(data)):
+                (header, messages) = self.read(source)
+                conversation = Conversation()
+                conversation.messages = messages
+                self.assertEqual(header[:5],
+                                 conversation_tuple(expected)[:5])
+                self.assertEqual(message_tuples(conversation),
+                                 message_tuples(expected))
+
+    def test_error(self):
+        """ Broken XML raises an exception from the iterator """
+        stream = StringIO(sample_conversation().to_xml()[:-300])
+        self.assertRaises(SyntaxError, list,
+                          Conversation().iter_xml(stream))
+
+
+class MessageStoreTest(unittest.TestCase):
+    """ Tests for Conversation.compact and MessageStore """
+    def test_access(self):
+        """ A compacted conversation has the same messages """
+        conversation = sample_conversation()
+        expected = message_tuples(conversation)
+        conversation.compact()
+        self.assertEqual(message_tuples(conversation), expected)
+        self.assertEqual(len(conversation.messages), len(expected))
+        self.assertEqual(message_tuples(conversation)[3:5], expected[3:5])
+
+    def test_pickle_keeps_status_messages(self):
+        """ Status messages survive pickling a compacted conversation """
+        conversation = sample_conversation()
+        conversation.messages.append(Message(1.0, None, u'no sender'))
+        expected = message_tuples(conversation)
+        conversation.compact()
+        for module in (pickle, cPickle):
+            for protocol in (0, 2):
+                copy = module.loads(module.dumps(conversation, protocol))
+                self.assertEqual(message_tuples(copy), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.CorpusStatistics
+"""
+from IMLogConvert.CorpusStatistics import CorpusStatistics, collect
+from IMLogConvert.AdiumReader import AdiumReader
+from benchmark.Corpus import CorpusGenerator
+from support import TemporaryDirectoryTestCase
+import unittest
+
+
+class CollectTest(TemporaryDirectoryTestCase):
+    """ Tests for collect """
+    def setUp(self):
+        """ Write a corpus of native XML logs, and a broken log """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.generator = CorpusGenerator(seed=5, messages=30)
+        self.filenames = self.generator.write_xml(self.directory, 25)
+        broken = self.path('broken.xml')
+        fh = open(broken, 'w')
+        fh.write('<conversation')
+        fh.close()
+        self.filenames.insert(10, broken)
+
+    def result(self, statistics):
+        """ Return the data of statistics, with the errors sorted """
+        data = statistics.to_dict()
+        data['errors'].sort()
+        return data
+
+    def test_counts(self):
+        """ The statistics agree with the generated conversations """
+        statistics = collect(self.filenames, processes=1)
+        conversations = list(self.generator.conversations(25))
+        messages = sum([len(conversation.messages)
+                        for conversation in conversations])
+        self.assertEqual(statistics.files, 25)
+        self.assertEqual([filename for (filename, error)
+                          in statistics.errors], [self.filenames[10]])
+        self.assertEqual(statistics.messages, messages)
+        self.assertEqual(sum(statistics.hours), messages)
+        self.assertEqual(sum(statistics.weekdays), messages)
+        self.assertEqual(sum(statistics.lengths), messages)
+        self.assertEqual(statistics.characters,
+                         sum([len(message.text)
+                              for conversation in conversations
+                              for message in conversation.messages]))
+        for conversation in conversations:
+            key = (conversation.service, conversation.account,
+                   conversation.contact())
+            contact_stats = statistics.contacts[key]
+            self.assertEqual(contact_stats.sent + contact_stats.received
+                             + contact_stats.status_messages,
+                             contact_stats.messages)
+            self.assertTrue(contact_stats.first
+                            <= conversation.messages[0].time)
+            self.assertTrue(contact_stats.last
+                            >= conversation.messages[-1].time)
+
+    def test_parallel(self):
+        """ Collecting in worker processes gives the same statistics as
+            collecting in the current process, also with a reader
+        """
+        self.assertEqual(self.result(collect(self.filenames, processes=2,
+                                             chunksize=3)),
+                         self.result(collect(self.filenames, processes=1)))
+        filenames = self.generator.write_adium(self.path('adium'), 10)
+        self.assertEqual(self.result(collect(filenames, AdiumReader(),
+                                             processes=2, chunksize=4)),
+                         self.result(collect(filenames, AdiumReader(),
+                                             processes=1)))
+
+    def test_merge(self):
+        """ Merging the statistics of parts of the corpus gives the
+            statistics of the whole corpus
+        """
+        parts = [CorpusStatistics(), CorpusStatistics()]
+        for (index, filename) in enumerate(self.filenames):
+            parts[index % 2].add_file(filename)
+        merged = CorpusStatistics()
+        merged.merge(parts[0])
+        merged.merge(parts[1])
+        self.assertEqual(self.result(merged),
+                         self.result(collect(self.filenames, processes=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
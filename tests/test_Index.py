@@ -0,0 +1,142 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Index
+"""
+from IMLogConvert.Index import Index, tokenize
+from benchmark.Corpus import CorpusGenerator
+from support import TemporaryDirectoryTestCase
+import unittest
+import os
+
+
+class IndexTest(TemporaryDirectoryTestCase):
+    """ Tests for Index """
+    def setUp(self):
+        """ Index a small corpus """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.conversations = {}
+        self.index = Index(self.path('index.sqlite'))
+        for (number, conversation) in enumerate(CorpusGenerator(seed=3,
+                                      messages=40).conversations(12)):
+            source = self.path('log%i.xml' % number)
+            self.conversations[source] = conversation
+            self.index.add(conversation, source, source + '.out')
+        self.index.commit()
+
+    def tearDown(self):
+        """ Close the index """
+        self.index.close()
+        TemporaryDirectoryTestCase.tearDown(self)
+
+    def scan(self, query, sender=None, account=None, contact=None,
+             start=None, end=None):
+        """ Return the set of (source, ordinal) of all messages that match
+            the search, found by going through all conversations
+        """
+        terms = set(tokenize(query))
+        result = set()
+        if len(terms) == 0:
+            return result
+        for (source, conversation) in self.conversations.items():
+            if account is not None and conversation.account != account:
+                continue
+            if contact is not None and conversation.contact() != contact:
+                continue
+            for (ordinal, message) in enumerate(conversation.messages):
+                if sender is not None \
+                and getattr(message, 'sender', None) != sender:
+                    continue
+                if (start is not None and message.time < start) \
+                or (end is not None and message.time >= end):
+                    continue
+                if terms.issubset(tokenize(message.text)):
+                    result.add((source, ordinal))
+        return result
+
+    def check(self, query, **filters):
+        """ Assert that search finds what scan finds, ordered by time """
+        hits = self.index.search(query, **filters)
+        self.assertEqual(set([(hit.source, hit.ordinal) for hit in hits]),
+                         self.scan(query, **filters))
+        times = [hit.time for hit in hits]
+        self.assertEqual(times, sorted(times))
+        for hit in hits:
+            conversation = self.conversations[hit.source]
+            message = conversation.messages[hit.ordinal]
+            self.assertEqual(hit.time, message.time)
+            self.assertEqual(hit.sender, getattr(message, 'sender', None))
+            self.assertEqual(hit.output, hit.source + '.out')
+            self.assertEqual(hit.contact, conversation.contact())
+        return hits
+
+    def queries(self):
+        """ Return some one- and two-word queries that have hits """
+        result = []
+        for conversation in self.conversations.values()[:4]:
+            words = tokenize(conversation.messages[1].text)
+            result.append(words[0].upper())
+            if len(words) > 1:
+                result.append(u"%s %s" % (words[-1], words[0]))
+        return result
+
+    def test_search(self):
+        """ Searches find exactly the matching messages """
+        for query in self.queries():
+            self.assertTrue(len(self.check(query)) > 0)
+        self.assertEqual(self.check(u'xyzzy'), [])
+        self.assertEqual(self.check(u'  '), [])
+
+    def test_filters(self):
+        """ Searches are restricted by sender, account, contact and time """
+        conversation = self.conversations.values()[0]
+        times = sorted([message.time for conversation
+                        in self.conversations.values()
+                        for message in conversation.messages])
+        for query in self.queries():
+            self.check(query, sender=conversation.account)
+            self.check(query, account=conversation.account)
+            self.check(query, contact=conversation.contact())
+            self.check(query, start=times[len(times) / 3],
+                       end=times[2 * len(times) / 3])
+        query = self.queries()[0]
+        self.assertEqual(len(self.index.search(query, limit=2)),
+                         min(2, len(self.scan(query))))
+
+    def test_remove(self):
+        """ Replaced and removed conversations are no longer found """
+        sources = sorted(self.conversations.keys())
+        for source in sources:
+            if source != sources[1]:
+                open(source, 'w').close()
+        self.conversations[sources[0]] = self.conversations[sources[3]]
+        self.index.add(self.conversations[sources[0]], sources[0],
+                       sources[0] + '.out')
+        self.index.remove(sources[2])
+        del self.conversations[sources[2]]
+        self.assertEqual(self.index.remove_missing(), [sources[1]])
+        del self.conversations[sources[1]]
+        for query in self.queries():
+            self.check(query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Manifest
+"""
+from IMLogConvert.BatchConverter import BatchConverter
+from IMLogConvert.Manifest import Manifest
+from support import TemporaryDirectoryTestCase, sample_conversation
+import unittest
+import os
+
+
+class ManifestTest(TemporaryDirectoryTestCase):
+    """ Tests for Manifest """
+    def setUp(self):
+        """ Create the directory, a source file and a manifest """
+        TemporaryDirectoryTestCase.setUp(self)
+        self.source = self.path('source.txt')
+        self._write_source('hello')
+        self.output = self.path('output.xml')
+        open(self.output, 'w').close()
+
+    def _write_source(self, data, mtime=1000000000):
+        """ Write data to the source file, with the given mtime """
+        fh = open(self.source, 'w')
+        fh.write(data)
+        fh.close()
+        os.utime(self.source, (mtime, mtime))
+
+    def _manifest(self, use_hash=False):
+        """ Open the manifest in the temporary directory """
+        return Manifest(self.path('manifest.sqlite'), use_hash)
+
+    def test_unchanged_source_is_skipped(self):
+        """ A recorded source is only changed if it is modified """
+        manifest = self._manifest()
+        self.assertTrue(manifest.changed(self.source))
+        manifest.record(self.source, self.output)
+        manifest.close()
+        manifest = self._manifest()
+        self.assertFalse(manifest.changed(self.source))
+        self.assertEqual(manifest.output(self.source), self.output)
+        self.assertEqual(manifest.source(self.output), self.source)
+        self._write_source('hello', 1000000001)
+        self.assertTrue(manifest.changed(self.source))
+        manifest.close()
+
+    def test_touched_source_is_rehashed(self):
+        """ With use_hash, a source whose mtime changed but whose content
+            did not is not changed, and its new mtime is recorded
+        """
+        manifest = self._manifest(use_hash=True)
+        manifest.changed(self.source)
+        manifest.record(self.source, self.output)
+        self._write_source('hello', 1000000001)
+        self.assertFalse(manifest.changed(self.source))
+        self.assertFalse(manifest.changed(self.source))
+        self._write_source('world', 1000000002)
+        self.assertTrue(manifest.changed(self.source))
+        manifest.close()
+
+    def test_missing_source(self):
+        """ A source that does not exist is changed, and its output is
+            deleted by remove_missing
+        """
+        manifest = self._manifest(use_hash=True)
+        manifest.record(self.source, self.output)
+        os.remove(self.source)
+        self.assertTrue(manifest.changed(self.source))
+        self.assertEqual(manifest.remove_missing(), [self.output])
+        self.assertFalse(os.path.exists(self.output))
+        manifest.close()
+
+    def test_update_reports_missing_files(self):
+        """ BatchConverter.update reports files that do not exist as errors
+        """
+        sample_conversation().to_xml(self.path('log.xml'))
+        output_dir = self.path('out')
+        os.mkdir(output_dir)
+        converter = BatchConverter(output_dir=output_dir, processes=1)
+        missing = self.path('missing.xml')
+        result = converter.update([self.path('log.xml'), missing])
+        self.assertEqual(len(result.converted), 1)
+        self.assertEqual([filename for (filename, error) in result.errors],
+                         [missing])
+        result = converter.update([self.path('log.xml')])
+        self.assertEqual((result.converted, result.skipped),
+                         ([], [self.path('log.xml')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Merge
+"""
+from IMLogConvert.Conversation import Conversation, Message
+from IMLogConvert.Merge import Merger, merge_conversations, merge_files
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple, message_tuples
+from copy import copy as shallow_copy
+import unittest
+
+
+def _shifted_copy(conversation, first, shift):
+    """ Return a copy of the conversation with the messages from index
+        'first' on, with their times shifted by 'shift' seconds, and the
+        texts with different whitespace and case (as logged by another
+        client)
+    """
+    messages = conversation.messages[first:]
+    result = Conversation(conversation.service, conversation.account,
+                          messages[0].time + shift, conversation.timezone)
+    result.participants = dict(conversation.participants)
+    for message in messages:
+        copy = shallow_copy(message)
+        copy.time += shift
+        copy.text = u'  %s ' % copy.text.upper()
+        result.messages.append(copy)
+    return result
+
+
+class MergerTest(TemporaryDirectoryTestCase):
+    """ Tests for Merger """
+    def test_duplicates_are_dropped(self):
+        """ Messages logged by two clients appear only once """
+        conversation = sample_conversation()
+        copy = _shifted_copy(conversation, 5, 1.0)
+        merger = Merger(tolerance=2.0)
+        merger.add(conversation)
+        merger.add(copy)
+        merged = list(merger.merge())
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(message_tuples(merged[0]),
+                         message_tuples(conversation))
+        self.assertEqual(merger.duplicates, len(copy.messages))
+
+    def test_messages_outside_tolerance_are_kept(self):
+        """ Messages further apart than the tolerance are not duplicates """
+        conversation = sample_conversation()
+        copy = _shifted_copy(conversation, 5, 5.0)
+        merged = list(merge_conversations([conversation, copy], 2.0))
+        self.assertEqual(len(merged), 1)
+        self.assertEqual(len(merged[0].messages),
+                         len(conversation.messages) + len(copy.messages))
+
+    def test_repeated_messages_of_one_source_are_kept(self):
+        """ The same message sent twice in one log is not a duplicate """
+        conversation = sample_conversation()
+        conversation.messages.insert(1, Message(
+                     conversation.messages[0].time, u'me',
+                     conversation.messages[0].text))
+        other = _shifted_copy(conversation, 10, 0.0)
+        merged = list(merge_conversations([conversation, other]))
+        self.assertEqual(message_tuples(merged[0]),
+                         message_tuples(conversation))
+
+    def test_separate_conversations(self):
+        """ Conversations that do not overlap, or are with different
+            contacts, are not merged
+        """
+        first = sample_conversation()
+        later = sample_conversation(first.messages[-1].time + 3600)
+        other_contact = sample_conversation(contact=u'alice')
+        merged = list(merge_conversations([later, other_contact, first]))
+        self.assertEqual([conversation_tuple(conversation)
+                          for conversation in merged],
+                         [conversation_tuple(conversation) for conversation
+                          in (other_contact, first, later)])
+
+    def test_merge_files(self):
+        """ Merging log files gives the same result as merging the
+            conversations in memory
+        """
+        conversation = sample_conversation()
+        conversations = [conversation, _shifted_copy(conversation, 5, 1.0),
+                         sample_conversation(1300000000.0)]
+        filenames = []
+        for (index, conversation) in enumerate(conversations):
+            filename = self.path('%i.xml' % index)
+            conversation.to_xml(filename)
+            filenames.append(filename)
+        expected = [conversation_tuple(conversation) for conversation
+                    in merge_conversations(conversations)]
+        self.assertEqual([conversation_tuple(conversation) for conversation
+                          in merge_files(filenames)], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
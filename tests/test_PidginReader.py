@@ -0,0 +1,93 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.PidginReader
+"""
+from IMLogConvert.PidginReader import PidginTextReader
+from support import data_dir, data_file, load_data, conversation_data
+import unittest
+import glob
+import os
+
+
+def _read(read, filename):
+    """ Return the conversation read from filename with the function read,
+        in the form of the expected results (see support.load_data)
+    """
+    try:
+        conversation = read(filename)
+    except Exception, data:
+        return {'error': data.__class__.__name__}
+    if conversation is None:
+        return None
+    return conversation_data(conversation)
+
+
+class PidginTextReaderTest(unittest.TestCase):
+    """ Tests for PidginTextReader, against the results of the original
+        reader
+    """
+    def setUp(self):
+        """ Find the test logs """
+        self.filenames = sorted(glob.glob(os.path.join(data_dir, 'pidgin',
+                                                       '*.txt')))
+        self.assertTrue(len(self.filenames) > 0)
+
+    def test_read(self):
+        """ The codecs backend gives the original results """
+        reader = PidginTextReader(['Me Myself', 'Me'])
+        for filename in self.filenames:
+            self.assertEqual(_read(reader.read, filename),
+                             load_data(filename[:-4] + '.json'), filename)
+
+    def test_read_mmap(self):
+        """ The mmap backend gives the original results, or declines the
+            log
+        """
+        reader = PidginTextReader(['Me Myself', 'Me'])
+        declined = []
+        for filename in self.filenames:
+            result = _read(reader.read_mmap, filename)
+            if result is None:
+                declined.append(os.path.basename(filename))
+            else:
+                self.assertEqual(result, load_data(filename[:-4] + '.json'),
+                                 filename)
+        self.assertEqual(declined, ['unicode_linebreak.txt'])
+        reader.use_mmap = True
+        for filename in self.filenames:
+            self.assertEqual(_read(reader.read, filename),
+                             load_data(filename[:-4] + '.json'), filename)
+
+    def test_stream(self):
+        """ A log can be read from an open stream """
+        reader = PidginTextReader(['Me Myself', 'Me'])
+        filename = data_file(os.path.join('pidgin', 'ampm_midnight.txt'))
+        fh = open(filename, 'rb')
+        try:
+            self.assertEqual(_read(reader.read, fh),
+                             load_data(filename[:-4] + '.json'))
+        finally:
+            fh.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
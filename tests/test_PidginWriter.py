@@ -0,0 +1,115 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.PidginWriter
+"""
+from IMLogConvert.PidginWriter import PidginDirectoryWriter, escape_filename
+from IMLogConvert.PidginWriter import PidginTextWriter
+from support import sample_conversation, written_data
+from support import TemporaryDirectoryTestCase
+from cStringIO import StringIO
+import IMLogConvert.Compression
+import IMLogConvert.Time
+import unittest
+import os
+
+
+class PidginTextWriterTest(TemporaryDirectoryTestCase):
+    """ Tests for PidginTextWriter """
+    def test_same_as_original(self):
+        """ The logs are byte for byte the same as those of the original
+            writer, however they are written
+        """
+        # written by the original PidginTextWriter.write
+        cases = written_data('pidgin_out')
+        self.assertTrue(len(cases) > 10)
+        for (conversation, expected) in cases:
+            for buffer_lines in (1, 3, 4096):
+                writer = PidginTextWriter()
+                writer.buffer_lines = buffer_lines
+                stream = StringIO()
+                self.assertEqual(writer.write_stream(conversation, stream),
+                                 len(expected))
+                self.assertEqual(stream.getvalue(), expected)
+            for (name, seek_stride) in [('log.txt', None), ('log.txt', 4),
+                                        ('log.txt.gz', None)]:
+                writer = PidginTextWriter()
+                writer.seek_stride = seek_stride
+                writer.write(conversation, self.path(name))
+                fh = IMLogConvert.Compression.open_input(self.path(name))
+                self.assertEqual(fh.read(), expected)
+                fh.close()
+
+    def test_time_of_day_cache(self):
+        """ The cache of formatted times is not used for a message time
+            format that shows more than the time of day
+        """
+        conversation = sample_conversation()
+        conversation.messages[5].time += 86400
+        writer = PidginTextWriter()
+        writer.write_stream(conversation, StringIO())
+        writer.message_time_codec = IMLogConvert.Time.get_codec(
+                                    '%Y-%m-%d %H:%M:%S')
+        stream = StringIO()
+        writer.write_stream(conversation, stream)
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines[6].startswith('(2008-01-11 '))
+        self.assertTrue(lines[7].startswith('(2008-01-10 '))
+
+
+class EscapeFilenameTest(unittest.TestCase):
+    """ Tests for escape_filename """
+    def test_libpurple_names(self):
+        """ Names are escaped as by purple_escape_filename """
+        # directory names in the log directories written by libpurple
+        for (name, expected) in [
+            (u'jabber', 'jabber'),
+            (u'john.doe@gmail.com', 'john.doe@gmail.com'),
+            (u'john.doe@gmail.com/Home', 'john.doe@gmail.com%2fHome'),
+            (u'#pidgin@irc.freenode.net', '#pidgin@irc.freenode.net'),
+            (u'user_name-1', 'user_name-1'),
+            (u'john doe', 'john%20doe'),
+            (u'a+b', 'a%2bb'),
+            (u'100%', '100%25'),
+            (u'j\xf6rg', 'j%c3%b6rg'),
+            (u'\u2603', '%e2%98%83'),
+            ('j\xc3\xb6rg', 'j%c3%b6rg')]:
+            self.assertEqual(escape_filename(name), expected)
+
+
+class PidginDirectoryWriterTest(unittest.TestCase):
+    """ Tests for PidginDirectoryWriter """
+    def test_path(self):
+        """ Logs are placed in protocol/account/contact directories, and
+            names used twice get a suffix
+        """
+        writer = PidginDirectoryWriter('logs')
+        conversation = sample_conversation(contact=u'J\xf6rg Doe')
+        path = writer.path(conversation)
+        self.assertEqual(path, os.path.join('icq', 'me', 'j%c3%b6rg%20doe',
+                                            '2008-01-10.222000+0100.txt'))
+        writer._filenames.add(path)
+        self.assertEqual(writer.path(conversation),
+                         path[:-len('.txt')] + '-1.txt')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.SeekIndex, and the windowed reads that use it
+"""
+from IMLogConvert.Conversation import Conversation, Message
+from IMLogConvert.PidginReader import PidginTextReader
+from IMLogConvert.PidginWriter import PidginTextWriter
+import IMLogConvert.SeekIndex
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple, message_tuples
+import unittest
+import os
+
+# windows (start, end) of the sample conversation (which has messages every
+# 10 seconds from 1200000000 to 1200000190), some of them between the indexed
+# messages
+_windows = [(None, None), (None, 1200000055), (1200000055, None),
+            (1200000040, 1200000120), (1200000041, 1200000049),
+            (1200000100, 1200000100), (1100000000, 1100000010),
+            (1300000000, None)]
+
+
+class SeekIndexTest(TemporaryDirectoryTestCase):
+    """ Tests for SeekIndex, and windowed reads of XML and Pidgin logs """
+    def test_byte_range(self):
+        """ The byte range of a window contains all its messages """
+        index = IMLogConvert.SeekIndex.SeekIndex(2)
+        index.header_end = 10
+        index.body_end = 100
+        for (time, offset) in [(1, 10), (3, 30), (5, 50), (7, 70)]:
+            index.add(time, offset)
+        self.assertEqual(index.byte_range(), (10, 100))
+        self.assertEqual(index.byte_range(3, 5), (10, 50))
+        self.assertEqual(index.byte_range(4, 6), (30, 70))
+        self.assertEqual(index.byte_range(8, None), (70, 100))
+        self.assertEqual(index.byte_range(None, 0), (10, 10))
+
+    def test_stale_index_is_ignored(self):
+        """ The index of a file that was changed afterwards is not loaded """
+        filename = self.path('log.xml')
+        sample_conversation().write_xml(filename, seek_stride=3)
+        self.assertNotEqual(IMLogConvert.SeekIndex.load(filename), None)
+        fh = open(filename, 'a')
+        fh.write('\n')
+        fh.close()
+        self.assertEqual(IMLogConvert.SeekIndex.load(filename), None)
+
+    def test_to_xml_writes_same_file(self):
+        """ A file written with a seek index has the same content """
+        conversation = sample_conversation()
+        filename = self.path('log.xml')
+        self.assertEqual(conversation.to_xml(filename, seek_stride=3), None)
+        self.assertEqual(open(filename, 'rb').read(), conversation.to_xml())
+        self.assertTrue(os.path.exists(
+                        IMLogConvert.SeekIndex.seek_filename(filename)))
+
+    def test_xml_window(self):
+        """ A windowed read of an XML log gives the header of a full read,
+            and the messages in the window
+        """
+        conversation = sample_conversation()
+        filename = self.path('log.xml')
+        conversation.write_xml(filename, seek_stride=3)
+        for window in _windows:
+            result = Conversation()
+            result.from_xml(filename, window=window)
+            expected = Conversation()
+            expected.from_xml(filename)
+            expected.messages = IMLogConvert.SeekIndex.in_window(
+                                expected.messages, window)
+            self.assertEqual(conversation_tuple(result),
+                             conversation_tuple(expected))
+
+    def test_pidgin_window(self):
+        """ A windowed read of a Pidgin log gives the service, account,
+            start time and time zone of a full read, and the messages in the
+            window
+        """
+        conversation = sample_conversation()
+        # the first message is before the time in the header, which moves
+        # the start time in a full read
+        conversation.start_time += 8
+        conversation.messages.append(Message(conversation.start_time + 500,
+                                     u'bob', u'line 1\nline 2'))
+        filename = self.path('log.txt')
+        writer = PidginTextWriter()
+        writer.seek_stride = 3
+        writer.write(conversation, filename)
+        reader = PidginTextReader([u'Me Myself'])
+        full = reader.read(filename)
+        self.assertEqual(full.start_time, conversation.messages[0].time)
+        for window in _windows + [(1200000500, None)]:
+            result = reader.read(filename, window)
+            self.assertEqual(conversation_tuple(result)[:4],
+                             conversation_tuple(full)[:4])
+            expected = Conversation()
+            expected.messages = IMLogConvert.SeekIndex.in_window(
+                                full.messages, window)
+            self.assertEqual(message_tuples(result),
+                             message_tuples(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
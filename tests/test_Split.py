@@ -0,0 +1,117 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Split
+"""
+from IMLogConvert.Split import split_days
+from IMLogConvert.Conversation import Conversation, Message, StatusMessage
+from IMLogConvert.CommandLine import read_days
+from support import TemporaryDirectoryTestCase, sample_conversation
+from support import conversation_tuple, message_tuples
+import unittest
+import calendar
+
+
+def _local(day, hour, minute=0):
+    """ Return the epoch seconds of the given day of January 2009 and time
+        of day in the time zone -0530
+    """
+    return float(calendar.timegm((2009, 1, day, hour, minute, 0, 0, 0, 0))
+                 + 5 * 3600 + 30 * 60)
+
+
+class SplitDaysTest(TemporaryDirectoryTestCase):
+    """ Tests for split_days """
+    def setUp(self):
+        """ Create a conversation over three local days, with a gap of a day
+            and a third participant on the second day
+        """
+        TemporaryDirectoryTestCase.setUp(self)
+        conversation = Conversation(u'jabber', u'me', _local(1, 22), '-0530')
+        conversation.participants[u'me'] = u'Me'
+        conversation.participants[u'bob'] = u'Bob'
+        conversation.participants[u'carol'] = u'Carol'
+        for (time, sender, text) in [
+                (_local(1, 22, 5), u'me', u'hi'),
+                (_local(1, 23, 59), u'bob', u'almost midnight'),
+                (_local(2, 0, 0), u'carol', u'midnight'),
+                (_local(2, 8), None, u'Bob has gone away.'),
+                (_local(4, 12), u'bob', u'two days later')]:
+            if sender is None:
+                conversation.messages.append(StatusMessage(time, text))
+            else:
+                conversation.messages.append(Message(time, sender, text))
+        self.conversation = conversation
+
+    def test_days(self):
+        """ The messages are split at local midnight, with the start times
+            and participants of every day
+        """
+        days = list(split_days(self.conversation))
+        self.assertEqual([len(day.messages) for day in days], [2, 2, 1])
+        self.assertEqual(sum([message_tuples(day) for day in days], []),
+                         message_tuples(self.conversation))
+        self.assertEqual([day.start_time for day in days],
+                         [_local(1, 22), _local(2, 0), _local(4, 12)])
+        # the contact is found in the order of the participants dictionary
+        contact = self.conversation.contact()
+        senders = [[u'me', u'bob'], [u'carol'], [u'bob']]
+        for (day, day_senders) in zip(days, senders):
+            participants = self.conversation.participants
+            self.assertEqual(sorted(day.participants.items()),
+                             sorted([(name, participants[name]) for name
+                                     in set([u'me', contact] + day_senders)]))
+            self.assertEqual((day.service, day.account, day.timezone),
+                             (u'jabber', u'me', '-0530'))
+
+    def test_start_on_earlier_day(self):
+        """ If the conversation started on an earlier day than its first
+            message, the first day starts with the message
+        """
+        self.conversation.start_time = _local(1, 22) - 86400
+        days = list(split_days(self.conversation))
+        self.assertEqual(days[0].start_time, _local(1, 22, 5))
+
+    def test_empty(self):
+        """ A conversation without messages is a single empty day """
+        del self.conversation.messages[:]
+        days = list(split_days(self.conversation))
+        self.assertEqual(len(days), 1)
+        self.assertEqual(days[0].start_time, self.conversation.start_time)
+        self.assertEqual(days[0].messages, [])
+
+    def test_stream(self):
+        """ Splitting the messages streamed from a native XML file gives the
+            same days as splitting the conversation read with from_xml
+        """
+        filename = self.path('log.xml')
+        for conversation in (self.conversation, sample_conversation()):
+            conversation.write_xml(filename)
+            expected = Conversation()
+            expected.from_xml(filename)
+            self.assertEqual(
+                [conversation_tuple(day) for day in read_days(None,
+                                                              filename)],
+                [conversation_tuple(day) for day in split_days(expected)])
+
+
+if __name__ == '__main__':
+    unittest.main()
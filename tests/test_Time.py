@@ -0,0 +1,116 @@
+############################################################################
+#    Copyright (C) 2009 by Michael Goerz                                   #
+#    http://www.physik.fu-berlin.de/~goerz                                 #
+#                                                                          #
+#    This program is free software; you can redistribute it and/or modify  #
+#    it under the terms of the GNU General Public License as published by  #
+#    the Free Software Foundation; either version 3 of the License, or     #
+#    (at your option) any later version.                                   #
+#                                                                          #
+#    This program is distributed in the hope that it will be useful,       #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of        #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         #
+#    GNU General Public License for more details.                          #
+#                                                                          #
+#    You should have received a copy of the GNU General Public License     #
+#    along with this program; if not, write to the                         #
+#    Free Software Foundation, Inc.,                                       #
+#    59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.             #
+############################################################################
+
+"""
+Tests for IMLogConvert.Time
+"""
+import IMLogConvert.Time
+import unittest
+import calendar
+import random
+import time
+import os
+
+# formats used by the readers and writers, and two that are handled by
+# time.strptime/time.strftime
+_formats = ['%a %d %b %Y %H:%M:%S', '%a %d %b %Y %I:%M:%S %p',
+            '%d %b %Y %H:%M:%S', '%d %b %Y %I:%M:%S %p', '%Y-%m-%d %H:%M:%S',
+            '%d.%m.%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p', '%I:%M:%S %p',
+            '%H:%M:%S', '%Y-%m-%dT%H.%M.%S', '%Y-%m-%d.%H%M%S', '%Y-%m-%d',
+            '%y%m%d %H%M%S', '%Y %j %H:%M:%S']
+
+_offsets = ['+0000', '+0100', '-0530', '+1245', 'EST', '']
+
+def _times(count):
+    """ Return 'count' random epoch seconds, and some special ones """
+    rand = random.Random(1)
+    return [0, 86399, 86400, 951782400, 951868799, 1230768000, 1200000000] \
+           + [rand.randint(0, 2000000000) for i in xrange(count)]
+
+
+class TimeCodecTest(unittest.TestCase):
+    """ Tests for TimeCodec, against time.strptime and time.strftime """
+    def test_generic(self):
+        """ Only formats with unsupported directives are generic """
+        for format in _formats:
+            self.assertEqual(IMLogConvert.Time.get_codec(format).generic,
+                             format in ('%y%m%d %H%M%S', '%Y %j %H:%M:%S'))
+
+    def test_format(self):
+        """ Times are formatted like with time.strftime """
+        for format in _formats:
+            codec = IMLogConvert.Time.get_codec(format)
+            for offset in _offsets:
+                offset_sec = IMLogConvert.Time.resolve_offset(offset)[1]
+                for epoch_seconds in _times(200):
+                    self.assertEqual(
+                        codec.format(epoch_seconds, offset, False),
+                        time.strftime(format,
+                                      time.gmtime(epoch_seconds + offset_sec)))
+
+    def test_parse(self):
+        """ Times are parsed like with time.strptime """
+        for format in _formats:
+            codec = IMLogConvert.Time.get_codec(format)
+            for offset in _offsets:
+                offset_sec = IMLogConvert.Time.resolve_offset(offset)[1]
+                for epoch_seconds in _times(200):
+                    time_str = time.strftime(format,
+                               time.gmtime(epoch_seconds + offset_sec))
+                    self.assertEqual(codec.parse(time_str, offset),
+                        calendar.timegm(time.strptime(time_str, format))
+                        - offset_sec)
+
+    def test_parse_variants(self):
+        """ Times without leading zeros, in other cases and with other
+            white space are accepted like by time.strptime
+        """
+        codec = IMLogConvert.Time.get_codec('%d %b %Y %I:%M:%S %p')
+        for time_str in ['3 Apr 2008 1:02:03 am', '03 APR 2008  01:02:03 PM',
+                         '12 apr 2008 12:00:00 AM']:
+            self.assertEqual(codec.parse(time_str, '+0000'), calendar.timegm(
+                time.strptime(time_str, '%d %b %Y %I:%M:%S %p')))
+        self.assertRaises(ValueError, codec.parse, '31 Apr 2008 1:02:03 AM',
+                          '+0000')
+        self.assertRaises(ValueError, codec.parse, '3 Apr 2008 1:02:03',
+                          '+0000')
+
+    def test_local_time_zone(self):
+        """ The result does not depend on the local time zone, also for
+            generic formats and times in daylight saving time
+        """
+        old_tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Europe/Berlin'
+        time.tzset()
+        try:
+            for format in ('%Y-%m-%d %H:%M:%S', '%y%m%d %H%M%S'):
+                codec = IMLogConvert.Time.get_codec(format)
+                self.assertEqual(codec.parse(codec.format(1215000000,
+                                 '-0500', False), '-0500'), 1215000000)
+        finally:
+            if old_tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = old_tz
+            time.tzset()
+
+
+if __name__ == '__main__':
+    unittest.main()